@@ -1,7 +1,8 @@
+import json
 import logging
 import os
 import time
-from typing import Dict
+from typing import Dict, Optional
 
 # Import shared configuration
 import sys
@@ -9,17 +10,24 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config import GEMINI_API, ENVIRONMENT
 
+from google.adk.agents.callback_context import CallbackContext
 from google.adk.agents.llm_agent import Agent
-from google.adk.models import Gemini
+from google.adk.models import Gemini, LlmRequest, LlmResponse
 from google.adk.tools import BaseTool, ToolContext
 
-from tools.tools import predict_warranty_cost, predict_warranty_total_cost
+from tools.cassette import current_recorder
+from tools.structured_logging import setup_logging
+from tools.llm_cache import get_response_cache, make_key
+from tools.tools import explain_warranty_risk, predict_warranty_batch, predict_warranty_cost, predict_warranty_total_cost
 
-logging.basicConfig(level=logging.INFO)
+# JSON logs (text locally) written from a background thread, tagged with the chat turn's request id
+setup_logging()
 log = logging.getLogger(__name__)
 
-# Track the last tool call to prevent agent loops (not user re-queries)
-_last_tool_call = {"name": None, "vin": None, "timestamp": 0}
+# Track recent tool calls per agent invocation to prevent agent loops.
+# Keyed by invocation so a user asking about the same VIN again (a new turn),
+# or another session asking concurrently, is never blocked.
+_recent_tool_calls = {}  # (invocation_id, tool name, vin) -> timestamp
 
 # Configure Gemini API
 if not GEMINI_API["api_key"]:
@@ -28,17 +36,14 @@ if not GEMINI_API["api_key"]:
     log.error("Then set it: export GEMINI_API_KEY='your-key-here'")
     raise ValueError("GEMINI_API_KEY not configured")
 
-log.info(f"Successfully configured Gemini in {ENVIRONMENT} environment")
-log.info(f"Using model: {GEMINI_API['model']}")
+log.info("Successfully configured Gemini in %s environment", ENVIRONMENT)
+log.info("Using model: %s", GEMINI_API["model"])
 
 # Configure the Gemini model using ADK's native Gemini support
 model = Gemini(
     model_name=GEMINI_API["model"],  # models/gemini-1.5-flash-latest
     api_key=GEMINI_API["api_key"],
-    generation_config={
-        "temperature": 0.1,  # Lower temperature for more focused responses
-        "max_output_tokens": 512,  # Limit response length to reduce token usage
-    }
+    generation_config=GEMINI_API["generation_config"],  # temperature 0.1, max 512 output tokens
 )
 
 
@@ -46,25 +51,107 @@ model = Gemini(
 # This is useful for logging, debugging, or validation
 def tool_call(tool: BaseTool, args: Dict[str,any], tool_context: ToolContext):
     """Called automatically before the agent executes any tool"""
-    print(f"Agent is calling tool: {tool.name} with args: {args}")
+    log.info("Agent is calling tool %s", tool.name, extra={"tool": tool.name, "tool_args": args})
     
-    # Prevent agent loops (consecutive duplicate calls within 3 seconds)
-    if tool.name == "predict_warranty_cost":
+    # Prevent agent loops (duplicate calls for the same VIN within one agent turn)
+    if tool.name in ("predict_warranty_cost", "predict_warranty_total_cost", "explain_warranty_risk"):
         vin = args.get('vin', '').strip().upper()
         current_time = time.time()
-        
-        # Check if this is the same call within 3 seconds (agent looping)
-        time_since_last_call = current_time - _last_tool_call["timestamp"]
-        if (_last_tool_call["name"] == tool.name and 
-            _last_tool_call["vin"] == vin and 
-            time_since_last_call < 3):
-            raise RuntimeError(f"STOP: Just called predict_warranty_cost for VIN {vin} {time_since_last_call:.1f}s ago. Do not call again. Present the previous results.")
-        
-        # Update the last call tracker
-        _last_tool_call["name"] = tool.name
-        _last_tool_call["vin"] = vin
-        _last_tool_call["timestamp"] = current_time
-        print(f"Allowing call for VIN {vin}")
+
+        # Forget calls from finished turns
+        for key, timestamp in list(_recent_tool_calls.items()):
+            if current_time - timestamp > 60:
+                _recent_tool_calls.pop(key, None)
+
+        key = (tool_context.invocation_id, tool.name, vin)
+        if key in _recent_tool_calls:
+            time_since_last_call = current_time - _recent_tool_calls[key]
+            # Returning a result skips the tool without aborting the rest of the turn
+            return {"status": "error", "vin": vin, "error_message": f"STOP: Just called {tool.name} for VIN {vin} {time_since_last_call:.1f}s ago. Do not call again. Present the previous results."}
+
+        _recent_tool_calls[key] = current_time
+        log.debug("Allowing call", extra={"tool": tool.name, "vin": vin})
+
+
+# Gemini response cache for agent turns: identical requests (same history,
+# instruction, tools and config) are answered without calling the model.
+_pending_cache_keys = {}  # invocation_id -> (key, start time) of the in-flight model call
+_PENDING_MAX_AGE = 600  # seconds; entries of calls that ended without either callback are dropped
+
+
+def _request_cache_key(llm_request: LlmRequest) -> str:
+    contents = [c.model_dump(mode="json", exclude_none=True) for c in llm_request.contents]
+    for content in contents:
+        for part in content.get("parts", []):
+            # Function call ids are random per session and never affect the answer
+            for field in ("function_call", "function_response"):
+                if field in part:
+                    part[field].pop("id", None)
+            if "function_response" in part:
+                # Whether (or when) a prediction was scored by our own cache doesn't change the answer either
+                response = part["function_response"].get("response", {})
+                response.pop("cached", None)
+                response.pop("scored_at", None)
+    config = llm_request.config
+    system_instruction = str(config.system_instruction) if config and config.system_instruction else ""
+    tool_names = sorted(llm_request.tools_dict or {})
+    return make_key(
+        llm_request.model or GEMINI_API["model"],
+        system_instruction,
+        json.dumps(contents, sort_keys=True),
+        {**GEMINI_API["generation_config"], "tools": tool_names},
+    )
+
+
+def llm_cache_lookup(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """Runs BEFORE each model call: return a cached response to skip Gemini entirely."""
+    cache = get_response_cache()
+    recorder = current_recorder()
+    if cache is None and recorder is None:
+        return None
+    key = _request_cache_key(llm_request)
+    if recorder is not None:
+        recorder.llm_started(callback_context.invocation_id, key, llm_request.model)
+    if cache is None:
+        return None
+    cached = cache.get(key)
+    if cached is not None:
+        log.info("Answering model call from the LLM response cache")
+        response = LlmResponse.model_validate_json(cached)
+        if recorder is not None:
+            recorder.llm_finished(callback_context.invocation_id, response, source="cache")
+        return response
+    # Forget calls that never reached llm_cache_store / llm_cache_error (e.g. cancelled turns)
+    now = time.time()
+    for invocation_id, (_, started) in list(_pending_cache_keys.items()):
+        if now - started > _PENDING_MAX_AGE:
+            _pending_cache_keys.pop(invocation_id, None)
+    _pending_cache_keys[callback_context.invocation_id] = (key, now)
+    return None
+
+
+def llm_cache_store(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    """Runs AFTER each model call: remember complete, successful responses."""
+    recorder = current_recorder()
+    if recorder is not None:
+        recorder.llm_finished(callback_context.invocation_id, llm_response, source="model")
+    key, _ = _pending_cache_keys.pop(callback_context.invocation_id, (None, None))
+    cache = get_response_cache()
+    if key is None or cache is None or llm_response.partial or llm_response.error_code or not llm_response.content:
+        return None
+    stored = llm_response.model_copy(deep=True)
+    stored.usage_metadata = None  # a cache hit costs no tokens
+    for part in stored.content.parts or []:
+        if part.function_call:
+            part.function_call.id = None
+    cache.put(key, stored.model_dump_json(exclude_none=True))
+    return None
+
+
+def llm_cache_error(callback_context: CallbackContext, llm_request: LlmRequest, error: Exception) -> Optional[LlmResponse]:
+    """Runs when a model call fails (e.g. 429): nothing to cache, drop the pending key."""
+    _pending_cache_keys.pop(callback_context.invocation_id, None)
+    return None  # let the error propagate (the chat page retries rate limits)
 
 
 # Create the root agent - this is the main AI agent
@@ -77,19 +164,28 @@ root_agent = Agent(
 TOOLS:
 • predict_warranty_cost(vin) - Get warranty claim probability for a VIN
 • predict_warranty_total_cost(vin) - Get estimated warranty cost for a VIN
+• predict_warranty_batch(vins) - Get probability and cost for SEVERAL VINs in one call
+• explain_warranty_risk(vin) - Explain WHY a VIN has its risk (feature contributions)
+All return a compact JSON record (probability/label/risk_tier or cost_usd, plus model_version and scored_at).
 
 RULES:
-1. Extract VIN from user query
-2. Call appropriate tool(s) ONCE per VIN
-3. Present results clearly to user
+1. Extract VIN(s) from user query
+2. Call appropriate tool(s) ONCE per VIN; for two or more VINs call predict_warranty_batch ONCE with all of them
+3. The UI renders tool records as formatted cards - do NOT restate every field
 4. DO NOT retry on errors - report them directly
-5. After receiving tool results, format and present them immediately
+5. After receiving tool results, answer in one or two sentences (e.g. the risk tier and cost)
 
 Be concise and direct.''',  # How to behave
     before_tool_callback=[tool_call],  # Functions to run before each tool call
+    before_model_callback=[llm_cache_lookup],  # Serve repeated model calls from the response cache
+    after_model_callback=[llm_cache_store],
+    on_model_error_callback=[llm_cache_error],
     tools=[
         # Warranty prediction ML model
         predict_warranty_cost,
-        predict_warranty_total_cost
+        predict_warranty_total_cost,
+        predict_warranty_batch,
+        # Local feature attribution from cached model weights
+        explain_warranty_risk,
     ]
 )
@@ -21,6 +21,18 @@ PROXIES = {
 GEMINI_API = {
     "model": "models/gemini-1.5-flash-latest",  # Explicitly use 1.5-flash (higher quota than 2.5)
     "api_key": os.getenv("GEMINI_API_KEY"),  # Set this in your environment
+    "generation_config": {
+        "temperature": 0.1,  # Lower temperature for more focused (and cacheable) responses
+        "max_output_tokens": 512,  # Limit response length to reduce token usage
+    },
+}
+
+# Gemini response cache (llm_service.call_llm and agent turns)
+LLM_CACHE = {
+    "enabled": os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true",
+    "path": os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3"),
+    "ttl_seconds": int(os.getenv("LLM_CACHE_TTL", "86400")),
+    "max_entries": int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
 }
 
 # BigQuery Configuration
@@ -28,6 +40,159 @@ GEMINI_API = {
 # Free BigQuery sandbox: https://cloud.google.com/bigquery/docs/sandbox
 BIGQUERY = {
     "project": os.getenv("GCP_PROJECT_ID", "warranty-prediction-demo"),
+    # "bigquery" (default) or "duckdb" - local emulation with the synthetic data, no GCP needed
+    "backend": os.getenv("BIGQUERY_BACKEND", "bigquery"),
+    "duckdb_path": os.getenv("DUCKDB_PATH", ":memory:"),
+    # Tail latency controls
+    "fast_path": os.getenv("BIGQUERY_FAST_PATH", "true").lower() == "true",  # job-less short queries
+    "hedging": os.getenv("BIGQUERY_HEDGING", "true").lower() == "true",
+    "hedge_percentile": 95,  # send a duplicate once a query is slower than this recent percentile
+    "timeout_seconds": float(os.getenv("BIGQUERY_TIMEOUT", "20")),
+    "bulk_timeout_seconds": float(os.getenv("BIGQUERY_BULK_TIMEOUT", "300")),  # full scans, set-based scoring
+    "max_concurrent_queries": 8,
+    "breaker_failures": 5,  # consecutive failures before failing fast
+    "breaker_reset_seconds": 30,
+}
+
+# Prediction cache
+# "memory": per-process only (default). "sqlite": disk store shared by local workers.
+# "redis": Redis-compatible server shared by all Cloud Run instances (e.g. Memorystore).
+PREDICTION_CACHE = {
+    "backend": os.getenv("PREDICTION_CACHE_BACKEND", "memory"),
+    "sqlite_path": os.getenv("PREDICTION_CACHE_PATH", ".cache/predictions.sqlite3"),
+    "redis_url": os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    "ttl_seconds": int(os.getenv("PREDICTION_CACHE_TTL", "86400")),
+    "negative_ttl_seconds": int(os.getenv("PREDICTION_CACHE_NEGATIVE_TTL", "600")),  # unknown VINs
+    "max_entries": int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "10000")),  # in-process LRU bound
+    "lock_ttl_seconds": 30,  # stampede lock held while one instance runs ML.PREDICT
+    "lock_wait_seconds": 10,  # how long other instances wait for that result
+}
+
+# Local VIN membership index (answers "not found" without a warehouse job)
+VIN_INDEX = {
+    "enabled": os.getenv("VIN_INDEX_ENABLED", "true").lower() == "true",
+    "path": os.getenv("VIN_INDEX_PATH", ".cache/vin_index.npy"),
+    "max_age_seconds": int(os.getenv("VIN_INDEX_MAX_AGE", "3600")),  # rebuild from training_data after this
+    "retry_seconds": 60,  # minimum gap between rebuild attempts
+}
+
+# VIN validation before any warehouse call
+# "strict": reject VINs whose check digit (9th character) is wrong, unless the VIN index knows them.
+# "off": only check length and character set.
+VIN_VALIDATION = {
+    "check_digit": os.getenv("VIN_CHECK_DIGIT", "strict"),
+}
+
+# Turn profiling (opt-in): PROFILE_TURNS=true profiles every chat turn,
+# otherwise add ?profile=1 to the URL or send an "X-Profile: 1" header.
+PROFILING = {
+    "enabled": os.getenv("PROFILE_TURNS", "false").lower() == "true",
+    "dir": os.getenv("PROFILE_DIR", ".profiles"),
+    "keep_last": int(os.getenv("PROFILE_KEEP_LAST", "50")),  # turns kept on disk / summarized
+    "interval_seconds": 0.005,  # stack sampling interval
+    "query_param": "profile",
+    "header": "X-Profile",
+}
+
+# Speculative prefetch: start prediction queries for VINs in the prompt while Gemini plans
+PREFETCH = {
+    "enabled": os.getenv("PREFETCH_ENABLED", "true").lower() == "true",
+    "tools": [t.strip() for t in os.getenv("PREFETCH_TOOLS", "claim").split(",") if t.strip()],  # claim, cost
+    "max_workers": int(os.getenv("PREFETCH_MAX_WORKERS", "4")),
+    "max_vins": 5,  # per prompt
+}
+
+# Multi-VIN requests: predictions fan out with bounded concurrency
+BATCH = {
+    "max_concurrency": int(os.getenv("BATCH_MAX_CONCURRENCY", "4")),
+    "max_vins": int(os.getenv("BATCH_MAX_VINS", "50")),  # per request
+}
+
+# Model version registry: logical model name -> active / shadow BigQuery ML model.
+# Edit with `python tools/model_registry.py ...`; running instances pick up changes within a second.
+# Point MODEL_REGISTRY_PATH at shared storage (e.g. a mounted bucket) to swap all instances at once.
+MODEL_REGISTRY = {
+    "path": os.getenv("MODEL_REGISTRY_PATH", "model_registry.json"),
+    # Per-process latency / drift snapshots read by `python tools/model_registry.py stats`
+    # (point at shared storage too to compare versions across instances)
+    "stats_dir": os.getenv("MODEL_STATS_DIR", ".cache/model_stats"),
+    "stats_interval_seconds": 60,  # snapshot + structured log record at most this often
+    "stats_max_age_seconds": 86400,  # older snapshots (stopped processes) are ignored
+    "shadow_queue_size": 20,  # pending shadow scores per process; further samples are dropped
+}
+
+# Background prediction cache warming (see tools/cache_warmer.py)
+WARMER = {
+    "enabled": os.getenv("CACHE_WARMER_ENABLED", "false").lower() == "true",
+    "sources": [s.strip() for s in os.getenv("CACHE_WARMER_SOURCES", "claims,watchlists").split(",") if s.strip()],
+    "watchlist_dir": os.getenv("WATCHLIST_DIR", "watchlists"),  # *.txt / *.csv files containing VINs
+    # "claims" source: VINs with claims in the last claims_days days, most recent first
+    "claims_table": os.getenv("CACHE_WARMER_CLAIMS_TABLE", "prj-dfdl-625-aws-p-625.bq_625_aws_lnd_lc_vw.clm_25_vw"),
+    "claims_date_column": os.getenv("CACHE_WARMER_CLAIMS_DATE_COLUMN", "clm_dt"),
+    "claims_days": int(os.getenv("CACHE_WARMER_CLAIMS_DAYS", "7")),
+    "tools": ["claim", "cost"],
+    "interval_seconds": int(os.getenv("CACHE_WARMER_INTERVAL", "3600")),
+    "startup_delay_seconds": 30,
+    "max_vins": 5000,  # per cycle
+    "batch_size": 200,  # VINs per set-based ML.PREDICT query
+    "max_queries_per_minute": 6,
+    "idle_seconds": 2.0,  # only query after this long without interactive predictions
+}
+
+# Local feature attribution ("why is this VIN high risk?", see tools/explain.py)
+EXPLAIN = {
+    "weights_ttl_seconds": 86400,  # ML.WEIGHTS / ML.FEATURE_INFO cache per model version
+    "top_features": 3,  # contributions returned per VIN
+}
+
+# Session cassettes (record / replay slow turns, see tools/cassette.py)
+# RECORD_SESSIONS: "off" (default), "slow" (turns slower than slow_turn_seconds) or "all"
+CASSETTES = {
+    "mode": os.getenv("RECORD_SESSIONS", "off"),
+    "dir": os.getenv("CASSETTE_DIR", ".cassettes"),
+    "slow_turn_seconds": float(os.getenv("SLOW_TURN_SECONDS", "10")),
+}
+
+# Risk portfolio dashboard (see tools/portfolio.py)
+# The page reads small aggregate tables that a scheduled job rebuilds every refresh_seconds.
+PORTFOLIO = {
+    "refresh_seconds": int(os.getenv("PORTFOLIO_REFRESH_SECONDS", "86400")),  # scheduled refresh interval
+    "freshness_seconds": int(os.getenv("PORTFOLIO_FRESHNESS_SECONDS", "300")),  # how often the page checks for a refresh
+    "top_vins": 10000,  # rows kept in risk_portfolio_top_vins (the page plots max_points of them)
+    "histogram_bins": 50,  # claim probability buckets
+    "max_points": 2000,  # scatter points plotted after downsampling
+    "max_categories": 15,  # bars per chart; the rest are grouped as "Other"
+}
+
+# Load / capacity test (see tools/loadtest.py): simulated users against fake Gemini and BigQuery
+LOADTEST = {
+    "rates": [float(r) for r in os.getenv("LOADTEST_RATES", "6,12,24,48").split(",")],  # new sessions per minute, one step each
+    "step_seconds": int(os.getenv("LOADTEST_STEP_SECONDS", "60")),
+    "think_seconds": float(os.getenv("LOADTEST_THINK_SECONDS", "10")),  # mean pause between a user's turns
+    "turns_per_session": 4,  # mean
+    "direct_share": 0.2,  # sessions that call the prediction functions directly (API clients) instead of chatting
+    "mix": {"claim": 0.5, "cost": 0.25, "explain": 0.1, "batch": 0.15},  # chat prompt types
+    "llm_latency": (0.9, 2.5),  # Gemini call (median, p95) seconds, log-normal
+    "query_latency": (0.5, 1.6),  # BigQuery query (median, p95) seconds, log-normal
+    "drain_seconds": 60,  # wait for in-flight turns after the last step
+    "slo": {
+        "chat_p95_seconds": float(os.getenv("LOADTEST_SLO_CHAT_P95", "8")),
+        "chat_p99_seconds": float(os.getenv("LOADTEST_SLO_CHAT_P99", "15")),
+        "direct_p95_seconds": float(os.getenv("LOADTEST_SLO_DIRECT_P95", "3")),
+        "max_error_rate": float(os.getenv("LOADTEST_SLO_ERROR_RATE", "0.01")),
+    },
+}
+
+# Structured logging (see tools/structured_logging.py)
+# Records are written as JSON lines in Cloud Run and as text locally, from a background thread.
+LOGGING = {
+    "level": os.getenv("LOG_LEVEL", "DEBUG" if ENVIRONMENT == "local" else "INFO"),
+    "format": os.getenv("LOG_FORMAT", "text" if ENVIRONMENT == "local" else "json"),
+    # Fraction of requests whose DEBUG / INFO records are kept (WARNING and above are always kept)
+    "sample_rates": {
+        "DEBUG": float(os.getenv("LOG_SAMPLE_DEBUG", "1.0")),
+        "INFO": float(os.getenv("LOG_SAMPLE_INFO", "1.0")),
+    },
 }
 
 # Debug mode enabled when running locally
@@ -37,6 +202,7 @@ DEBUG = ENVIRONMENT == "local"
 if DEBUG:
     print(f"🔧 Environment: {ENVIRONMENT}")
     print(f"🤖 Model: {GEMINI_API['model']}")
-    print(f"📊 BigQuery Project: {BIGQUERY['project']}")
+    print(f"📊 BigQuery Project: {BIGQUERY['project']} (backend: {BIGQUERY['backend']})")
+    print(f"🗄️ Prediction cache: {PREDICTION_CACHE['backend']}")
     print(f"🌐 Proxy: {PROXIES if PROXIES else 'None'}")
     print(f"🔍 Debug: ON")
@@ -69,3 +69,11 @@ SELECT
   state,
   total_claim_cost
 FROM `warranty-prediction-demo.warranty_data.cost_training_data`;
+
+-- ============================================
+-- Risk portfolio aggregates (dashboard page)
+-- ============================================
+-- Built by `python tools/portfolio.py` (REFRESH_SQL), which scores the fleet
+-- with the active model versions from the model registry. Schedule that
+-- command (e.g. a Cloud Run job on a daily Cloud Scheduler trigger) rather than
+-- copying its statements into a scheduled query, which would pin model names.
@@ -0,0 +1,19 @@
+"""Offline test setup: DuckDB instead of BigQuery, no registry file, no background work.
+
+Environment defaults are set before anything imports config.py, so the suite
+runs without cloud credentials:
+
+    python -m pytest -q
+"""
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("BIGQUERY_BACKEND", "duckdb")
+os.environ.setdefault("MODEL_REGISTRY_PATH", str(Path(__file__).parent / "no_registry.json"))
+os.environ.setdefault("VIN_INDEX_ENABLED", "false")
+os.environ.setdefault("CACHE_WARMER_ENABLED", "false")
+os.environ.setdefault("PREDICTION_CACHE_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
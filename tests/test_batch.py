@@ -0,0 +1,31 @@
+from tools.batch import batch_record, limit_vins
+from tools.chat_turn import is_scoring_request
+
+
+def _row(vin, probability, status="success"):
+    return {"vin": vin, "status": status, "risk_tier": None, "probability": probability, "cost_usd": None, "error": None}
+
+
+def test_limit_vins_dedupes_normalized_and_counts_skipped():
+    vins, skipped = limit_vins(["1hgbh41jxmn100001", "1HGBH41JXMN100001", "1HGBH41JXMN100002", "1HGBH41JXMN100003"],
+                               max_vins=2)
+    assert vins == ["1HGBH41JXMN100001", "1HGBH41JXMN100002"]
+    assert skipped == 1
+
+
+def test_batch_record_sorts_by_probability_and_counts_failures():
+    record = batch_record([_row("A", 0.2), _row("B", None, "not_found"), _row("C", 0.8)], skipped=3)
+    assert [row["vin"] for row in record["results"]] == ["C", "A", "B"]
+    assert (record["status"], record["count"], record["failed"], record["skipped"]) == ("success", 3, 1, 3)
+
+
+def test_batch_record_all_failed():
+    record = batch_record([_row("A", None, "error"), _row("B", None, "invalid")])
+    assert record["status"] == "error" and record["failed"] == 2
+
+
+def test_is_scoring_request():
+    assert is_scoring_request("Score 1HGBH41JXMN100001, 1HGBH41JXMN100002")
+    assert is_scoring_request("please compare the claim risk of 1HGBH41JXMN100001 and 1HGBH41JXMN100002")
+    assert not is_scoring_request("score 1HGBH41JXMN100001")  # one VIN: the agent handles it
+    assert not is_scoring_request("why is 1HGBH41JXMN100002 riskier than 1HGBH41JXMN100001?")
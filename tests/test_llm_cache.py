@@ -0,0 +1,38 @@
+import time
+
+from tools.llm_cache import ResponseCache, make_key
+
+
+def test_key_ignores_whitespace():
+    assert make_key("m", "sys", "score  VIN\n123") == make_key("m", "sys", " score VIN 123 ")
+    assert make_key("m", "sys", "a") != make_key("m", "sys", "a", {"temperature": 1})
+
+
+def test_ttl():
+    cache = ResponseCache(path=None, ttl=0.05)
+    cache.put("k", "answer")
+    assert cache.get("k") == "answer"
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats == {"hits": 1, "misses": 1}
+
+
+def test_memory_eviction_is_lru():
+    cache = ResponseCache(path=None, max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")  # now most recently used
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("1", "3")
+
+
+def test_disk_store_is_pruned_and_survives_restart(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+    cache = ResponseCache(path=path, max_entries=2)
+    for i, key in enumerate("abc"):
+        cache.put(key, str(i))
+        time.sleep(0.01)  # distinct created_at, so "oldest first" is well defined
+    reopened = ResponseCache(path=path, max_entries=2)
+    assert reopened.get("a") is None
+    assert (reopened.get("b"), reopened.get("c")) == ("1", "2")
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from tools.portfolio import downsample, top_categories
+
+
+def test_downsample_keeps_extremes():
+    df = pd.DataFrame({"cost": range(10000, 0, -1), "vin": [f"V{i}" for i in range(10000)]})
+    sampled = downsample(df, "cost", max_points=100)
+    assert len(sampled) == 100
+    assert (sampled["cost"].min(), sampled["cost"].max()) == (1, 10000)
+    assert sampled["cost"].is_monotonic_increasing
+
+
+def test_downsample_small_frame_unchanged():
+    df = pd.DataFrame({"cost": [3, 1, 2]})
+    assert downsample(df, "cost", max_points=10) is df
+
+
+def test_top_categories_folds_the_rest_into_other():
+    df = pd.DataFrame({"make": ["A", "B", "C", "D", "A"], "vehicles": [5, 4, 3, 2, 1]})
+    top = top_categories(df, "make", "vehicles", n=3)
+    assert list(top["make"]) == ["A", "B", "Other"]
+    assert list(top["vehicles"]) == [6, 4, 5]
+    assert top["vehicles"].sum() == df["vehicles"].sum()
+
+
+def test_top_categories_few_groups():
+    df = pd.DataFrame({"make": ["A", "B", "A"], "vehicles": [1, 2, 3]})
+    assert list(top_categories(df, "make", "vehicles", n=3)["make"]) == ["A", "B"]
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from tools.prediction_cache import PredictionCache, SqliteStore
+
+
+def test_hit_after_miss():
+    cache = PredictionCache("test")
+    calls = []
+    loader = lambda: calls.append(1) or {"probability": 0.5}
+    assert cache.get_or_compute("k", loader) == ({"probability": 0.5}, False)
+    assert cache.get_or_compute("k", loader) == ({"probability": 0.5}, True)
+    assert len(calls) == 1
+    assert cache.stats["misses"] == 1 and cache.stats["l1_hits"] == 1
+
+
+def test_negative_results_are_cached_with_their_own_ttl():
+    cache = PredictionCache("test", ttl=60, negative_ttl=0.05)
+    calls = []
+    loader = lambda: calls.append(1)  # returns None: VIN not found
+    assert cache.get_or_compute("unknown", loader) == (None, False)
+    assert cache.get_or_compute("unknown", loader) == (None, True)
+    assert cache.stats["negative_hits"] == 1
+    time.sleep(0.1)
+    assert cache.get_or_compute("unknown", loader) == (None, False)
+    assert len(calls) == 2
+
+
+def test_concurrent_callers_share_one_loader_run():
+    cache = PredictionCache("test")
+    calls = []
+    started = threading.Event()
+
+    def loader():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"probability": 0.9}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(cached for _, cached in results) == [False, True, True, True, True]
+
+
+def test_failed_loader_is_not_cached():
+    cache = PredictionCache("test")
+
+    def failing():
+        raise RuntimeError("warehouse down")
+
+    try:
+        cache.get_or_compute("k", failing)
+    except RuntimeError:
+        pass
+    assert cache.peek("k") is None
+    assert cache.get_or_compute("k", lambda: {"probability": 0.1}) == ({"probability": 0.1}, False)
+
+
+def test_lru_bound():
+    cache = PredictionCache("test", max_entries=2)
+    for key in "abc":
+        cache.put(key, {"key": key})
+    assert cache.peek("a") is None
+    assert cache.peek("c") == ({"key": "c"},)
+
+
+def test_shared_store_round_trip(tmp_path):
+    store = SqliteStore(str(tmp_path / "cache.sqlite3"))
+    PredictionCache("claim", store).put("v1:VIN", {"probability": 0.3})
+    PredictionCache("claim", store).put("v1:UNKNOWN", None)
+    other = PredictionCache("claim", store)  # e.g. another instance: empty L1
+    assert other.get_or_compute("v1:VIN", lambda: None) == ({"probability": 0.3}, True)
+    assert other.get_or_compute("v1:UNKNOWN", lambda: {"probability": 1.0}) == (None, True)
+    assert other.stats["l2_hits"] == 2
@@ -0,0 +1,47 @@
+import logging
+
+import pytest
+
+from config import LOGGING
+from tools.structured_logging import RequestContextFilter, lazy, request_context
+
+
+def _record(level=logging.INFO):
+    return logging.LogRecord("tools.test", level, __file__, 1, "message", (), None)
+
+
+@pytest.fixture
+def sample_info(monkeypatch):
+    monkeypatch.setitem(LOGGING, "sample_rates", {"DEBUG": 0.0, "INFO": 0.5})
+
+
+def test_request_id_is_stamped():
+    with request_context("turn-1"):
+        record = _record()
+        assert RequestContextFilter().filter(record)
+    assert record.request_id == "turn-1"
+
+
+def test_sampling_is_decided_per_request(sample_info):
+    log_filter = RequestContextFilter()
+    kept = []
+    for i in range(200):
+        with request_context(f"request-{i}"):
+            decisions = {log_filter.filter(_record()) for _ in range(5)}
+        assert len(decisions) == 1  # a request is logged completely or not at all
+        kept.append(decisions.pop())
+    assert 40 < sum(kept) < 160
+
+
+def test_warnings_are_never_sampled(sample_info):
+    log_filter = RequestContextFilter()
+    with request_context("r"):
+        assert log_filter.filter(_record(logging.WARNING))
+        assert not log_filter.filter(_record(logging.DEBUG))
+
+
+def test_lazy_argument_is_only_computed_when_formatted():
+    calls = []
+    value = lazy(lambda: calls.append(1) or "expensive")
+    assert calls == []
+    assert str(value) == "expensive" and calls == [1]
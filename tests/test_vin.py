@@ -0,0 +1,33 @@
+from tools.vin import compute_check_digits, find_vin_candidates, normalize_vin, preprocess_vin, preprocess_vins
+
+
+def test_check_digit():
+    assert list(compute_check_digits(["1M8GDM9AXKP042788", "11111111111111111"])) == ["X", "1"]
+
+
+def test_preprocess_flags_check_digit_mismatch():
+    rows = preprocess_vins(["1M8GDM9AXKP042788", "1M8GDM9A1KP042788"])
+    assert list(rows["valid"]) == [True, False]
+    assert list(rows["error"]) == ["", "check_digit"]
+
+
+def test_preprocess_rejects_malformed():
+    for vin in ["ABC", "1M8GDM9AXKP04278", "1M8GDM9AXKP04278!"]:
+        row = preprocess_vin(vin)
+        assert not row["valid"] and row["error"] == "format"
+
+
+def test_normalize_maps_confusables_and_separators():
+    assert normalize_vin(" 1m8gdm9a-xkp 042788 ") == "1M8GDM9AXKP042788"
+    assert normalize_vin("1HGBH41JXMN1OOOQ1") == "1HGBH41JXMN100001"
+
+
+def test_decode():
+    row = preprocess_vin("1HGBH41JXMN100001")
+    assert (row["make"], row["country"], row["model_year"]) == ("Honda", "United States", 1991)
+
+
+def test_find_vin_candidates_dedupes_in_order():
+    text = "compare 1hgbh41jxmn100002 and 1HGBH41JXMN100001, then 1HGBH41JXMN100002 again"
+    assert find_vin_candidates(text) == ["1HGBH41JXMN100002", "1HGBH41JXMN100001"]
+    assert find_vin_candidates("no vins here") == []
@@ -5,13 +5,19 @@ from pathlib import Path
 # Add project root to sys.path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from tools.structured_logging import setup_logging
+
+# Structured logs from a background thread (idempotent across Streamlit reruns)
+setup_logging()
+
 # Define pages
 home = st.Page("home.py", title="Home", icon="🏠", default=True)
 warranty_agent = st.Page("pages/1_🔮_Warranty_Agent.py", title="Warranty Agent", icon="🔮")
+risk_portfolio = st.Page("pages/2_📊_Risk_Portfolio.py", title="Risk Portfolio", icon="📊")
 
 # Navigation Structure
 pg = st.navigation({
-    "Application": [home, warranty_agent]
+    "Application": [home, warranty_agent, risk_portfolio]
 })
 
 pg.run()
@@ -0,0 +1,103 @@
+"""Multi-VIN predictions with bounded-concurrency fan-out.
+
+Each VIN runs through the regular prediction tools (validation, VIN index,
+cache, BigQuery) on a small thread pool, and rows are yielded as soon as they
+finish so callers can stream them into a table. A failing VIN produces an
+error row instead of aborting the batch.
+
+Batches answered by the chat page without the agent are added to the ADK
+session with record_in_session(), so follow-up questions have the results.
+"""
+import contextvars
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import BATCH
+from tools.cassette import record_event
+from tools.vin import normalize_vin
+
+log = logging.getLogger(__name__)
+
+
+def _predict_row(vin: str) -> dict:
+    from tools.tools import predict_warranty_cost, predict_warranty_total_cost
+
+    claim = predict_warranty_cost(vin)
+    row = {"vin": claim.get("vin", vin), "status": claim["status"], "risk_tier": None,
+           "probability": None, "cost_usd": None, "error": claim.get("error_message")}
+    if claim["status"] != "success":
+        return row
+    row.update(risk_tier=claim["risk_tier"], probability=claim["probability"])
+    cost = predict_warranty_total_cost(vin)
+    if cost["status"] == "success":
+        row["cost_usd"] = cost["cost_usd"]
+    else:
+        row["error"] = cost.get("error_message")
+    return row
+
+
+def limit_vins(vins: Iterable[str], max_vins: int = BATCH["max_vins"]) -> Tuple[List[str], int]:
+    """Distinct normalized VINs, capped at max_vins, and how many were left out."""
+    distinct = list(dict.fromkeys(normalize_vin(v) for v in vins))
+    return distinct[:max_vins], max(0, len(distinct) - max_vins)
+
+
+def iter_batch_predictions(vins: Iterable[str], max_concurrency: int = BATCH["max_concurrency"]) -> Iterator[dict]:
+    """Yield one result row per distinct VIN (at most BATCH["max_vins"]), in completion order."""
+    vins, _ = limit_vins(vins)
+    if not vins:
+        return
+    log.info("Fanning out predictions", extra={"vin_count": len(vins), "concurrency": max_concurrency})
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="batch") as pool:
+        # Each worker runs in a copy of the caller's context (e.g. an active cassette recorder)
+        futures = {pool.submit(contextvars.copy_context().run, _predict_row, vin): vin for vin in vins}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                vin = futures[future]
+                log.warning("Batch prediction failed: %s: %s", type(e).__name__, e, extra={"vin": vin})
+                yield {"vin": vin, "status": "error", "risk_tier": None, "probability": None,
+                       "cost_usd": None, "error": f"Prediction failed: {e}"}
+
+
+def batch_record(rows: List[dict], skipped: int = 0) -> dict:
+    """predict_warranty_batch record for finished rows (highest claim probability first)."""
+    rows = sorted(rows, key=lambda r: -(r["probability"] if r["probability"] is not None else -1))
+    failed = sum(1 for row in rows if row["status"] != "success")
+    return {
+        "status": "success" if failed < len(rows) else "error",
+        "count": len(rows),
+        "failed": failed,
+        "skipped": skipped,  # VINs beyond BATCH["max_vins"], not scored
+        "results": rows,
+    }
+
+
+async def record_in_session(runner, user_id: str, session_id: str, prompt: str, record: dict, summary: str):
+    """Add a batch answered without the agent to its ADK session, as if the agent had called predict_warranty_batch."""
+    from google.adk.events import Event
+    from google.genai import types
+
+    session_service = runner.session_service
+    session = await session_service.get_session(app_name=runner.app_name, user_id=user_id, session_id=session_id)
+    if session is None:
+        session = await session_service.create_session(app_name=runner.app_name, user_id=user_id, session_id=session_id)
+    invocation_id = Event.new_id()
+    vins = [row["vin"] for row in record["results"]]
+    contents = [
+        ("user", types.UserContent(parts=[types.Part(text=prompt)])),
+        (runner.agent.name, types.ModelContent(parts=[types.Part(function_call=types.FunctionCall(
+            name="predict_warranty_batch", args={"vins": vins}))])),
+        (runner.agent.name, types.UserContent(parts=[types.Part(function_response=types.FunctionResponse(
+            name="predict_warranty_batch", response=record))])),
+        (runner.agent.name, types.ModelContent(parts=[types.Part(text=summary)])),
+    ]
+    for author, content in contents:
+        event = Event(invocation_id=invocation_id, author=author, content=content)
+        await session_service.append_event(session, event)
+        record_event(event)  # a recorded batch turn replays into the same history
@@ -1,13 +1,131 @@
 """BigQuery Service for data access."""
+from google.api_core import exceptions as google_exceptions
 from google.cloud import bigquery
 import pandas as pd
+import contextvars
+import logging
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Optional
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config import BIGQUERY, ENVIRONMENT
+from tools.cassette import recorded_query
+from tools.structured_logging import request_id
 
-def query_bigquery(query: str) -> pd.DataFrame:
+log = logging.getLogger(__name__)
+
+class BigQueryUnavailableError(RuntimeError):
+    """Raised without contacting BigQuery while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fails fast after repeated BigQuery failures, then lets one probe through after a cool-down."""
+
+    def __init__(self, failure_threshold: int = BIGQUERY["breaker_failures"],
+                 reset_seconds: float = BIGQUERY["breaker_reset_seconds"]):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_seconds - (time.time() - self.opened_at)
+            if remaining > 0:
+                raise BigQueryUnavailableError(
+                    f"BigQuery is currently degraded; predictions are paused for {remaining:.0f}s. Please try again shortly."
+                )
+            self.opened_at = time.time()  # half-open: this caller is the probe, others keep failing fast
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    log.warning("BigQuery circuit breaker opened", extra={"consecutive_failures": self.failures})
+                self.opened_at = time.time()
+
+
+class LatencyTracker:
+    """Rolling window of successful query latencies, used to pick the hedge delay."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < 20:
+                return None  # not enough data to know what "slow" means yet
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+_client = None
+_client_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=BIGQUERY["max_concurrent_queries"], thread_name_prefix="bigquery")
+breaker = CircuitBreaker()
+latencies = LatencyTracker()
+stats = {"queries": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0, "fast_failures": 0, "background": 0}
+
+
+def _get_client() -> bigquery.Client:
+    """One shared client per process (it is thread-safe and keeps its HTTP session warm)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Short-query optimized mode: small queries are answered without creating a job
+            kwargs = {"default_job_creation_mode": "JOB_CREATION_OPTIONAL"} if BIGQUERY["fast_path"] else {}
+            if ENVIRONMENT == "local":
+                # Local: use your Google account credentials (requires DAP access)
+                _client = bigquery.Client(project=BIGQUERY['project'], **kwargs)
+            else:
+                # Cloud: use service account (automatic)
+                _client = bigquery.Client(**kwargs)
+    return _client
+
+
+def _run_query(query: str, fast: bool, timeout: float) -> pd.DataFrame:
+    client = _get_client()
+    start = time.perf_counter()
+    # The chat turn's request id labels the job, so slow jobs can be traced back to a conversation
+    rid = request_id.get()
+    job_config = bigquery.QueryJobConfig(labels={"request_id": rid}) if rid else None
+    if fast:
+        # Stateless fast path: jobs.query, no job lifecycle polling for small results
+        result = client.query_and_wait(query, job_config=job_config, api_timeout=timeout, wait_timeout=timeout)
+    else:
+        result = client.query(query, job_config=job_config).result(timeout=timeout)
+    result_df = result.to_dataframe()
+    latencies.record(time.perf_counter() - start)
+    return result_df
+
+
+def _is_client_error(e: Exception) -> bool:
+    """4xx errors (bad SQL, missing model, permissions) say nothing about BigQuery's health."""
+    return isinstance(e, google_exceptions.ClientError)
+
+
+@recorded_query
+def query_bigquery(query: str, fast: bool = True, hedge: bool = True, timeout: Optional[float] = None,
+                   background: bool = False) -> pd.DataFrame:
     """
     Execute BigQuery query and return DataFrame.
     
@@ -15,27 +133,84 @@ def query_bigquery(query: str) -> pd.DataFrame:
     Local: Uses your Google credentials - you must request BigQuery access via DAP first!
            After DAP approval, run: gcloud auth application-default login
     
+    Offline: with BIGQUERY_BACKEND=duckdb the query runs against the local
+           DuckDB emulation instead (see duckdb_backend.py)
+
+    Tail latency: small lookups use the stateless fast path; if a query is
+    slower than the recent p95 latency (BIGQUERY["hedge_percentile"]) a
+    duplicate is sent and the first response wins. Every call has a timeout, and a circuit breaker
+    raises BigQueryUnavailableError immediately while BigQuery is degraded.
+
+    Recording: inside a recorded chat turn the query, its result and latency
+    are captured to the session cassette (see cassette.py).
+    
     Args:
         query: SQL query string
+        fast: Use the short-query optimized (job-less) mode
+        hedge: Allow a hedged duplicate request (disable for large scans)
+        timeout: Seconds before giving up (default BIGQUERY["timeout_seconds"];
+            use BIGQUERY["bulk_timeout_seconds"] for full scans)
+        background: Best-effort work such as shadow scoring: runs on the
+            caller's thread (not the query pool), never hedged, refused while
+            the circuit breaker is open and never counted toward it
     
     Returns:
         Query results as pandas DataFrame
     """
-    if ENVIRONMENT == "local":
-        # Local: use your Google account credentials (requires DAP access)
-        client = bigquery.Client(project=BIGQUERY['project'])
-    else:
-        # Cloud: use service account (automatic)
-        client = bigquery.Client()
-    print("Executing BigQuery query...")
+    if BIGQUERY["backend"] == "duckdb":
+        from tools.duckdb_backend import query_duckdb
+        return query_duckdb(query)
+
+    if background:
+        if breaker.opened_at is not None:
+            raise BigQueryUnavailableError("BigQuery is degraded; background query skipped")
+        stats["background"] += 1
+        return _run_query(query, fast, timeout or BIGQUERY["timeout_seconds"])
+
     try:
-        result = client.query(query).result()
-        print("Query executed.")
-        result_df = result.to_dataframe()
-        print(f"Retrieved {len(result_df)} rows")
-        return result_df
+        breaker.before_call()
+    except BigQueryUnavailableError:
+        stats["fast_failures"] += 1
+        raise
+
+    log.debug("Executing BigQuery query:\n%s", query)
+    stats["queries"] += 1
+    timeout = timeout or BIGQUERY["timeout_seconds"]
+    deadline = time.perf_counter() + timeout
+    hedge_after = latencies.percentile(BIGQUERY["hedge_percentile"]) if hedge and BIGQUERY["hedging"] else None
+    try:
+        # Query threads run in a copy of the caller's context (request id, cassette recorder)
+        futures = [_executor.submit(contextvars.copy_context().run, _run_query, query, fast, timeout)]
+        done, _ = wait(futures, timeout=hedge_after if hedge_after is not None else timeout)
+        if not done and hedge_after is not None:
+            log.info("Query slower than %.2fs - sending hedged request", hedge_after)
+            stats["hedged"] += 1
+            futures.append(_executor.submit(contextvars.copy_context().run, _run_query, query, fast, timeout))
+
+        # First successful response wins; fall back to the other one if it failed
+        pending = set(futures)
+        last_error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1 and future is futures[1]:
+                        stats["hedge_wins"] += 1
+                    result_df = future.result()
+                    breaker.record_success()
+                    log.debug("Retrieved %d rows", len(result_df))
+                    return result_df
+                last_error = future.exception()
+        if last_error is not None and not pending:
+            raise last_error
+        stats["timeouts"] += 1
+        raise TimeoutError(f"BigQuery query did not finish within {timeout:.0f}s")
     except Exception as e:
-        print(f"BigQuery error: {type(e).__name__}: {str(e)}")
+        log.warning("BigQuery error: %s: %s", type(e).__name__, e)
+        if not _is_client_error(e):
+            breaker.record_failure()
         raise
 
 def get_warranty_claims(plant: str = "COLOGNE PLANT BUILD") -> pd.DataFrame:
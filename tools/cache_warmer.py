@@ -0,0 +1,222 @@
+"""Background prediction cache warmer.
+
+The first lookup of a VIN pays full ML.PREDICT latency, but the VINs people
+ask about are mostly predictable. Every WARMER["interval_seconds"] the warmer
+collects candidate VINs from:
+
+    - "claims":     VINs with claims in the last WARMER["claims_days"] days
+    - "watchlists": VINs in the text/CSV files under WARMER["watchlist_dir"]
+
+keeps the valid, known VINs that are not cached yet, scores them in chunks
+with one set-based ML.PREDICT query per chunk and model, and loads the
+prediction cache (in-process and shared store).
+
+Interactive traffic always wins: the warmer runs a single query at a time,
+at most WARMER["max_queries_per_minute"], pauses while users are getting
+predictions (WARMER["idle_seconds"]) and skips the cycle while the BigQuery
+circuit breaker is open. `report()` shows how many warmed entries were later
+requested.
+
+    python tools/cache_warmer.py    # run one warming cycle and print the report
+                                    # (needs a shared store: PREDICTION_CACHE_BACKEND=sqlite|redis)
+"""
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import WARMER
+from tools.structured_logging import new_request_id, request_context
+
+log = logging.getLogger(__name__)
+
+stats = {"cycles": 0, "candidates": 0, "queries": 0, "warmed": 0, "deferred": 0, "errors": 0}
+_thread = None
+_last_query = 0.0
+
+
+# ============================================
+# CANDIDATES
+# ============================================
+
+def claim_vins() -> List[str]:
+    """Most recently claimed VINs (WARMER["claims_table"]); a warming query like any other."""
+    from config import BIGQUERY
+    from tools.bigquery_service import query_bigquery
+
+    date = WARMER["claims_date_column"]
+    query = f"""
+    SELECT vin_cd AS vin
+    FROM `{WARMER['claims_table']}`
+    WHERE DATE({date}) >= DATE_SUB(CURRENT_DATE(), INTERVAL {WARMER['claims_days']} DAY)
+    GROUP BY vin_cd
+    ORDER BY MAX({date}) DESC
+    LIMIT {WARMER['max_vins']}
+    """
+    _wait_for_turn()
+    stats["queries"] += 1
+    claims = query_bigquery(query, fast=False, hedge=False, timeout=BIGQUERY["bulk_timeout_seconds"])
+    return claims["vin"].dropna().astype(str).tolist()
+
+
+def watchlist_vins() -> List[str]:
+    """VINs from every *.txt / *.csv watchlist file (any layout: VINs are found in the text)."""
+    from tools.vin import find_vin_candidates
+
+    vins = []
+    for path in sorted(Path(WARMER["watchlist_dir"]).glob("*")):
+        if path.suffix.lower() in (".txt", ".csv"):
+            vins += find_vin_candidates(path.read_text(errors="ignore"))
+    return vins
+
+
+SOURCES = {"claims": claim_vins, "watchlists": watchlist_vins}
+
+
+def candidate_vins() -> List[str]:
+    """Valid, de-duplicated candidate VINs, limited to those the VIN index knows (when built)."""
+    from tools.vin import preprocess_vins
+    from tools.vin_index import get_vin_index
+
+    vins = []
+    for source in WARMER["sources"]:
+        try:
+            found = SOURCES[source]()
+            log.info("Cache warmer: %d candidate VINs from %s", len(found), source)
+            vins += found
+        except Exception as e:
+            stats["errors"] += 1
+            log.warning("Cache warmer: could not read %s: %s: %s", source, type(e).__name__, e)
+    if not vins:
+        return []
+    rows = preprocess_vins(list(dict.fromkeys(vins)))
+    index = get_vin_index()
+    if index is None:
+        keep = rows["valid"] | (rows["error"] == "check_digit")
+    else:
+        # Same rule as the tools: known VINs are accepted despite a wrong check digit
+        keep = (rows["valid"] | (rows["error"] == "check_digit")) & index.contains_many(rows["vin"])
+    return rows.loc[keep, "vin"].tolist()[:WARMER["max_vins"]]
+
+
+# ============================================
+# RATE LIMITING
+# ============================================
+
+def _interactive_lookups() -> int:
+    from tools import tools
+    return sum(cache.stats["l1_hits"] + cache.stats["l2_hits"] + cache.stats["misses"]
+               for cache in (tools._prediction_cache, tools._cost_cache))
+
+
+def _wait_for_turn():
+    """Block until a warming query may run without competing with user requests."""
+    global _last_query
+    from tools.bigquery_service import breaker
+
+    min_gap = 60.0 / WARMER["max_queries_per_minute"]
+    while True:
+        wait = _last_query + min_gap - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        # Users are asking for predictions (the warmer itself never does lookups): back off
+        before = _interactive_lookups()
+        time.sleep(WARMER["idle_seconds"])
+        if _interactive_lookups() == before:
+            break
+        stats["deferred"] += 1
+    if breaker.opened_at is not None:
+        raise RuntimeError("BigQuery circuit breaker is open")
+    _last_query = time.time()
+
+
+# ============================================
+# WARMING
+# ============================================
+
+def _warm(vins: List[str]):
+    from tools import tools
+
+    kinds = {
+        "claim": (tools._prediction_cache, tools.CLAIM_MODEL, tools._score_claims_bulk),
+        "cost": (tools._cost_cache, tools.COST_MODEL, tools._score_costs_bulk),
+    }
+    for kind in WARMER["tools"]:
+        cache, logical_model, score_bulk = kinds[kind]
+        version = tools.model_registry.resolve(logical_model)
+        missing = [vin for vin in vins if cache.peek(f"{version}:{vin}") is None]
+        for start in range(0, len(missing), WARMER["batch_size"]):
+            chunk = missing[start:start + WARMER["batch_size"]]
+            _wait_for_turn()
+            stats["queries"] += 1
+            records = score_bulk(chunk, version)
+            for vin, record in records.items():
+                cache.put(f"{version}:{vin}", record, warmed=True)
+            stats["warmed"] += len(records)
+            log.info("Cache warmer: loaded %d/%d %s predictions", len(records), len(chunk), kind,
+                     extra={"model_version": version})
+
+
+def run_cycle():
+    """One warming pass over all candidate sources."""
+    stats["cycles"] += 1
+    vins = candidate_vins()
+    stats["candidates"] += len(vins)
+    if not vins:
+        return
+    try:
+        _warm(vins)
+    except Exception as e:
+        stats["errors"] += 1
+        log.warning("Cache warmer: cycle stopped: %s: %s", type(e).__name__, e)
+
+
+def _loop():
+    time.sleep(WARMER["startup_delay_seconds"])  # let the app (and its first users) start first
+    while True:
+        # Each cycle gets its own request id, which also labels its BigQuery jobs
+        with request_context(f"warmer-{new_request_id()}"):
+            run_cycle()
+        log.info("Cache warmer report", extra={"report": report()})
+        time.sleep(WARMER["interval_seconds"])
+
+
+def start_warmer():
+    """Start the background warmer once per process (no-op unless WARMER["enabled"])."""
+    global _thread
+    if not WARMER["enabled"] or _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, name="cache-warmer", daemon=True)
+    _thread.start()
+
+
+def report() -> dict:
+    """Warmer counters plus how much of the interactive cache traffic the warmed entries served."""
+    from tools import tools
+
+    out = dict(stats)
+    for name, cache in (("claim", tools._prediction_cache), ("cost", tools._cost_cache)):
+        warmed, used = cache.stats["warmed"], cache.stats["warmed_used"]
+        lookups = cache.stats["l1_hits"] + cache.stats["l2_hits"] + cache.stats["misses"]
+        hits = cache.stats["l1_hits"] + cache.stats["l2_hits"]
+        out[f"{name}_warmed_used"] = f"{used}/{warmed}" + (f" ({used / warmed:.0%})" if warmed else "")
+        out[f"{name}_hit_rate"] = f"{hits / lookups:.0%}" if lookups else "n/a"
+    return out
+
+
+if __name__ == "__main__":
+    from tools import tools
+    from tools.structured_logging import setup_logging
+
+    if tools._cache_store is None:
+        # An in-process cache would be filled and then thrown away when this script exits
+        print("The one-cycle warmer needs a shared prediction cache: "
+              "set PREDICTION_CACHE_BACKEND=sqlite or redis (with the redis package installed), as the app instances do.")
+        sys.exit(1)
+
+    setup_logging()
+    run_cycle()
+    print(report())
@@ -0,0 +1,361 @@
+"""Record / replay cassettes for agent sessions.
+
+With RECORD_SESSIONS=slow (or =all) each chat turn records everything that
+crosses a process boundary:
+
+    - the ADK event stream consumed by the chat page (for batch turns, the
+      events added to the session by record_in_session())
+    - every LLM call (request key, response, latency; LLM-cache hits included)
+    - every BigQuery query and its result rows (or error), with latency
+
+Entries keep the raw objects and are only serialized when the turn is kept:
+turns slower than CASSETTES["slow_turn_seconds"] (or every turn with =all)
+are appended to CASSETTES["dir"]/<session_id>.jsonl.gz, one gzip member per
+turn. A replay runs each turn through the chat page's own agent_turn() /
+batch_turn() (tools/chat_turn.py) on a fresh runner, with a replay LLM and
+recorded query results, so the session history matches the recording and the
+real agent, prefetch, tool, cache and validation code runs against the
+recorded external latencies:
+
+    python tools/cassette.py .cassettes/<session>.jsonl.gz            # real timing
+    python tools/cassette.py .cassettes/<session>.jsonl.gz --speed 10  # 10x faster
+    python tools/cassette.py .cassettes/<session>.jsonl.gz --speed 0   # no waiting
+"""
+import asyncio
+import contextvars
+import functools
+import gzip
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import CASSETTES
+
+log = logging.getLogger(__name__)
+
+_recorder: contextvars.ContextVar[Optional["Recorder"]] = contextvars.ContextVar("cassette_recorder", default=None)
+_player: Optional["Player"] = None
+
+
+def _normalize_sql(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _frame_to_json(df: pd.DataFrame) -> dict:
+    split = json.loads(df.to_json(orient="split", index=False, date_format="iso"))
+    return {"columns": split["columns"], "data": split["data"]}
+
+
+def _frame_from_json(payload: dict) -> pd.DataFrame:
+    return pd.DataFrame(payload["data"], columns=payload["columns"])
+
+
+# ============================================
+# RECORDING
+# ============================================
+
+def _serialize(entry: dict) -> dict:
+    """JSON form of a recorded entry (ADK events / responses and result frames are kept raw until saved)."""
+    if entry["type"] == "event":
+        return {**entry, "event": entry["event"].model_dump(mode="json", exclude_none=True)}
+    if entry["type"] == "llm":
+        return {**entry, "response": entry["response"].model_dump(mode="json", exclude_none=True)}
+    if entry["type"] == "query" and "result" in entry:
+        return {**entry, "result": _frame_to_json(entry["result"])}
+    return entry
+
+
+class Recorder:
+    """Collects one turn's entries; safe to use from tool and query threads."""
+
+    def __init__(self, session_id: str, prompt: str, kind: str = "agent"):
+        self.session_id = session_id
+        self.prompt = prompt
+        self.kind = kind  # "agent", or "batch" for prompts scored without the agent
+        self.recorded_at = time.time()
+        self.start = time.perf_counter()
+        self.wall_seconds = None
+        self.entries: List[dict] = []
+        self._llm_started: Dict[str, tuple] = {}  # invocation_id -> (start, request key, model)
+        self._lock = threading.Lock()
+
+    def _add(self, entry: dict):
+        entry["t"] = round(time.perf_counter() - self.start, 4)
+        with self._lock:
+            self.entries.append(entry)
+
+    def event(self, event):
+        self._add({"type": "event", "event": event})
+
+    def llm_started(self, invocation_id: str, key: str, model: Optional[str]):
+        self._llm_started[invocation_id] = (time.perf_counter(), key, model)
+
+    def llm_finished(self, invocation_id: str, llm_response, source: str):
+        start, key, model = self._llm_started.pop(invocation_id, (time.perf_counter(), None, None))
+        if llm_response.partial:
+            return
+        self._add({
+            "type": "llm",
+            "source": source,  # "model" or "cache"
+            "key": key,
+            "model": model,
+            "duration": round(time.perf_counter() - start, 4),
+            "response": llm_response,
+        })
+
+    def query(self, sql: str, run):
+        start = time.perf_counter()
+        entry = {"type": "query", "sql": _normalize_sql(sql)}
+        try:
+            df = run()
+        except Exception as e:
+            entry.update(duration=round(time.perf_counter() - start, 4), error=f"{type(e).__name__}: {e}")
+            self._add(entry)
+            raise
+        # Shallow copy: callers adding columns don't change the recording
+        entry.update(duration=round(time.perf_counter() - start, 4), result=df.copy(deep=False))
+        self._add(entry)
+        return df
+
+    def save(self) -> Path:
+        out_dir = Path(CASSETTES["dir"])
+        out_dir.mkdir(parents=True, exist_ok=True)
+        path = out_dir / f"{self.session_id}.jsonl.gz"
+        header = {"type": "turn", "session_id": self.session_id, "prompt": self.prompt, "kind": self.kind,
+                  "recorded_at": self.recorded_at, "wall_seconds": round(self.wall_seconds, 4)}
+        with self._lock:
+            lines = [header] + [_serialize(entry) for entry in self.entries]
+        # Each turn is its own gzip member; gzip readers see the members as one stream
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, separators=(",", ":"), default=str) + "\n")
+        return path
+
+
+def current_recorder() -> Optional[Recorder]:
+    return _recorder.get()
+
+
+def record_event(event):
+    """Record one ADK event of the current turn (no-op when not recording)."""
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.event(event)
+
+
+@contextmanager
+def record_turn(session_id: str, prompt: str, kind: str = "agent", mode: str = CASSETTES["mode"]):
+    """Record the block as one turn of `session_id`'s cassette.
+
+    kind is "batch" for prompts scored by chat_turn.batch_turn() without the agent.
+
+    mode "all" keeps every turn, "slow" only turns slower than
+    CASSETTES["slow_turn_seconds"], "off" records nothing. Work submitted to
+    thread pools is recorded when it runs in a copy of the caller's context.
+    """
+    if mode == "off":
+        yield None
+        return
+    recorder = Recorder(session_id, prompt, kind)
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+        recorder.wall_seconds = time.perf_counter() - recorder.start
+        if mode == "all" or recorder.wall_seconds >= CASSETTES["slow_turn_seconds"]:
+            try:
+                path = recorder.save()
+                log.info("Recorded turn (%.2fs, %d entries) to %s", recorder.wall_seconds, len(recorder.entries), path)
+            except OSError as e:
+                log.warning("Could not write cassette: %s", e)
+
+
+def recorded_query(func):
+    """Decorator for query_bigquery(): record queries, or answer them from a replay."""
+    @functools.wraps(func)
+    def wrapper(query: str, *args, **kwargs):
+        if _player is not None:
+            return _player.query(query)
+        recorder = _recorder.get()
+        if recorder is None:
+            return func(query, *args, **kwargs)
+        return recorder.query(query, lambda: func(query, *args, **kwargs))
+    return wrapper
+
+
+# ============================================
+# REPLAY
+# ============================================
+
+def load(path: str) -> List[dict]:
+    """Turns of a cassette: [{"turn": header, "entries": [...]}, ...]."""
+    turns = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["type"] == "turn":
+                turns.append({"turn": entry, "entries": []})
+            else:
+                turns[-1]["entries"].append(entry)
+    return turns
+
+
+class Player:
+    """Serves one recorded turn's LLM responses (in order) and query results (by SQL)."""
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self.llm = deque()
+        self.queries = defaultdict(deque)
+        self.last_results = {}
+        self.stats = {"llm_calls": 0, "llm_key_mismatches": 0, "queries": 0, "unrecorded_queries": 0}
+
+    def load_turn(self, entries: List[dict]):
+        self.llm = deque(e for e in entries if e["type"] == "llm")
+        self.queries = defaultdict(deque)
+        for e in entries:
+            if e["type"] == "query":
+                self.queries[e["sql"]].append(e)
+        self.stats = dict.fromkeys(self.stats, 0)
+
+    def delay(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed > 0 else 0.0
+
+    def query(self, sql: str) -> pd.DataFrame:
+        sql = _normalize_sql(sql)
+        self.stats["queries"] += 1
+        queue = self.queries.get(sql)
+        entry = queue.popleft() if queue else self.last_results.get(sql)
+        if entry is None:
+            self.stats["unrecorded_queries"] += 1
+            raise RuntimeError(f"Query not in cassette: {sql[:120]}")
+        self.last_results[sql] = entry  # repeated queries (e.g. cache differences) reuse the last result
+        time.sleep(self.delay(entry["duration"]))
+        if "error" in entry:
+            raise RuntimeError(f"Recorded query error: {entry['error']}")
+        return _frame_from_json(entry["result"])
+
+
+def _replay_llm_class():
+    from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+
+    class ReplayLlm(BaseLlm):
+        """Answers model calls with the recorded responses, after the recorded latency."""
+
+        model: str = "cassette-replay"
+
+        async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+            from agent_host_frontend.agent import _request_cache_key
+
+            player = _player
+            if not player.llm:
+                raise RuntimeError("Cassette has no more model responses for this turn")
+            entry = player.llm.popleft()
+            player.stats["llm_calls"] += 1
+            if entry.get("key"):
+                recorded_request = llm_request.model_copy(update={"model": entry.get("model")})
+                if entry["key"] != _request_cache_key(recorded_request):
+                    player.stats["llm_key_mismatches"] += 1  # the conversation diverged from the recording
+            await asyncio.sleep(player.delay(entry["duration"]))
+            response = LlmResponse.model_validate(entry["response"])
+            response.usage_metadata = None
+            for part in (response.content.parts if response.content else None) or []:
+                if part.function_call:
+                    part.function_call.id = None  # ADK assigns fresh ids
+            yield response
+
+    return ReplayLlm
+
+
+def _function_calls(events: List[dict]) -> List[str]:
+    calls = []
+    for event in events:
+        for part in (event.get("content") or {}).get("parts") or []:
+            if "function_call" in part:
+                calls.append(f"{part['function_call']['name']}({json.dumps(part['function_call'].get('args', {}), sort_keys=True)})")
+    return calls
+
+
+def replay(path: str, speed: float = 1.0) -> List[dict]:
+    """Replay a cassette through root_agent; returns one timing report per turn."""
+    global _player
+    from config import GEMINI_API, LLM_CACHE, VIN_INDEX, WARMER
+
+    GEMINI_API["api_key"] = GEMINI_API["api_key"] or "cassette-replay"  # no Gemini calls are made
+    LLM_CACHE["enabled"] = False  # every model call must reach the replay LLM
+    # Importing the agent imports the tools, which would start the VIN index build and the cache
+    # warmer against live BigQuery. Neither is part of a recorded turn: keep both off, and answer
+    # any query from the cassette from the start.
+    VIN_INDEX["enabled"] = False
+    WARMER["enabled"] = False
+    _player = Player(speed)
+    from google.adk.runners import InMemoryRunner
+    from agent_host_frontend.agent import root_agent
+
+    from tools.chat_turn import agent_turn, batch_turn, patch_instruction
+
+    root_agent.model = _replay_llm_class()()
+    patch_instruction(root_agent)  # the recorded requests were made with the page's instruction
+    runner = InMemoryRunner(agent=root_agent, app_name="cassette_replay")
+    session_id, reports = None, []
+
+    from tools.vin import find_vin_candidates
+
+    def run_turn(header: dict) -> List[dict]:
+        """Run the turn as the chat page did (prefetch included); returns the events it added to the session."""
+        get_session = lambda: runner.session_service.get_session(app_name=runner.app_name, user_id="replay",
+                                                                 session_id=session_id)
+        before = len(loop.run_until_complete(get_session()).events)
+        if header.get("kind") == "batch":
+            batch_turn(runner, "replay", session_id, header["prompt"], find_vin_candidates(header["prompt"]), loop)
+        else:
+            agent_turn(runner, "replay", session_id, header["prompt"], loop)
+        return [event.model_dump(mode="json", exclude_none=True)
+                for event in loop.run_until_complete(get_session()).events[before:]]
+
+    loop = asyncio.new_event_loop()
+    try:
+        session_id = loop.run_until_complete(
+            runner.session_service.create_session(app_name=runner.app_name, user_id="replay")
+        ).id
+        for turn in load(path):
+            header, entries = turn["turn"], turn["entries"]
+            _player.load_turn(entries)
+            start = time.perf_counter()
+            events = run_turn(header)
+            recorded_calls = _function_calls([e["event"] for e in entries if e["type"] == "event"])
+            reports.append({
+                "prompt": header["prompt"][:60],
+                "kind": header.get("kind", "agent"),
+                "recorded_s": header["wall_seconds"],
+                "replayed_s": round(time.perf_counter() - start, 3),
+                "recorded_llm_s": round(sum(e["duration"] for e in entries if e["type"] == "llm"), 3),
+                "recorded_query_s": round(sum(e["duration"] for e in entries if e["type"] == "query"), 3),
+                "tool_calls_match": _function_calls(events) == recorded_calls,
+                **_player.stats,
+            })
+    finally:
+        loop.close()
+        _player = None
+    return reports
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python tools/cassette.py <cassette.jsonl.gz> [--speed N]")
+        sys.exit(1)
+    speed = float(sys.argv[sys.argv.index("--speed") + 1]) if "--speed" in sys.argv else 1.0
+    # Use the importable module: query_bigquery() checks tools.cassette's replay state, not __main__'s
+    from tools.cassette import replay as run_replay
+    print(pd.DataFrame(run_replay(sys.argv[1], speed)).to_string(index=False))
@@ -0,0 +1,179 @@
+"""One chat turn without the UI, shared by the chat page and the load test.
+
+A prompt that only asks to score several VINs (is_scoring_request()) is
+answered by batch_turn(): the VINs are scored on the batch pool without the
+agent, and the results are added to the ADK session so follow-up questions
+can use them. Any other prompt goes to agent_turn(), including multi-VIN
+prompts that ask for something else (the agent has predict_warranty_batch).
+Prediction queries for the prompt's VINs are prefetched while Gemini plans
+its tool calls, and Gemini rate limits are retried with backoff.
+
+patch_instruction() applies the chat page's runtime instruction override.
+Callers own the event loop, the request context (and profiling / cassette
+recording around it) and the display; progress reaches the UI through the
+optional on_rows / on_status callbacks.
+"""
+import asyncio
+import logging
+import re
+import sys
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from google.genai import types
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from tools.batch import batch_record, iter_batch_predictions, limit_vins, record_in_session
+from tools.cassette import record_event
+from tools.prefetch import finish_turn, prefetch_for_prompt
+from tools.presentation import batch_summary, render_tool_result, skipped_note
+from tools.vin import VIN_CANDIDATE, find_vin_candidates
+
+log = logging.getLogger(__name__)
+
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 2  # seconds; exponential backoff 2s, 4s, 8s
+
+
+# Words a pure "score these VINs" prompt may contain besides the VINs; any other word goes to the agent
+SCORING_WORDS = frozenset("""
+    score scores scoring rate rank predict prediction predictions check compare assess evaluate
+    risk risks claim claims probability probabilities cost costs warranty warranties
+    what is are the a an of for and to all these those following vin vins vehicle vehicles car cars
+    please me show give get list
+""".split())
+
+
+def is_scoring_request(prompt: str) -> bool:
+    """True if the prompt has two or more VINs and nothing but scoring words around them."""
+    if len(find_vin_candidates(prompt)) < 2:
+        return False
+    return all(word in SCORING_WORDS for word in re.findall(r"[a-z]+", VIN_CANDIDATE.sub(" ", prompt).lower()))
+
+
+INSTRUCTION_OVERRIDE = """
+
+CRITICAL INSTRUCTION Override:
+- You must perform tool calls using the native function calling protocol.
+- DO NOT output a JSON list of tool calls as text.
+- DO NOT write ["{\\"name\\": ...}"].
+- Execute the tool directly by generating a tool call.
+"""
+
+
+def patch_instruction(agent):
+    """Append the tool-calling override the chat page runs with (idempotent).
+
+    Everything that replays or simulates page turns applies it too, so model
+    requests (and their LLM cache / cassette keys) match the page's.
+    """
+    if "CRITICAL INSTRUCTION Override" not in agent.instruction:
+        agent.instruction += INSTRUCTION_OVERRIDE
+
+
+def _no_status(text: str, level: str = "text"):
+    pass
+
+
+def batch_turn(runner, user_id: str, session_id: str, prompt: str, vins: List[str], loop: asyncio.AbstractEventLoop,
+               on_rows: Optional[Callable[[List[dict], int], None]] = None) -> Tuple[dict, str]:
+    """Score several VINs without the agent; returns (predict_warranty_batch record, summary markdown).
+
+    on_rows(rows, total) is called before the first row and after each finished row.
+    """
+    vins, skipped = limit_vins(vins)
+    rows: List[dict] = []
+    if on_rows:
+        on_rows(rows, len(vins))
+    for row in iter_batch_predictions(vins):
+        rows.append(row)
+        if on_rows:
+            on_rows(rows, len(vins))
+    record = batch_record(rows, skipped)
+    summary = batch_summary(record["results"]) + (f"\n\n{skipped_note(skipped)}" if skipped else "")
+    # Keep the agent's conversation complete, so follow-ups ("why is the second one high risk?") have the results
+    loop.run_until_complete(record_in_session(runner, user_id, session_id, prompt, record, summary))
+    return record, summary
+
+
+async def agent_response(runner, user_id: str, session_id: str, prompt: str,
+                         on_status: Callable[..., None] = _no_status) -> Tuple[str, List[tuple], dict]:
+    """Run the agent on one prompt: (agent text, [(tool name, record)], token usage).
+
+    on_status(text, level) reports progress ("text", "info" or "warning"; empty text clears it).
+    """
+    for attempt in range(MAX_RETRIES):
+        text_response = ""
+        tool_results = []  # (tool_name, record) pairs rendered by the presentation layer
+        usage = {"prompt_tokens": 0, "output_tokens": 0}
+        try:
+            # Let's ensure session exists using get_session (or create)
+            session_service = runner.session_service
+            session = await session_service.get_session(app_name=runner.app_name, user_id=user_id, session_id=session_id)
+            if not session:
+                await session_service.create_session(app_name=runner.app_name, user_id=user_id, session_id=session_id)
+
+            events = runner.run_async(user_id=user_id, session_id=session_id,
+                                      new_message=types.UserContent(parts=[types.Part(text=prompt)]))
+            on_status("🤔 Thinking...", "text")
+
+            async for event in events:
+                record_event(event)
+                # Check for tool calls
+                if event.content:
+                    for part in event.content.parts or []:
+                        if part.function_call:
+                            on_status(f"🛠️ Calling tool: `{part.function_call.name}` with `{part.function_call.args}`", "info")
+                        if part.function_response:
+                            tool_results.append((part.function_response.name, part.function_response.response))
+
+                # Accumulate Gemini token usage for this turn
+                if event.usage_metadata:
+                    usage["prompt_tokens"] += event.usage_metadata.prompt_token_count or 0
+                    usage["output_tokens"] += event.usage_metadata.candidates_token_count or 0
+
+                # Capture messages from both 'model' and the agent itself (e.g. 'root_agent')
+                if (event.author == "model" or event.author == runner.agent.name) and event.content:
+                    for part in event.content.parts or []:
+                        if part.text:
+                            text_response += part.text
+
+            on_status("")  # Clear status when done
+            return text_response, tool_results, usage
+
+        except Exception as e:
+            error_str = str(e)
+            # Check if it's a rate limit error (429)
+            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
+                if attempt < MAX_RETRIES - 1:
+                    delay = RETRY_BASE_DELAY * (2 ** attempt)
+                    on_status(f"⏳ Rate limit hit. Retrying in {delay}s... (attempt {attempt + 1}/{MAX_RETRIES})", "warning")
+                    await asyncio.sleep(delay)
+                    continue
+                raise Exception(f"Rate limit exceeded after {MAX_RETRIES} attempts. Please try again in a few minutes.")
+            # Non-rate-limit error, raise immediately
+            raise
+
+    return "", [], {}  # Fallback (shouldn't reach here)
+
+
+def agent_turn(runner, user_id: str, session_id: str, prompt: str, loop: asyncio.AbstractEventLoop,
+               on_status: Callable[..., None] = _no_status) -> Tuple[str, List[tuple], dict]:
+    """agent_response() with the prompt's VIN predictions started while Gemini plans its tool calls.
+
+    The returned usage also holds this turn's prefetch counts under "prefetch"
+    (started / used / cancelled / unused, see tools/prefetch.py).
+    """
+    prefetched = prefetch_for_prompt(prompt)
+    try:
+        agent_text, tool_results, usage = loop.run_until_complete(
+            agent_response(runner, user_id, session_id, prompt, on_status))
+    finally:
+        prefetch = finish_turn(prefetched)
+    return agent_text, tool_results, {**usage, "prefetch": prefetch}
+
+
+def turn_markdown(agent_text: str, tool_results: List[tuple]) -> str:
+    """The agent's text followed by the tool records, rendered locally instead of re-phrased by Gemini."""
+    cards = [render_tool_result(name, result) for name, result in tool_results]
+    return "\n\n---\n\n".join([agent_text] + cards if agent_text else cards)
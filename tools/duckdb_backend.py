@@ -0,0 +1,269 @@
+"""Local BigQuery emulation backed by DuckDB (BIGQUERY_BACKEND=duckdb).
+
+Loads the same synthetic `training_data` / `cost_training_data` that
+setup_bigquery.sql creates, trains equivalent logistic / linear regression
+models in-process, and answers the prediction query templates used by the
+tools (ML.PREDICT over a subquery), so the whole agent and tool stack runs
+offline in milliseconds.
+
+Supported BigQuery ML syntax in a FROM clause: `ML.PREDICT(MODEL <model>,
+(<subquery>))`, `ML.WEIGHTS(MODEL <model>[, STRUCT(true AS standardize)])`
+and `ML.FEATURE_INFO(MODEL <model>)`. BigQuery's `UNNEST(<array>) AS <alias>`
+is rewritten to DuckDB's column alias form. Project-qualified backtick table names are rewritten to the
+local `warranty_data` / `warranty_models` schemas. Versioned model names from
+the model registry (`<model>_v<N>`) train the same model on a resample.
+"""
+import logging
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import BIGQUERY
+
+log = logging.getLogger(__name__)
+
+NUMERIC_FEATURES = ["model_year", "mileage"]
+CATEGORICAL_FEATURES = ["make", "vehicle_type", "state"]
+
+# DuckDB translation of setup_bigquery.sql (arrays are 1-based in DuckDB)
+SETUP_SQL = [
+    "CREATE SCHEMA IF NOT EXISTS warranty_data",
+    """
+    CREATE OR REPLACE TABLE warranty_data.training_data AS
+    SELECT
+      CONCAT('1HGBH41JXMN10', LPAD(CAST(n AS VARCHAR), 4, '0')) AS vin,
+      CASE WHEN n % 3 = 0 THEN TRUE ELSE FALSE END AS has_warranty_claim,
+      CAST(2020 + n % 5 AS BIGINT) AS model_year,
+      ['Honda', 'Toyota', 'Ford', 'Chevrolet', 'BMW'][n % 5 + 1] AS make,
+      ['Sedan', 'SUV', 'Truck', 'Coupe'][n % 4 + 1] AS vehicle_type,
+      CAST(15000 + (n * 123) AS BIGINT) AS mileage,
+      ['CA', 'TX', 'NY', 'FL', 'IL'][n % 5 + 1] AS state,
+      CASE WHEN n % 3 = 0 THEN CAST(n * 47 AS DOUBLE) ELSE 0.0 END AS total_claim_cost
+    FROM range(1, 1001) AS t(n)
+    """,
+    """
+    CREATE OR REPLACE TABLE warranty_data.cost_training_data AS
+    SELECT vin, model_year, make, vehicle_type, mileage, state, total_claim_cost
+    FROM warranty_data.training_data
+    WHERE has_warranty_claim = TRUE
+    """,
+]
+
+# Model name -> (model type, label column, training table), as in setup_bigquery.sql
+MODEL_SPECS = {
+    "claim_occurrence_model": ("LOGISTIC_REG", "has_warranty_claim", "warranty_data.training_data"),
+    "total_cost_model": ("LINEAR_REG", "total_claim_cost", "warranty_data.cost_training_data"),
+}
+
+# Versioned model names from the model registry, e.g. claim_occurrence_model_v2
+_MODEL_VERSION = re.compile(r"^(\w+?)_v(\d+)$")
+_TABLE_REF = re.compile(r"`(?:[\w-]+\.)?(warranty_data|warranty_models)\.(\w+)`")
+_MODEL_ARG = re.compile(r"^\s*MODEL\s+`?(?:[\w-]+\.)*(\w+)`?\s*(?:,\s*(.*))?$", re.IGNORECASE | re.DOTALL)
+_ML_FUNCTION = re.compile(r"ML\.(PREDICT|WEIGHTS|FEATURE_INFO)\s*\(", re.IGNORECASE)
+_UNNEST_ALIAS = re.compile(r"\bUNNEST\((\w+)\)\s+AS\s+(\w+)\b(?!\s*\()", re.IGNORECASE)
+_STANDARDIZE = re.compile(r"\btrue\s+AS\s+standardize\b", re.IGNORECASE)
+
+
+class LocalLinearModel:
+    """Logistic / linear regression over standardized numeric + one-hot categorical features.
+
+    Mirrors BigQuery ML's default preprocessing, so weights have the same
+    meaning as ML.WEIGHTS: numeric weights apply to (x - mean) / stddev and
+    each category has its own weight.
+    """
+
+    def __init__(self, name: str, model_type: str, label: str):
+        self.name = name
+        self.model_type = model_type
+        self.label = label
+        self.means: Dict[str, float] = {}
+        self.stddevs: Dict[str, float] = {}
+        self.numeric_weights: Dict[str, float] = {}
+        self.category_weights: Dict[str, Dict[str, float]] = {}
+        self.intercept = 0.0
+
+    def _design_matrix(self, df: pd.DataFrame) -> Tuple[np.ndarray, list]:
+        columns, names = [], []
+        for col in NUMERIC_FEATURES:
+            columns.append((df[col].astype(float).to_numpy() - self.means[col]) / self.stddevs[col])
+            names.append((col, None))
+        for col in CATEGORICAL_FEATURES:
+            values = df[col].astype(str).to_numpy()
+            for category in self.category_weights[col]:
+                columns.append((values == category).astype(float))
+                names.append((col, category))
+        return np.column_stack(columns), names
+
+    def fit(self, df: pd.DataFrame) -> "LocalLinearModel":
+        from sklearn.linear_model import LinearRegression, LogisticRegression
+
+        for col in NUMERIC_FEATURES:
+            values = df[col].astype(float)
+            self.means[col] = float(values.mean())
+            self.stddevs[col] = float(values.std()) or 1.0
+        self.category_weights = {col: {c: 0.0 for c in sorted(df[col].astype(str).unique())} for col in CATEGORICAL_FEATURES}
+        X, names = self._design_matrix(df)
+        y = df[self.label].to_numpy()
+        if self.model_type == "LOGISTIC_REG":
+            estimator = LogisticRegression(max_iter=1000).fit(X, y.astype(bool))
+            coefs, self.intercept = estimator.coef_[0], float(estimator.intercept_[0])
+        else:
+            estimator = LinearRegression().fit(X, y.astype(float))
+            coefs, self.intercept = estimator.coef_, float(estimator.intercept_)
+        for (col, category), weight in zip(names, coefs):
+            if category is None:
+                self.numeric_weights[col] = float(weight)
+            else:
+                self.category_weights[col][category] = float(weight)
+        return self
+
+    def decision_function(self, df: pd.DataFrame) -> np.ndarray:
+        """Linear predictor; unseen categories contribute 0."""
+        z = np.full(len(df), self.intercept)
+        for col in NUMERIC_FEATURES:
+            z += self.numeric_weights[col] * (df[col].astype(float).to_numpy() - self.means[col]) / self.stddevs[col]
+        for col in CATEGORICAL_FEATURES:
+            z += df[col].astype(str).map(self.category_weights[col]).fillna(0.0).to_numpy()
+        return z
+
+    def weights_frame(self, standardize: bool = False) -> pd.DataFrame:
+        """ML.WEIGHTS output: one row per input plus __INTERCEPT__.
+
+        Unstandardized weights (the ML.WEIGHTS default) apply to raw numeric
+        values, with the intercept shifted accordingly.
+        """
+        intercept, rows = self.intercept, []
+        for col in NUMERIC_FEATURES:
+            weight = self.numeric_weights[col]
+            if not standardize:
+                weight /= self.stddevs[col]
+                intercept -= weight * self.means[col]
+            rows.append({"processed_input": col, "weight": weight, "category_weights": []})
+        for col in CATEGORICAL_FEATURES:
+            categories = [{"category": c, "weight": w} for c, w in self.category_weights[col].items()]
+            rows.append({"processed_input": col, "weight": None, "category_weights": categories})
+        rows.append({"processed_input": "__INTERCEPT__", "weight": intercept, "category_weights": []})
+        return pd.DataFrame(rows)
+
+    def feature_info_frame(self) -> pd.DataFrame:
+        """ML.FEATURE_INFO output (only the statistics the local model keeps)."""
+        rows = [{"input": col, "mean": self.means[col], "stddev": self.stddevs[col], "category_count": None}
+                for col in NUMERIC_FEATURES]
+        rows += [{"input": col, "mean": None, "stddev": None, "category_count": len(self.category_weights[col])}
+                 for col in CATEGORICAL_FEATURES]
+        return pd.DataFrame(rows)
+
+    def predict(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Input rows plus BigQuery ML's predicted_<label> columns."""
+        out = df.copy()
+        z = self.decision_function(df) if len(df) else np.zeros(0)
+        if self.model_type == "LOGISTIC_REG":
+            prob = 1.0 / (1.0 + np.exp(-z))
+            out[f"predicted_{self.label}"] = prob >= 0.5
+            out["__prob_true"] = prob  # expanded into the _probs struct array in SQL
+        else:
+            out[f"predicted_{self.label}"] = z
+        return out
+
+
+class DuckDBBackend:
+    """Single DuckDB connection holding the synthetic tables and trained models."""
+
+    def __init__(self, path: str = BIGQUERY["duckdb_path"]):
+        self._con = duckdb.connect(path)
+        self._lock = threading.Lock()
+        self.models: Dict[str, LocalLinearModel] = {}
+        for statement in SETUP_SQL:
+            self._con.execute(statement)
+
+    def model(self, name: str) -> LocalLinearModel:
+        if name not in self.models:
+            base, version = name, None
+            versioned = _MODEL_VERSION.match(name)
+            if name not in MODEL_SPECS and versioned:
+                base, version = versioned.group(1), int(versioned.group(2))
+            if base not in MODEL_SPECS:
+                raise ValueError(f"404 Not found: Model warranty_models.{name}")
+            model_type, label, table = MODEL_SPECS[base]
+            df = self._con.execute(f"SELECT * FROM {table}").df()
+            if version is not None:
+                # Stand-in for a retrained version: a bootstrap resample, so versions differ slightly
+                df = df.sample(frac=1.0, replace=True, random_state=version).reset_index(drop=True)
+            self.models[name] = LocalLinearModel(name, model_type, label).fit(df)
+            log.info("Trained local %s model %s on %d rows", model_type, name, len(df))
+        return self.models[name]
+
+    def _rewrite_ml_functions(self, sql: str, registered: list) -> str:
+        """Replace each ML.PREDICT / ML.WEIGHTS / ML.FEATURE_INFO(...) with a registered DataFrame holding its output."""
+        while True:
+            match = _ML_FUNCTION.search(sql)
+            if not match:
+                return sql
+            depth, end = 1, match.end()
+            while depth:
+                if end >= len(sql):
+                    raise ValueError(f"Unbalanced parentheses in {match.group(0)}")
+                depth += {"(": 1, ")": -1}.get(sql[end], 0)
+                end += 1
+            function = match.group(1).upper()
+            args = _MODEL_ARG.match(sql[match.end():end - 1])
+            if not args or (function == "PREDICT" and not args.group(2)):
+                raise ValueError(f"Unsupported ML.{function} arguments; expected MODEL <name>[, ...]")
+            model = self.model(args.group(1))
+            view = f"__ml_{function.lower()}_{len(registered)}"
+            if function == "WEIGHTS":
+                output = model.weights_frame(standardize=bool(_STANDARDIZE.search(args.group(2) or "")))
+            elif function == "FEATURE_INFO":
+                output = model.feature_info_frame()
+            else:
+                subquery = args.group(2).strip()
+                if subquery.startswith("(") and subquery.endswith(")"):
+                    subquery = subquery[1:-1]
+                output = model.predict(self._con.execute(subquery).df())
+            self._con.register(view, output)
+            registered.append(view)
+            if function == "PREDICT" and model.model_type == "LOGISTIC_REG":
+                replacement = (
+                    f"(SELECT * EXCLUDE (__prob_true), "
+                    f"[{{'label': TRUE, 'prob': __prob_true}}, {{'label': FALSE, 'prob': 1 - __prob_true}}] "
+                    f"AS predicted_{model.label}_probs FROM {view})"
+                )
+            else:
+                replacement = view
+            sql = sql[:match.start()] + replacement + sql[end:]
+
+    def query(self, sql: str) -> pd.DataFrame:
+        sql = _TABLE_REF.sub(r"\1.\2", sql)
+        # BigQuery: UNNEST(probs) AS p (p is the element); DuckDB: UNNEST(probs) AS _p(p)
+        sql = _UNNEST_ALIAS.sub(r"UNNEST(\1) AS _\2(\2)", sql)
+        with self._lock:
+            registered = []
+            try:
+                return self._con.execute(self._rewrite_ml_functions(sql, registered)).df()
+            finally:
+                for view in registered:
+                    self._con.unregister(view)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> DuckDBBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = DuckDBBackend()
+    return _backend
+
+
+def query_duckdb(query: str) -> pd.DataFrame:
+    """Drop-in replacement for bigquery_service.query_bigquery()."""
+    return get_backend().query(query)
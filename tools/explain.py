@@ -0,0 +1,118 @@
+"""Local feature attribution for the claim model.
+
+`claim_occurrence_model` is a logistic regression, so a prediction's log-odds
+are exactly
+
+    intercept + sum(w_i * (x_i - mean_i) / stddev_i)   (numeric inputs)
+              + sum(w_c[category])                     (categorical inputs)
+
+With the standardized weights (ML.WEIGHTS ... standardize) and the training
+statistics (ML.FEATURE_INFO) cached per model version, the contribution of
+every feature is computed in-process for one or many VINs at once, instead of
+running ML.EXPLAIN_PREDICT in the warehouse for every question.
+"""
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import BIGQUERY, EXPLAIN
+from tools.bigquery_service import query_bigquery
+
+log = logging.getLogger(__name__)
+
+INTERCEPT = "__INTERCEPT__"
+
+
+class ModelWeights:
+    """Standardized weights and standardization parameters of one linear model version."""
+
+    def __init__(self, version: str, weights: pd.DataFrame, feature_info: pd.DataFrame):
+        self.version = version
+        info = feature_info.set_index("input")
+        self.intercept = 0.0
+        self.numeric: List[str] = []
+        numeric_weights, means, stddevs = [], [], []
+        self.categorical: Dict[str, Dict[str, float]] = {}
+        for _, row in weights.iterrows():
+            name = row["processed_input"]
+            if name == INTERCEPT:
+                self.intercept = float(row["weight"])
+            elif row["weight"] is not None and not pd.isna(row["weight"]):
+                self.numeric.append(name)
+                numeric_weights.append(float(row["weight"]))
+                means.append(float(info.at[name, "mean"]))
+                stddevs.append(float(info.at[name, "stddev"]) or 1.0)
+            else:
+                self.categorical[name] = {c["category"]: float(c["weight"]) for c in row["category_weights"]}
+        self.numeric_weights = np.array(numeric_weights)
+        self.means = np.array(means)
+        self.stddevs = np.array(stddevs)
+
+    @property
+    def features(self) -> List[str]:
+        return self.numeric + list(self.categorical)
+
+    def contributions(self, features: pd.DataFrame) -> np.ndarray:
+        """Log-odds contribution of every feature (columns in `self.features` order), one row per input row."""
+        columns = []
+        if self.numeric:
+            X = np.column_stack([features[name].to_numpy(dtype=float) for name in self.numeric])
+            columns.append((X - self.means) / self.stddevs * self.numeric_weights)
+        for name, category_weights in self.categorical.items():
+            # Categories unseen in training contribute nothing, as in ML.PREDICT
+            values = features[name].to_numpy()
+            columns.append(np.array([category_weights.get(str(v), 0.0) for v in values])[:, None])
+        return np.hstack(columns) if columns else np.zeros((len(features), 0))
+
+
+_weights: Dict[str, Tuple[float, ModelWeights]] = {}  # version -> (loaded_at, weights)
+_lock = threading.Lock()
+
+
+def get_weights(version: str) -> ModelWeights:
+    """Cached weights for a model version (two small warehouse queries on a miss)."""
+    with _lock:
+        entry = _weights.get(version)
+        if entry is not None and time.time() - entry[0] < EXPLAIN["weights_ttl_seconds"]:
+            return entry[1]
+    model = f"`{BIGQUERY['project']}.warranty_models.{version}`"
+    weights = query_bigquery(f"SELECT * FROM ML.WEIGHTS(MODEL {model}, STRUCT(true AS standardize))")
+    feature_info = query_bigquery(f"SELECT * FROM ML.FEATURE_INFO(MODEL {model})")
+    loaded = ModelWeights(version, weights, feature_info)
+    log.info("Loaded weights for %s: %d features", version, len(loaded.features))
+    with _lock:
+        _weights[version] = (time.time(), loaded)
+    return loaded
+
+
+def explain(weights: ModelWeights, features: pd.DataFrame, top: int = EXPLAIN["top_features"]) -> List[dict]:
+    """Attribution records for each row of `features` (must include a `vin` column).
+
+    Contributions are sorted by absolute size; positive values push the claim
+    probability up, negative values pull it down.
+    """
+    contributions = weights.contributions(features)
+    probabilities = 1.0 / (1.0 + np.exp(-(weights.intercept + contributions.sum(axis=1))))
+    order = np.argsort(-np.abs(contributions), axis=1)[:, :top]
+    names = weights.features
+    vins = features["vin"].tolist()
+    values = {name: features[name].tolist() for name in names}
+    return [
+        {
+            "vin": vins[i],
+            "probability": round(float(probabilities[i]), 4),
+            "intercept": round(weights.intercept, 4),
+            "contributions": [
+                {"feature": names[j], "value": values[names[j]][i], "contribution": round(float(contributions[i, j]), 4)}
+                for j in order[i]
+            ],
+        }
+        for i in range(len(vins))
+    ]
@@ -0,0 +1,105 @@
+"""Response cache for Gemini calls.
+
+Keyed on (model, system instruction, generation config, normalized prompt),
+so deterministic prompts such as "summarize this prediction" are answered
+from memory or disk without spending quota. Entries expire after
+LLM_CACHE["ttl_seconds"]; the on-disk SQLite store is pruned to
+LLM_CACHE["max_entries"] (oldest first) and an in-process LRU of the same
+bound sits in front of it.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import LLM_CACHE
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt or "").strip()
+
+
+def make_key(model: str, system_instruction: str, prompt: str, generation_config: Optional[dict] = None) -> str:
+    payload = json.dumps(
+        [model, normalize_prompt(system_instruction), normalize_prompt(prompt), generation_config or {}],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-process LRU in front of a size- and TTL-bounded SQLite table."""
+
+    def __init__(self, path: Optional[str] = LLM_CACHE["path"], ttl: int = LLM_CACHE["ttl_seconds"],
+                 max_entries: int = LLM_CACHE["max_entries"]):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats = {"hits": 0, "misses": 0}
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute("SELECT created_at, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                entry = tuple(row) if row else None
+            if entry is None or now - entry[0] > self.ttl:
+                self.stats["misses"] += 1
+                return None
+            self._remember(key, entry)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: str, value: str):
+        entry = (time.time(), value)
+        with self._lock:
+            self._remember(key, entry)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)", (key, value, entry[0])
+                    )
+                    self._conn.execute(
+                        "DELETE FROM llm_cache WHERE created_at < ? OR key IN "
+                        "(SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                        (entry[0] - self.ttl, self.max_entries),
+                    )
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide cache, or None when LLM_CACHE is disabled."""
+    global _cache
+    if not LLM_CACHE["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+    return _cache
@@ -2,19 +2,35 @@
 import google.generativeai as genai
 import streamlit as st
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from config import GEMINI_API
+from tools.llm_cache import get_response_cache, make_key
 
 # Configure Gemini API
 if GEMINI_API["api_key"]:
     genai.configure(api_key=GEMINI_API["api_key"])
 
+
+@lru_cache(maxsize=32)
+def _get_model(model_name: str, system_instruction: str) -> genai.GenerativeModel:
+    """Reuse one GenerativeModel per (model, system instruction) instead of building it per call."""
+    return genai.GenerativeModel(
+        model_name=model_name,
+        system_instruction=system_instruction,
+        generation_config=GEMINI_API["generation_config"],
+    )
+
+
 def call_llm(prompt: str, system_message: str = "You are a helpful AI assistant.") -> str:
     """
     Call Gemini API with a prompt and return response.
     
+    Identical requests (same normalized prompt, system instruction, model and
+    generation config) are answered from the response cache.
+    
     Args:
         prompt: User's question or request
         system_message: Optional system instruction
@@ -22,15 +38,21 @@ def call_llm(prompt: str, system_message: str = "You are a helpful AI assistant.
     Returns:
         LLM response as string
     """
+    cache = get_response_cache()
+    key = make_key(GEMINI_API["model"], system_message, prompt, GEMINI_API["generation_config"])
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
     try:
-        # Initialize Gemini model
-        model = genai.GenerativeModel(
-            model_name=GEMINI_API["model"],
-            system_instruction=system_message
-        )
+        # Reuse the Gemini model for this system instruction
+        model = _get_model(GEMINI_API["model"], system_message)
         
         # Generate response
         response = model.generate_content(prompt)
+        if cache is not None:
+            cache.put(key, response.text)
         return response.text
         
     except Exception as e:
@@ -0,0 +1,370 @@
+"""Load and capacity test for one app instance.
+
+Simulated users run the same code a Streamlit session runs in the container
+(one thread per session, a per-session ADK runner, the chat page's turn from
+tools/chat_turn.py) while Gemini and BigQuery are replaced by fakes with
+log-normal latencies (LOADTEST["llm_latency"] / ["query_latency"]). The fake
+BigQuery only replaces the network call: queries still go through
+query_bigquery() (hedging, timeouts, circuit breaker, concurrency limit) and
+return real rows from the DuckDB emulation, so caches, the VIN index and the
+tools behave as in production.
+
+Load is applied in steps of LOADTEST["step_seconds"], one per arrival rate in
+LOADTEST["rates"] (new sessions per minute, Poisson arrivals). A session is
+either a chat user (LOADTEST["turns_per_session"] turns on average, think
+time between turns) or, for LOADTEST["direct_share"] of arrivals, an API
+client calling the prediction functions directly. Each step reports
+throughput, latency percentiles, error rate, peak concurrent sessions and
+memory growth against LOADTEST["slo"]; the first failing step is the
+saturation point. With --seed, arrivals, prompts and each session's simulated
+latencies come from seeded generators (the interleaving of threads is still
+up to the scheduler).
+
+Cloud Run counts each open Streamlit session (a websocket) as one request,
+so the peak concurrent sessions of the last passing step is a safe
+`--concurrency` for an instance of the size the test ran on. Run it inside
+the image with the instance's limits:
+
+    docker run --cpus 1 --memory 2g -e LOG_LEVEL=WARNING <image> python tools/loadtest.py --rates 6,12,24,48
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import BIGQUERY, CASSETTES, GEMINI_API, LLM_CACHE, LOADTEST, WARMER
+
+log = logging.getLogger(__name__)
+
+PROMPTS = {
+    "claim": ["What is the warranty claim risk for VIN {vin}?", "Will {vin} have a warranty claim?"],
+    "cost": ["How much will warranty cost for {vin}?", "Estimate the total warranty cost of VIN {vin}"],
+    "explain": ["Why is VIN {vin} risky?", "Explain the claim risk of {vin}"],
+    "batch": ["Compare these vehicles: {vins}", "Score {vins}"],
+}
+
+
+class LogNormal:
+    """Latency distribution given by its median and 95th percentile."""
+
+    def __init__(self, median: float, p95: float):
+        self.mu = math.log(median)
+        self.sigma = math.log(p95 / median) / 1.645
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(self.mu, self.sigma)
+
+
+# ============================================
+# FAKE BACKENDS
+# ============================================
+
+# The running session's generator for simulated latencies; query threads see it through copy_context()
+_latency_rng: contextvars.ContextVar = contextvars.ContextVar("loadtest_latency_rng", default=random.Random())
+
+
+def _fake_run_query(query: str, fast: bool, timeout: float) -> pd.DataFrame:
+    """Stand-in for bigquery_service._run_query: network latency, then real rows from DuckDB."""
+    from tools.bigquery_service import latencies
+    from tools.duckdb_backend import query_duckdb
+
+    start = time.perf_counter()
+    time.sleep(_query_latency.sample(_latency_rng.get()))
+    result = query_duckdb(query)
+    latencies.record(time.perf_counter() - start)
+    return result
+
+
+def _simulated_llm_class():
+    from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+    from google.genai import types
+    from tools.vin import find_vin_candidates
+
+    class SimulatedLlm(BaseLlm):
+        """Plans one tool call for the VIN in the prompt, then answers in text, after Gemini-like latency."""
+
+        model: str = "simulated-gemini"
+
+        async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+            await asyncio.sleep(_llm_latency.sample(_latency_rng.get()))
+            parts = (llm_request.contents[-1].parts or []) if llm_request.contents else []
+            if any(part.function_response for part in parts):
+                part = types.Part(text="Here is the prediction for the vehicle you asked about.")
+            else:
+                prompt = " ".join(part.text for part in parts if part.text)
+                vins = find_vin_candidates(prompt)
+                lowered = prompt.lower()
+                tool = ("predict_warranty_total_cost" if "cost" in lowered
+                        else "explain_warranty_risk" if "why" in lowered or "explain" in lowered
+                        else "predict_warranty_cost")
+                part = (types.Part(function_call=types.FunctionCall(name=tool, args={"vin": vins[0]})) if vins
+                        else types.Part(text="Please give me a 17-character VIN."))
+            usage = types.GenerateContentResponseUsageMetadata(prompt_token_count=800, candidates_token_count=40,
+                                                               total_token_count=840)
+            yield LlmResponse(content=types.Content(role="model", parts=[part]), usage_metadata=usage)
+
+    return SimulatedLlm
+
+
+_llm_latency = LogNormal(*LOADTEST["llm_latency"])
+_query_latency = LogNormal(*LOADTEST["query_latency"])
+
+
+def _install_fakes():
+    """Point the app at the fake backends (call before the first query or agent import)."""
+    GEMINI_API["api_key"] = GEMINI_API["api_key"] or "loadtest"  # no Gemini calls are made
+    LLM_CACHE["enabled"] = False  # every model call pays the simulated latency
+    CASSETTES["mode"] = "off"
+    WARMER["enabled"] = False
+    BIGQUERY["backend"] = "bigquery"  # keep the production query path; only the network call is fake
+    from tools import bigquery_service
+
+    # Before the agent import: importing tools.tools loads the VIN index, which may query the warehouse
+    bigquery_service._run_query = _fake_run_query
+    from agent_host_frontend.agent import root_agent
+    from tools.chat_turn import patch_instruction
+
+    root_agent.model = _simulated_llm_class()()
+    patch_instruction(root_agent)  # as on the chat page
+
+
+# ============================================
+# SIMULATED USERS
+# ============================================
+
+class LoadTest:
+    """Applies stepped load and collects one sample per chat turn / direct call."""
+
+    def __init__(self, rates: List[float], step_seconds: float, seed: Optional[int] = None):
+        self.rates = rates
+        self.step_seconds = step_seconds
+        self.rng = random.Random(seed)
+        self.samples: List[dict] = []
+        self.steps: List[dict] = []
+        self.step = 0
+        self.active = 0
+        self.stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self.vins: List[str] = []
+
+    def _prompt(self, rng: random.Random):
+        kind = rng.choices(list(LOADTEST["mix"]), weights=list(LOADTEST["mix"].values()))[0]
+        template = rng.choice(PROMPTS[kind])
+        if kind == "batch":
+            return kind, template.format(vins=", ".join(rng.sample(self.vins, rng.randint(3, 8))))
+        return kind, template.format(vin=rng.choice(self.vins))
+
+    def _record(self, kind: str, step: int, seconds: float, ok: bool):
+        with self._lock:
+            self.samples.append({"kind": kind, "step": step, "seconds": seconds, "ok": ok})
+
+    def _chat_turn(self, runner, session_id: str, loop, prompt: str) -> bool:
+        """The chat page's turn without the UI; False if the user saw an error."""
+        from tools.chat_turn import agent_turn, batch_turn, is_scoring_request, turn_markdown
+        from tools.structured_logging import request_context
+        from tools.vin import find_vin_candidates
+
+        with request_context():
+            if is_scoring_request(prompt):
+                record, _ = batch_turn(runner, "loadtest", session_id, prompt, find_vin_candidates(prompt), loop)
+                return all(row["status"] != "error" for row in record["results"])
+            agent_text, tool_results, _ = agent_turn(runner, "loadtest", session_id, prompt, loop)
+            turn_markdown(agent_text, tool_results)
+            return bool(tool_results) and all(result.get("status") != "error" for _, result in tool_results)
+
+    @staticmethod
+    def _open_session(loop):
+        from google.adk.runners import InMemoryRunner
+        from agent_host_frontend.agent import root_agent
+
+        runner = InMemoryRunner(agent=root_agent, app_name="loadtest")  # one per browser session, as on the page
+        session = loop.run_until_complete(runner.session_service.create_session(app_name=runner.app_name, user_id="loadtest"))
+        return runner, session.id
+
+    def _chat_session(self, rng: random.Random):
+        loop = asyncio.new_event_loop()
+        try:
+            runner, session_id = self._open_session(loop)
+            for turn in range(max(1, round(rng.expovariate(1 / LOADTEST["turns_per_session"])))):
+                if turn and self.stop.wait(rng.expovariate(1 / LOADTEST["think_seconds"])):
+                    break
+                kind, prompt = self._prompt(rng)
+                step, start = self.step, time.perf_counter()
+                try:
+                    ok = self._chat_turn(runner, session_id, loop, prompt)
+                except Exception as e:
+                    log.warning("Simulated chat turn failed: %s: %s", type(e).__name__, e)
+                    ok = False
+                self._record(f"chat_{kind}", step, time.perf_counter() - start, ok)
+        finally:
+            loop.close()
+
+    def _direct_session(self, rng: random.Random):
+        from tools.tools import predict_warranty_cost, predict_warranty_total_cost
+
+        for call in range(max(1, round(rng.expovariate(1 / LOADTEST["turns_per_session"])))):
+            if call and self.stop.wait(rng.expovariate(1 / LOADTEST["think_seconds"])):
+                break
+            predict = rng.choice([predict_warranty_cost, predict_warranty_total_cost])
+            step, start = self.step, time.perf_counter()
+            try:
+                ok = predict(rng.choice(self.vins))["status"] != "error"
+            except Exception:
+                ok = False
+            self._record("direct", step, time.perf_counter() - start, ok)
+
+    def _session(self, seed: int):
+        rng = random.Random(seed)
+        _latency_rng.set(random.Random(rng.getrandbits(32)))  # own stream: prompts don't shift latencies
+        with self._lock:
+            self.active += 1
+        try:
+            if rng.random() < LOADTEST["direct_share"]:
+                self._direct_session(rng)
+            else:
+                self._chat_session(rng)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _warm_up(self):
+        """One untimed turn of each kind, so imports, local models and the VIN index are not measured."""
+        loop = asyncio.new_event_loop()
+        try:
+            runner, session_id = self._open_session(loop)
+            for templates in PROMPTS.values():
+                self._chat_turn(runner, session_id, loop, templates[0].format(vin=self.vins[0], vins=", ".join(self.vins[:3])))
+        finally:
+            loop.close()
+
+    def run(self):
+        from tools.duckdb_backend import query_duckdb
+
+        self.vins = query_duckdb("SELECT vin FROM warranty_data.training_data")["vin"].tolist()
+        _latency_rng.set(random.Random(self.rng.getrandbits(32)))
+        self._warm_up()
+        for step, rate in enumerate(self.rates):
+            self.step = step  # turns are attributed to the step in which they start
+            start, rss_start, peak = time.perf_counter(), rss_mb(), self.active
+            next_arrival = start + self.rng.expovariate(rate / 60)
+            while time.perf_counter() < start + self.step_seconds:
+                if time.perf_counter() >= next_arrival:
+                    thread = threading.Thread(target=self._session, args=(self.rng.getrandbits(32),),
+                                              name=f"loadtest-session-{len(self._threads)}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+                    next_arrival += self.rng.expovariate(rate / 60)
+                peak = max(peak, self.active)
+                time.sleep(0.01)
+            self.steps.append({"rate_per_min": rate, "peak_sessions": peak,
+                               "rss_start_mb": rss_start, "rss_end_mb": rss_mb()})
+            print(f"Step {step + 1}/{len(self.rates)} done: {rate:g} sessions/min, {self.active} sessions active", file=sys.stderr)
+        self.stop.set()  # no new turns; in-flight turns finish
+        deadline = time.time() + LOADTEST["drain_seconds"]
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.time()))
+
+
+# ============================================
+# REPORT
+# ============================================
+
+def rss_mb() -> float:
+    """Resident memory of this process (Linux /proc, else peak RSS)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    return round(float(np.percentile(values, pct)), 3) if values else None
+
+
+def report(test: LoadTest, slo: dict = LOADTEST["slo"]) -> dict:
+    """Per-step results against the SLOs, plus the saturation point."""
+    rows = []
+    for step, info in enumerate(test.steps):
+        samples = [s for s in test.samples if s["step"] == step]
+        chat = [s["seconds"] for s in samples if s["kind"].startswith("chat")]
+        direct = [s["seconds"] for s in samples if s["kind"] == "direct"]
+        errors = sum(not s["ok"] for s in samples)
+        row = {
+            "rate_per_min": info["rate_per_min"],
+            "requests": len(samples),
+            "throughput_per_s": round(len(samples) / test.step_seconds, 2),
+            "chat_p50": _percentile(chat, 50),
+            "chat_p95": _percentile(chat, 95),
+            "chat_p99": _percentile(chat, 99),
+            "direct_p95": _percentile(direct, 95),
+            "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+            "peak_sessions": info["peak_sessions"],
+            "rss_mb": round(info["rss_end_mb"], 1),
+            "rss_growth_mb": round(info["rss_end_mb"] - info["rss_start_mb"], 1),
+        }
+        breaches = [name for name, value, limit in (
+            ("chat_p95", row["chat_p95"], slo["chat_p95_seconds"]),
+            ("chat_p99", row["chat_p99"], slo["chat_p99_seconds"]),
+            ("direct_p95", row["direct_p95"], slo["direct_p95_seconds"]),
+            ("error_rate", row["error_rate"], slo["max_error_rate"]),
+        ) if value is not None and value > limit]
+        row["slo"] = "PASS" if not breaches else "FAIL " + ",".join(breaches)
+        rows.append(row)
+    failed = next((i for i, row in enumerate(rows) if row["slo"] != "PASS"), None)
+    passing = rows[:failed] if failed is not None else rows
+    return {
+        "steps": rows,
+        "slo": slo,
+        "saturation_rate_per_min": rows[failed]["rate_per_min"] if failed is not None else None,
+        "max_passing_rate_per_min": passing[-1]["rate_per_min"] if passing else None,
+        "suggested_concurrency": passing[-1]["peak_sessions"] if passing else None,
+        "unfinished_sessions": test.active,
+    }
+
+
+def format_report(result: dict) -> str:
+    lines = [pd.DataFrame(result["steps"]).to_string(index=False), ""]
+    if result["saturation_rate_per_min"] is None:
+        lines.append("No SLO breach: saturation is above the highest tested rate.")
+    else:
+        lines.append(f"Saturation at {result['saturation_rate_per_min']:g} sessions/min.")
+    if result["max_passing_rate_per_min"] is not None:
+        lines.append(f"Sustained {result['max_passing_rate_per_min']:g} sessions/min within SLO with up to "
+                     f"{result['suggested_concurrency']} concurrent sessions (Cloud Run --concurrency).")
+    if result["unfinished_sessions"]:
+        lines.append(f"{result['unfinished_sessions']} sessions were still running after the drain period.")
+    return "\n".join(lines)
+
+
+def _arg(name: str, default):
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
+
+
+if __name__ == "__main__":
+    from tools.structured_logging import setup_logging
+
+    setup_logging()
+    _install_fakes()
+    rates = [float(r) for r in _arg("--rates", ",".join(str(r) for r in LOADTEST["rates"])).split(",")]
+    test = LoadTest(rates, float(_arg("--step", LOADTEST["step_seconds"])),
+                    seed=int(_arg("--seed", 0)) if "--seed" in sys.argv else None)
+    test.run()
+    result = report(test)
+    print(format_report(result))
+    if "--json" in sys.argv:
+        Path(_arg("--json", "")).write_text(json.dumps(result, indent=2))
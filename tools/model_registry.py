@@ -0,0 +1,297 @@
+"""Model version registry with hot swap and shadow scoring.
+
+Maps the logical model names used by the tools (`claim_occurrence_model`,
+`total_cost_model`) to concrete BigQuery ML model versions, e.g.
+`claim_occurrence_model_v2`. The mapping lives in a small JSON file
+(MODEL_REGISTRY["path"]); every process re-reads it when it changes, so
+activating a version takes effect without a restart:
+
+    python tools/model_registry.py activate claim_occurrence_model claim_occurrence_model_v2
+    python tools/model_registry.py shadow claim_occurrence_model claim_occurrence_model_v3 0.1
+    python tools/model_registry.py stats
+
+A shadow version scores a random sample of live requests on a background
+thread, off the critical path: shadow queries bypass the live query pool,
+hedging and circuit breaker, are skipped while the breaker is open, and are
+dropped once MODEL_REGISTRY["shadow_queue_size"] are pending. Latency per version and prediction drift
+between the shadow and active version are recorded in `stats`. Every
+MODEL_REGISTRY["stats_interval_seconds"] each process logs them as a
+structured record and writes a snapshot to MODEL_REGISTRY["stats_dir"];
+`stats` merges the recent snapshots of all processes.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import MODEL_REGISTRY
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MODELS = {
+    "claim_occurrence_model": {"active": "claim_occurrence_model", "shadow": None, "shadow_sample_rate": 0.0},
+    "total_cost_model": {"active": "total_cost_model", "shadow": None, "shadow_sample_rate": 0.0},
+}
+
+_models = dict(DEFAULT_MODELS)
+_loaded_mtime = None
+_last_check = 0.0
+_lock = threading.Lock()
+_shadow_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="shadow")
+_shadow_slots = threading.BoundedSemaphore(MODEL_REGISTRY["shadow_queue_size"])
+_last_flush = time.time()
+
+
+class VersionStats:
+    """Latency and drift counters for one model version."""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=500)
+        self.requests = 0
+        self.shadow_requests = 0
+        self.abs_drift_sum = 0.0
+        self.label_flips = 0
+        self.errors = 0
+        self.shadow_dropped = 0  # shadow samples skipped (queue full or BigQuery degraded)
+
+    def snapshot(self) -> dict:
+        return {**{k: v for k, v in vars(self).items() if k != "latencies"}, "latencies": list(self.latencies)}
+
+    def merge(self, snapshot: dict):
+        """Add another process's counters (latency samples are pooled, newest kept)."""
+        self.latencies.extend(snapshot["latencies"])
+        for key in ("requests", "shadow_requests", "abs_drift_sum", "label_flips", "errors", "shadow_dropped"):
+            setattr(self, key, getattr(self, key) + snapshot.get(key, 0))
+
+    def summary(self) -> dict:
+        ordered = sorted(self.latencies)
+        pct = lambda p: round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 3) if ordered else None
+        return {
+            "requests": self.requests,
+            "p50_s": pct(0.50),
+            "p95_s": pct(0.95),
+            "errors": self.errors,
+            "shadow_requests": self.shadow_requests,
+            "shadow_dropped": self.shadow_dropped,
+            "mean_abs_drift": round(self.abs_drift_sum / self.shadow_requests, 4) if self.shadow_requests else None,
+            "label_flip_rate": round(self.label_flips / self.shadow_requests, 4) if self.shadow_requests else None,
+        }
+
+
+stats = defaultdict(VersionStats)  # version -> VersionStats
+
+
+# ============================================
+# REGISTRY FILE
+# ============================================
+
+def _refresh():
+    """Reload the registry file if it changed (checked at most once a second)."""
+    global _models, _loaded_mtime, _last_check
+    now = time.time()
+    if now - _last_check < 1.0:
+        return
+    _last_check = now
+    path = MODEL_REGISTRY["path"]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return  # no registry file: defaults
+    if mtime == _loaded_mtime:
+        return
+    try:
+        with open(path) as f:
+            loaded = json.load(f)
+    except (OSError, ValueError) as e:
+        log.warning("Could not read model registry %s: %s", path, e)
+        return
+    models = {name: {**DEFAULT_MODELS.get(name, {}), **spec} for name, spec in loaded.items()}
+    with _lock:
+        # Swap the whole mapping at once so readers never see a half-updated registry
+        _models = {**DEFAULT_MODELS, **models}
+        _loaded_mtime = mtime
+    log.info("Model registry loaded", extra={"active_models": {name: spec["active"] for name, spec in _models.items()}})
+
+
+def _save(models: dict):
+    path = Path(MODEL_REGISTRY["path"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(models, indent=2))
+    os.replace(tmp, path)  # atomic for readers in other processes
+
+
+def _current(logical_name: str) -> dict:
+    return _models.get(logical_name) or {"active": logical_name, "shadow": None, "shadow_sample_rate": 0.0}
+
+
+def entry(logical_name: str) -> dict:
+    _refresh()
+    return _current(logical_name)
+
+
+def resolve(logical_name: str) -> str:
+    """Concrete model version currently serving `logical_name`."""
+    return entry(logical_name)["active"]
+
+
+def activate(logical_name: str, version: str):
+    """Hot swap: route all new requests for `logical_name` to `version`."""
+    global _models
+    _refresh()
+    with _lock:
+        models = {**_models, logical_name: {**_current(logical_name), "active": version}}
+        _models = models
+    _save(models)
+
+
+def set_shadow(logical_name: str, version: Optional[str], sample_rate: float = 0.1):
+    """Score `sample_rate` of live requests against `version` in the background (None to stop)."""
+    global _models
+    _refresh()
+    with _lock:
+        models = {**_models, logical_name: {**_current(logical_name), "shadow": version, "shadow_sample_rate": sample_rate if version else 0.0}}
+        _models = models
+    _save(models)
+
+
+# ============================================
+# LATENCY + SHADOW SCORING
+# ============================================
+
+def record_latency(version: str, seconds: float, failed: bool = False):
+    version_stats = stats[version]
+    version_stats.requests += 1
+    version_stats.latencies.append(seconds)
+    if failed:
+        version_stats.errors += 1
+    _maybe_flush()
+
+
+@contextmanager
+def timed(version: str):
+    """Record the latency (and failure) of one scoring call against `version`."""
+    start = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        record_latency(version, time.perf_counter() - start, failed)
+
+
+def maybe_shadow(logical_name: str, vin: str, active_result: Optional[dict],
+                 score: Callable[[str, str], Optional[dict]], value_key: str):
+    """Sample this request for shadow scoring; never blocks or fails the caller.
+
+    `score(vin, version, background=True)` produces a record like the active
+    one; `value_key` is the numeric field compared for drift ("probability"
+    or "cost_usd").
+    """
+    from tools.bigquery_service import breaker
+
+    current = entry(logical_name)
+    shadow_version = current.get("shadow")
+    if not shadow_version or active_result is None or random.random() >= current.get("shadow_sample_rate", 0.0):
+        return
+    # Live traffic first: no shadows while BigQuery is degraded or while earlier shadows are still queued
+    if breaker.opened_at is not None or not _shadow_slots.acquire(blocking=False):
+        stats[shadow_version].shadow_dropped += 1
+        return
+    future = _shadow_executor.submit(contextvars.copy_context().run, _shadow_score, shadow_version, vin,
+                                     active_result, score, value_key)
+    future.add_done_callback(lambda _: _shadow_slots.release())
+
+
+def _shadow_score(version: str, vin: str, active_result: dict, score, value_key: str):
+    try:
+        shadow_result = score(vin, version, background=True)  # records its own latency via timed()
+    except Exception as e:
+        log.warning("Shadow scoring with %s failed: %s", version, e, extra={"vin": vin})
+        return
+    if shadow_result is None:
+        return
+    version_stats = stats[version]
+    version_stats.shadow_requests += 1
+    version_stats.abs_drift_sum += abs(float(shadow_result[value_key]) - float(active_result[value_key]))
+    if "label" in active_result and shadow_result.get("label") != active_result["label"]:
+        version_stats.label_flips += 1
+
+
+# ============================================
+# STATS ACROSS PROCESSES
+# ============================================
+
+def _snapshot_path() -> Path:
+    return Path(MODEL_REGISTRY["stats_dir"]) / f"{socket.gethostname()}-{os.getpid()}.json"
+
+
+def flush_stats():
+    """Log this process's per-version stats and write them where the `stats` command reads them."""
+    if not stats:
+        return
+    log.info("Model version stats", extra={"model_stats": stats_summary()})
+    path = _snapshot_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({version: s.snapshot() for version, s in list(stats.items())}))
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning("Could not write model stats to %s: %s", path, e)
+
+
+def _maybe_flush():
+    global _last_flush
+    now = time.time()
+    if now - _last_flush < MODEL_REGISTRY["stats_interval_seconds"]:
+        return
+    _last_flush = now
+    _shadow_executor.submit(flush_stats)  # file I/O off the request path
+
+
+atexit.register(flush_stats)
+
+
+def stats_summary() -> dict:
+    """This process's per-version latency and drift summary."""
+    return {version: version_stats.summary() for version, version_stats in stats.items()}
+
+
+def merged_stats_summary() -> dict:
+    """Per-version summary over the recent snapshots of all processes."""
+    merged = defaultdict(VersionStats)
+    cutoff = time.time() - MODEL_REGISTRY["stats_max_age_seconds"]
+    for path in Path(MODEL_REGISTRY["stats_dir"]).glob("*.json"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                continue
+            for version, snapshot in json.loads(path.read_text()).items():
+                merged[version].merge(snapshot)
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Skipping model stats snapshot %s: %s", path, e)
+    return {version: version_stats.summary() for version, version_stats in merged.items()}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "show"
+    if command == "activate":
+        activate(sys.argv[2], sys.argv[3])
+    elif command == "shadow":
+        set_shadow(sys.argv[2], None if sys.argv[3] == "off" else sys.argv[3], float(sys.argv[4]) if len(sys.argv) > 4 else 0.1)
+    elif command == "stats":
+        print(json.dumps(merged_stats_summary(), indent=2))
+    _refresh()
+    print(json.dumps(_models, indent=2))
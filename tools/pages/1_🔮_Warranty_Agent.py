@@ -1,10 +1,10 @@
-
 import streamlit as st
 import asyncio
 import sys
 from pathlib import Path
 import logging
 import json
+import uuid
 import re
 
 # Add project root to sys.path to find agent_host_frontend
@@ -15,18 +15,24 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from agent_host_frontend.agent import root_agent
 from google.adk.runners import InMemoryRunner
-from google.genai import types
+from config import DEBUG
+from tools.chat_turn import agent_turn, batch_turn, is_scoring_request, patch_instruction, turn_markdown
+from tools.presentation import batch_table, token_savings
+from tools.vin import find_vin_candidates
+from tools.profiling import profile_turn, should_profile
+from tools.cassette import record_turn
+from tools.structured_logging import request_context
+
+log = logging.getLogger(__name__)
 
-# Runtime patch to force proper tool usage without modifying agent.py
-if "CRITICAL INSTRUCTION Override" not in root_agent.instruction:
-    root_agent.instruction += """
+# Runtime patch to force proper tool usage without modifying agent.py (see chat_turn).
+# cache_resource runs it once per process instead of re-checking on every rerun.
+@st.cache_resource
+def patch_agent_instruction():
+    patch_instruction(root_agent)
+    return True
 
-CRITICAL INSTRUCTION Override:
-- You must perform tool calls using the native function calling protocol.
-- DO NOT output a JSON list of tool calls as text.
-- DO NOT write ["{\\"name\\": ...}"].
-- Execute the tool directly by generating a tool call.
-"""
+patch_agent_instruction()
 
 def clean_adk_response(text: str) -> str:
     """Cleans up the ADK response, verifying json or boxed formatting."""
@@ -94,117 +100,160 @@ if "adk_runner" not in st.session_state:
         st.session_state.adk_runner = InMemoryRunner(agent=root_agent)
         st.session_state.session_id = "streamlit_session_v1"
         st.session_state.user_id = "streamlit_user"
+        st.session_state.cassette_id = uuid.uuid4().hex[:12]  # file name for recorded turns of this browser session
         st.success("ADK Agent Initialized Successfully")
     except Exception as e:
         st.error(f"Failed to initialize ADK Agent: {e}")
 
-# Display chat messages from history on app rerun
-for message in st.session_state.messages:
+HISTORY_RECENT = 10  # newest messages rendered individually on a full rerun
+HISTORY_PAGE_SIZE = 20  # older messages are grouped into cached, paginated blocks
+
+
+def render_message(message: dict):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        if message.get("table"):
+            st.dataframe(message["table"], use_container_width=True, hide_index=True)
+        if DEBUG and message.get("usage"):
+            st.caption(message["usage"])
 
-# React to user input
-if prompt := st.chat_input("Ask the ADK Agent..."):
-    # Display user message in chat message container
-    st.chat_message("user").markdown(prompt)
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
-
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        status_placeholder = st.empty() # Placeholder for tool status
-        full_response = ""
-        
-        # Async function to communicate with ADK
-        async def get_adk_response():
-            runner = st.session_state.adk_runner
-            text_response = ""
-            max_retries = 3
-            base_delay = 2  # seconds
-            
-            for attempt in range(max_retries):
-                try:
-                    # Let's ensure session exists using get_session (or create)
-                    session_service = runner.session_service
-                    session = await session_service.get_session(
-                        app_name=runner.app_name, 
-                        user_id=st.session_state.user_id, 
-                        session_id=st.session_state.session_id
-                    )
-                    if not session:
-                        await session_service.create_session(
-                            app_name=runner.app_name,
-                            user_id=st.session_state.user_id,
-                            session_id=st.session_state.session_id
-                        )
-
-                    events = runner.run_async(
-                        user_id=st.session_state.user_id,
-                        session_id=st.session_state.session_id,
-                        new_message=types.UserContent(parts=[types.Part(text=prompt)])
-                    )
-                    
-                    status_placeholder.text("🤔 Thinking...")
-                    
-                    async for event in events:
-                        # Check for tool calls
-                        if event.content:
-                            for part in event.content.parts:
-                                if part.function_call:
-                                    tool_name = part.function_call.name
-                                    # Convert args to string if possible for display
-                                    args = part.function_call.args
-                                    status_placeholder.info(f"🛠️ Calling tool: `{tool_name}` with `{args}`")
-
-                        # Capture messages from both 'model' and the agent itself (e.g. 'root_agent')
-                        # Filter out tool calls/responses if only final text is desired
-                        if (event.author == 'model' or event.author == runner.agent.name) and event.content:
-                            for part in event.content.parts:
-                                if part.text:
-                                    text_response += part.text
-                    
-                    status_placeholder.empty() # Clear status when done
-                    cleaned_response = clean_adk_response(text_response)
-                    return cleaned_response
-                    
-                except Exception as e:
-                    error_str = str(e)
-                    # Check if it's a rate limit error (429)
-                    if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
-                        if attempt < max_retries - 1:
-                            # Exponential backoff: 2s, 4s, 8s
-                            delay = base_delay * (2 ** attempt)
-                            status_placeholder.warning(f"⏳ Rate limit hit. Retrying in {delay}s... (attempt {attempt + 1}/{max_retries})")
-                            await asyncio.sleep(delay)
-                            text_response = ""  # Reset for retry
-                            continue
-                        else:
-                            # Final attempt failed
-                            raise Exception(f"Rate limit exceeded after {max_retries} attempts. Please try again in a few minutes.")
-                    else:
-                        # Non-rate-limit error, raise immediately
-                        raise
-            
-            return ""  # Fallback (shouldn't reach here)
 
-        try:
-            # Run the async loop - use existing event loop if available
+@st.cache_data(max_entries=256, show_spinner=False)
+def history_block(page: tuple) -> str:
+    """Markdown for one page of older (role, content, table) messages; pages never change once full."""
+    parts = []
+    for role, content, table in page:
+        speaker = "🧑 **You**" if role == "user" else "🤖 **Agent**"
+        text = content
+        if table:
+            header = list(table[0])
+            text += "\n\n| " + " | ".join(header) + " |\n|" + "---|" * len(header) + "\n"
+            text += "\n".join("| " + " | ".join("" if row[h] is None else str(row[h]) for h in header) + " |" for row in table)
+        parts.append(f"{speaker}\n\n{text}")
+    return "\n\n---\n\n".join(parts)
+
+
+# Display chat history on a full rerun: older messages as cached pages, newest individually.
+# Turns handled by the chat fragment below only re-run the fragment, not this history.
+messages = st.session_state.messages
+older, recent = messages[:-HISTORY_RECENT], messages[-HISTORY_RECENT:]
+if older:
+    pages = [older[i:i + HISTORY_PAGE_SIZE] for i in range(0, len(older), HISTORY_PAGE_SIZE)]
+    with st.expander(f"Earlier conversation ({len(older)} messages)"):
+        page_no = st.number_input("Page", min_value=1, max_value=len(pages), value=len(pages), step=1) if len(pages) > 1 else 1
+        page = pages[page_no - 1]
+        st.markdown(history_block(tuple((m["role"], m["content"], tuple(m.get("table") or ())) for m in page)))
+for message in recent:
+    render_message(message)
+st.session_state.rendered_upto = len(messages)
+
+
+def event_loop() -> asyncio.AbstractEventLoop:
+    """The script thread's event loop (reused across turns, created if missing or closed)."""
+    try:
+        loop = asyncio.get_event_loop()
+        if loop.is_closed():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop
+
+
+@st.fragment
+def chat_area():
+    """One chat turn. Submitting a prompt re-runs only this fragment, not the whole page."""
+    # Messages from earlier fragment runs that the last full rerun hasn't rendered yet
+    for message in st.session_state.messages[st.session_state.rendered_upto:]:
+        render_message(message)
+
+    # React to user input. Inside a fragment the input would render inline, between history and
+    # new turns; st.bottom pins it below the page while submitting still re-runs only the fragment.
+    with st.bottom:
+        prompt = st.chat_input("Ask the ADK Agent...")
+    if prompt:
+        # Display user message in chat message container
+        st.chat_message("user").markdown(prompt)
+        # Add user message to chat history
+        st.session_state.messages.append({"role": "user", "content": prompt})
+
+    if prompt:
+        with st.chat_message("assistant"):
+            message_placeholder = st.empty()
+            status_placeholder = st.empty() # Placeholder for tool status
+            table_placeholder = st.empty()  # Streamed rows of a multi-VIN batch
+
+            def show_status(text: str, level: str = "text"):
+                if text:
+                    getattr(status_placeholder, level)(text)
+                else:
+                    status_placeholder.empty()
+
+            def show_rows(rows, total):
+                if rows:
+                    table_placeholder.dataframe(batch_table(rows), use_container_width=True, hide_index=True)
+                else:
+                    status_placeholder.markdown(f"Scoring {total} VINs...")
+
+            # Only "score these VINs" prompts skip the agent; anything else about several VINs
+            # ("why is the second one risky?") goes to the agent, which has predict_warranty_batch
+            scoring = is_scoring_request(prompt)
             try:
-                loop = asyncio.get_event_loop()
-                if loop.is_closed():
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            
-            full_response = loop.run_until_complete(get_adk_response())
-            message_placeholder.markdown(full_response)
-            
-            # Add assistant response to chat history
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
-            
-        except Exception as e:
-            st.error(f"Error communicating with agent: {e}")
-            logging.error(e, exc_info=True)
-            # print(asdf)
+                # Opt-in sampling profile of the whole turn (PROFILE_TURNS, ?profile=1 or X-Profile header)
+                profiling = should_profile(st.query_params, st.context.headers)
+                # Slow turns are recorded to a replayable cassette when RECORD_SESSIONS is set
+                # One request id per turn: logs, tool calls and BigQuery job labels all carry it
+                with request_context() as turn_id, \
+                        record_turn(st.session_state.cassette_id, prompt, kind="batch" if scoring else "agent"), \
+                        profile_turn("chat_turn", enabled=profiling) as profile:
+                    if scoring:
+                        # Fan out straight to the prediction backend (bounded concurrency) and stream
+                        # rows into a sortable table as they finish, instead of a Gemini round trip
+                        record, summary = batch_turn(
+                            st.session_state.adk_runner, st.session_state.user_id, st.session_state.session_id,
+                            prompt, find_vin_candidates(prompt), event_loop(), on_rows=show_rows)
+                    else:
+                        agent_text, tool_results, usage = agent_turn(
+                            st.session_state.adk_runner, st.session_state.user_id, st.session_state.session_id,
+                            prompt, event_loop(), on_status=show_status)
+
+                if scoring:
+                    table = batch_table(record["results"])
+                    status_placeholder.empty()
+                    table_placeholder.dataframe(table, use_container_width=True, hide_index=True)
+                    message_placeholder.markdown(summary)
+                    st.session_state.messages.append({"role": "assistant", "content": summary, "table": table})
+                else:
+                    full_response = turn_markdown(clean_adk_response(agent_text), tool_results)
+                    message_placeholder.markdown(full_response)
+
+                    saved = sum(token_savings(name, result) for name, result in tool_results)
+                    prefetch = usage.get("prefetch", {})
+                    usage_text = (f"Tokens this turn: {usage.get('prompt_tokens', 0)} in / {usage.get('output_tokens', 0)} out · "
+                                  f"~{saved} saved by compact tool records · "
+                                  f"prefetch used {prefetch.get('used', 0)}/{prefetch.get('started', 0)}, "
+                                  f"cancelled {prefetch.get('cancelled', 0)}, unused {prefetch.get('unused', 0)} · "
+                                  f"request {turn_id}")
+                    with request_context(turn_id):
+                        log.info("Turn finished", extra={"usage": usage, "tokens_saved": saved})
+                    if DEBUG:
+                        st.caption(usage_text)
+                    # Add assistant response to chat history
+                    st.session_state.messages.append({"role": "assistant", "content": full_response, "usage": usage_text})
+                if profile:
+                    hot = ", ".join(f"{frame} {share:.0%}" for frame, share in profile[0].hotspots(3))
+                    st.caption(f"⏱️ Turn profiled ({profile[0].wall_seconds:.2f}s) → `{profile[0].path}` · hot spots: {hot}")
+
+            except Exception as e:
+                status_placeholder.empty()
+                st.error(f"Error scoring VINs: {e}" if scoring else f"Error communicating with agent: {e}")
+                log.exception("Error scoring VINs" if scoring else "Error communicating with agent")
+
+    # The fragment re-renders every message the last full rerun hasn't paginated yet;
+    # once that backlog reaches HISTORY_RECENT, one full rerun folds it into the cached pages.
+    if len(st.session_state.messages) - st.session_state.rendered_upto >= HISTORY_RECENT:
+        st.rerun(scope="app")
+
+
+chat_area()
@@ -0,0 +1,130 @@
+import streamlit as st
+import plotly.express as px
+import sys
+from pathlib import Path
+
+# We are in tools/pages/; project root is two levels up
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import PORTFOLIO
+from tools.portfolio import downsample, last_refresh, load_aggregates, top_categories
+from tools.presentation import RISK_ICONS
+from tools.structured_logging import request_context
+
+TIER_COLORS = {"HIGH": "#d62728", "MEDIUM": "#ff7f0e", "LOW": "#2ca02c"}
+TIER_ORDER = ["HIGH", "MEDIUM", "LOW"]
+
+
+@st.cache_data(ttl=PORTFOLIO["freshness_seconds"], show_spinner=False)
+def refreshed_at() -> str:
+    """Time of the last aggregate refresh, re-checked every few minutes."""
+    with request_context():
+        return last_refresh()
+
+
+@st.cache_data(max_entries=2, show_spinner="Loading portfolio...")
+def portfolio_data(refreshed: str) -> dict:
+    """Aggregates of one refresh (its timestamp is the cache key; every viewer shares it)."""
+    with request_context():
+        return load_aggregates()
+
+
+st.set_page_config(page_title="Risk Portfolio", page_icon="📊", layout="wide")
+
+st.title("📊 Fleet Risk Portfolio")
+
+try:
+    data = portfolio_data(refreshed_at())
+except Exception as e:
+    st.error(f"Portfolio aggregates are not available yet: {e}")
+    st.info("Run `python tools/portfolio.py` to build them.")
+    st.stop()
+
+segments, histogram, top_vins = data["segments"], data["histogram"], data["top_vins"]
+if segments.empty:
+    st.warning("The portfolio aggregates are empty.")
+    st.stop()
+
+# Filters work on the aggregates in memory; no query per interaction
+with st.sidebar:
+    st.header("Filters")
+    makes = st.multiselect("Make", sorted(segments["make"].unique()))
+    states = st.multiselect("State", sorted(segments["state"].unique()))
+if makes:
+    segments, top_vins = segments[segments["make"].isin(makes)], top_vins[top_vins["make"].isin(makes)]
+if states:
+    segments, top_vins = segments[segments["state"].isin(states)], top_vins[top_vins["state"].isin(states)]
+
+vehicles = int(segments["vehicles"].sum())
+by_tier = segments.groupby("risk_tier")["vehicles"].sum().reindex(TIER_ORDER, fill_value=0)
+st.caption(f"{vehicles:,} vehicles · aggregates refreshed {segments['refreshed_at'].max():%Y-%m-%d %H:%M} UTC")
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Vehicles", f"{vehicles:,}")
+col2.metric(f"{RISK_ICONS['HIGH']} High risk", f"{int(by_tier['HIGH']):,}",
+            f"{by_tier['HIGH'] / vehicles:.1%} of fleet" if vehicles else None, delta_color="off")
+col3.metric("Avg claim probability", f"{segments['probability_sum'].sum() / vehicles:.1%}" if vehicles else "—")
+col4.metric("Expected claim cost", f"${segments['expected_cost_usd'].sum():,.0f}")
+
+st.divider()
+
+# Risk tier distribution
+col1, col2 = st.columns([1, 2])
+with col1:
+    st.subheader("Risk tiers")
+    fig = px.pie(by_tier.reset_index(), names="risk_tier", values="vehicles", color="risk_tier",
+                 color_discrete_map=TIER_COLORS, category_orders={"risk_tier": TIER_ORDER}, hole=0.4)
+    st.plotly_chart(fig, use_container_width=True)
+with col2:
+    st.subheader("Claim probability distribution")
+    fig = px.bar(histogram, x="probability_bucket", y="vehicles", color="risk_tier",
+                 color_discrete_map=TIER_COLORS, category_orders={"risk_tier": TIER_ORDER},
+                 labels={"probability_bucket": "Claim probability", "vehicles": "Vehicles"})
+    fig.update_layout(bargap=0.05, xaxis_tickformat=".0%")
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption("Whole fleet (filters do not apply)")
+
+# Expected cost by segment
+st.subheader("Expected claim cost")
+col1, col2, col3 = st.columns(3)
+for col, column, label in ((col1, "make", "Make"), (col2, "state", "State")):
+    with col:
+        fig = px.bar(top_categories(segments, column, "expected_cost_usd"), x=column, y="expected_cost_usd",
+                     labels={column: label, "expected_cost_usd": "Expected cost (USD)"})
+        st.plotly_chart(fig, use_container_width=True)
+with col3:
+    by_year = segments.groupby(["model_year", "risk_tier"], as_index=False)["expected_cost_usd"].sum()
+    fig = px.bar(by_year, x="model_year", y="expected_cost_usd", color="risk_tier",
+                 color_discrete_map=TIER_COLORS, category_orders={"risk_tier": TIER_ORDER},
+                 labels={"model_year": "Model year", "expected_cost_usd": "Expected cost (USD)"})
+    st.plotly_chart(fig, use_container_width=True)
+
+# Top-risk vehicles
+st.subheader("Top-risk vehicles")
+col1, col2 = st.columns([1, 1])
+with col1:
+    points = downsample(top_vins, "expected_cost_usd")
+    fig = px.scatter(points, x="claim_probability", y="predicted_cost_usd", color="risk_tier",
+                     color_discrete_map=TIER_COLORS, category_orders={"risk_tier": TIER_ORDER},
+                     hover_data=["vin", "make", "model_year", "state"],
+                     labels={"claim_probability": "Claim probability", "predicted_cost_usd": "Predicted cost (USD)"})
+    fig.update_layout(xaxis_tickformat=".0%")
+    st.plotly_chart(fig, use_container_width=True)
+    note = f"{len(points):,} of {len(top_vins):,} vehicles plotted" if len(points) < len(top_vins) else ""
+    if makes or states:
+        note = (f"{note} · " if note else "") + (
+            f"filtered from the fleet-wide top {PORTFOLIO['top_vins']:,} by expected cost, not ranked per segment")
+    if note:
+        st.caption(note)
+with col2:
+    table = top_vins.sort_values("expected_cost_usd", ascending=False).head(100).assign(
+        risk=lambda df: df["risk_tier"].map(lambda tier: f"{RISK_ICONS[tier]} {tier}"))
+    st.dataframe(
+        table[["vin", "make", "model_year", "state", "risk", "claim_probability", "predicted_cost_usd", "expected_cost_usd"]],
+        use_container_width=True, hide_index=True,
+        column_config={
+            "claim_probability": st.column_config.NumberColumn("Probability", format="percent"),
+            "predicted_cost_usd": st.column_config.NumberColumn("Cost if claimed", format="dollar"),
+            "expected_cost_usd": st.column_config.NumberColumn("Expected cost", format="dollar"),
+        },
+    )
@@ -0,0 +1,170 @@
+"""Fleet risk portfolio: precomputed aggregates for the dashboard page.
+
+Scoring millions of VINs per page view is out of the question, so a
+scheduled refresh (`python tools/portfolio.py`, e.g. as a daily Cloud Run
+job) scores the whole fleet once with the active model versions from the
+registry and writes small tables. REFRESH_SQL is the only copy of the
+statements:
+
+    fleet_risk_scores          one row per VIN (probability, tier, cost)
+    risk_portfolio_segments    vehicles / expected cost per make, state, model year, tier
+    risk_portfolio_histogram   vehicles per claim probability bucket and tier
+    risk_portfolio_top_vins    the PORTFOLIO["top_vins"] highest expected cost VINs
+
+The page only reads the last three (some ten thousand rows, whatever the
+fleet size) and downsamples the top VINs before plotting. With the DuckDB backend the
+tables are built on first use.
+
+    python tools/portfolio.py    # refresh the aggregates now
+"""
+import contextvars
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import BIGQUERY, PORTFOLIO
+from tools import model_registry
+from tools.bigquery_service import query_bigquery
+
+log = logging.getLogger(__name__)
+
+# Same thresholds as results.risk_tier()
+RISK_TIER_SQL = "CASE WHEN claim_probability >= 0.7 THEN 'HIGH' WHEN claim_probability >= 0.4 THEN 'MEDIUM' ELSE 'LOW' END"
+
+REFRESH_SQL = [
+    # The fleet is training_data in this demo; point both subqueries at the real vehicle table
+    """
+    CREATE OR REPLACE TABLE `{project}.warranty_data.fleet_risk_scores` AS
+    WITH claim AS (
+        SELECT vin, make, state, model_year, vehicle_type,
+            (SELECT p.prob FROM UNNEST(predicted_has_warranty_claim_probs) AS p WHERE p.label) AS claim_probability
+        FROM ML.PREDICT(MODEL `{project}.warranty_models.{claim_model}`,
+            (SELECT * FROM `{project}.warranty_data.training_data`))
+    ),
+    cost AS (
+        SELECT vin, GREATEST(predicted_total_claim_cost, 0) AS predicted_cost_usd
+        FROM ML.PREDICT(MODEL `{project}.warranty_models.{cost_model}`,
+            (SELECT * FROM `{project}.warranty_data.training_data`))
+    )
+    SELECT claim.*, {risk_tier} AS risk_tier, cost.predicted_cost_usd,
+        claim_probability * cost.predicted_cost_usd AS expected_cost_usd,
+        CURRENT_TIMESTAMP AS scored_at
+    FROM claim JOIN cost ON claim.vin = cost.vin
+    """,
+    """
+    CREATE OR REPLACE TABLE `{project}.warranty_data.risk_portfolio_segments` AS
+    SELECT make, state, model_year, risk_tier,
+        COUNT(*) AS vehicles,
+        SUM(claim_probability) AS probability_sum,
+        SUM(predicted_cost_usd) AS predicted_cost_usd,
+        SUM(expected_cost_usd) AS expected_cost_usd,
+        MAX(scored_at) AS refreshed_at
+    FROM `{project}.warranty_data.fleet_risk_scores`
+    GROUP BY make, state, model_year, risk_tier
+    """,
+    """
+    CREATE OR REPLACE TABLE `{project}.warranty_data.risk_portfolio_histogram` AS
+    SELECT LEAST(FLOOR(claim_probability * {bins}), {bins} - 1) / {bins} AS probability_bucket,
+        risk_tier, COUNT(*) AS vehicles
+    FROM `{project}.warranty_data.fleet_risk_scores`
+    GROUP BY 1, 2
+    """,
+    """
+    CREATE OR REPLACE TABLE `{project}.warranty_data.risk_portfolio_top_vins` AS
+    SELECT vin, make, state, model_year, vehicle_type, claim_probability, risk_tier,
+        predicted_cost_usd, expected_cost_usd
+    FROM `{project}.warranty_data.fleet_risk_scores`
+    ORDER BY expected_cost_usd DESC
+    LIMIT {top_vins}
+    """,
+]
+
+TABLES = {
+    "segments": "risk_portfolio_segments",
+    "histogram": "risk_portfolio_histogram",
+    "top_vins": "risk_portfolio_top_vins",
+}
+
+_refresh_lock = threading.Lock()
+_refreshed = False
+
+
+def refresh_aggregates():
+    """Score the fleet with the active model versions and rebuild the aggregate tables."""
+    global _refreshed
+    params = {
+        "project": BIGQUERY["project"],
+        "claim_model": model_registry.resolve("claim_occurrence_model"),
+        "cost_model": model_registry.resolve("total_cost_model"),
+        "risk_tier": RISK_TIER_SQL,
+        "bins": PORTFOLIO["histogram_bins"],
+        "top_vins": PORTFOLIO["top_vins"],
+    }
+    with _refresh_lock:
+        for statement in REFRESH_SQL:
+            query_bigquery(statement.format(**params), fast=False, hedge=False, timeout=BIGQUERY["bulk_timeout_seconds"])
+        _refreshed = True
+    log.info("Risk portfolio aggregates refreshed", extra={"claim_model": params["claim_model"],
+                                                            "cost_model": params["cost_model"]})
+
+
+def _ensure_built():
+    if BIGQUERY["backend"] == "duckdb" and not _refreshed:
+        refresh_aggregates()  # no scheduler offline: build the tables once per process
+
+
+def last_refresh() -> str:
+    """When the aggregates were last rebuilt (a one-row read; the page's cache key)."""
+    _ensure_built()
+    result = query_bigquery(f"SELECT MAX(refreshed_at) AS refreshed_at FROM `{BIGQUERY['project']}.warranty_data.{TABLES['segments']}`")
+    return str(result["refreshed_at"].iloc[0])
+
+
+def load_aggregates() -> Dict[str, pd.DataFrame]:
+    """The three aggregate tables, read in parallel (small reads on the fast path)."""
+    _ensure_built()
+    with ThreadPoolExecutor(max_workers=len(TABLES), thread_name_prefix="portfolio") as pool:
+        futures = {
+            name: pool.submit(contextvars.copy_context().run, query_bigquery,
+                              f"SELECT * FROM `{BIGQUERY['project']}.warranty_data.{table}`")
+            for name, table in TABLES.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+# ============================================
+# DOWNSAMPLING
+# ============================================
+
+def top_categories(df: pd.DataFrame, column: str, value: str, n: int = PORTFOLIO["max_categories"]) -> pd.DataFrame:
+    """Sum `value` per `column`, keeping the n largest groups and folding the rest into "Other"."""
+    totals = df.groupby(column, as_index=False)[value].sum().sort_values(value, ascending=False)
+    if len(totals) <= n:
+        return totals
+    head = totals.head(n - 1)
+    other = pd.DataFrame({column: ["Other"], value: [totals[value].iloc[n - 1:].sum()]})
+    return pd.concat([head, other], ignore_index=True)
+
+
+def downsample(df: pd.DataFrame, sort_by: str, max_points: int = PORTFOLIO["max_points"]) -> pd.DataFrame:
+    """At most max_points rows, evenly spaced along `sort_by` so both extremes and the shape survive."""
+    if len(df) <= max_points:
+        return df
+    ordered = df.sort_values(sort_by, ignore_index=True)
+    positions = pd.Series(range(max_points)) * (len(ordered) - 1) // (max_points - 1)
+    return ordered.iloc[positions.unique()]
+
+
+if __name__ == "__main__":
+    from tools.structured_logging import setup_logging
+
+    setup_logging()
+    refresh_aggregates()
+    for name, df in load_aggregates().items():
+        print(f"{TABLES[name]}: {len(df)} rows")
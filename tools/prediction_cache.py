@@ -0,0 +1,248 @@
+"""Two-level prediction cache shared across Cloud Run instances.
+
+L1 is a bounded in-process LRU that sits in front of an optional L2 store
+shared by every instance:
+
+    memory  - no L2, each process keeps its own cache (default)
+    sqlite  - disk-backed store, for local multi-worker runs
+    redis   - any Redis-compatible server (e.g. Memorystore)
+
+SqliteStore implements the small subset of the Redis API the cache uses
+(get / set with ex & nx / delete), so it doubles as a local stand-in.
+
+Unknown VINs are cached as negative results with a shorter TTL, and a
+per-key lock (in-process plus a short-lived lock key in L2) makes sure
+concurrent requests for the same VIN only run one ML.PREDICT job.
+"""
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import PREDICTION_CACHE
+
+log = logging.getLogger(__name__)
+
+_NEGATIVE = "__not_found__"
+
+
+class SqliteStore:
+    """Disk-backed key/value store with a Redis-compatible get/set/delete."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, key: str, value: str, ex: Optional[float] = None, nx: bool = False) -> bool:
+        expires_at = time.time() + ex if ex else None
+        with self._lock, self._conn:
+            if nx:
+                self._conn.execute("DELETE FROM kv WHERE key = ? AND expires_at < ?", (key, time.time()))
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+                )
+                return cur.rowcount > 0
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+            return True
+
+    def delete(self, key: str) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount
+
+
+def create_store(backend: str = PREDICTION_CACHE["backend"]):
+    """Build the configured L2 store, or None for the in-process-only mode."""
+    if backend == "sqlite":
+        return SqliteStore(PREDICTION_CACHE["sqlite_path"])
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            log.warning("PREDICTION_CACHE_BACKEND=redis but the 'redis' package is not installed - using in-process cache only")
+            return None
+        return redis.Redis.from_url(PREDICTION_CACHE["redis_url"], decode_responses=True, socket_timeout=0.5)
+    return None
+
+
+class PredictionCache:
+    """In-process LRU in front of an optional shared store.
+
+    Values are JSON-serializable prediction records; a loader returning None
+    means "VIN not found" and is cached as a negative result.
+    """
+
+    def __init__(self, namespace: str, store=None, ttl: int = PREDICTION_CACHE["ttl_seconds"],
+                 negative_ttl: int = PREDICTION_CACHE["negative_ttl_seconds"],
+                 max_entries: int = PREDICTION_CACHE["max_entries"]):
+        self.namespace = namespace
+        self.store = store
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._local = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._warmed = set()  # keys loaded by the cache warmer and not requested yet
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "negative_hits": 0, "store_errors": 0,
+                      "warmed": 0, "warmed_used": 0}
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    # ---- L1 -----------------------------------------------------------------
+
+    def _get_local(self, key: str):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _put_local(self, key: str, value, ttl: float):
+        with self._lock:
+            self._local[key] = (time.time() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                evicted, _ = self._local.popitem(last=False)
+                self._warmed.discard(evicted)
+
+    # ---- L2 -----------------------------------------------------------------
+
+    def _get_shared(self, key: str):
+        if self.store is None:
+            return None
+        try:
+            raw = self.store.get(self._key(key))
+        except Exception as e:
+            self.stats["store_errors"] += 1
+            log.warning("Prediction cache store error on get: %s", e)
+            return None
+        if raw is None:
+            return None
+        return (None,) if raw == _NEGATIVE else (json.loads(raw),)
+
+    def _put_shared(self, key: str, value, ttl: float):
+        if self.store is None:
+            return
+        try:
+            raw = _NEGATIVE if value is None else json.dumps(value)
+            self.store.set(self._key(key), raw, ex=int(ttl))
+        except Exception as e:
+            self.stats["store_errors"] += 1
+            log.warning("Prediction cache store error on set: %s", e)
+
+    def _acquire_shared_lock(self, key: str) -> bool:
+        if self.store is None:
+            return True
+        try:
+            return bool(self.store.set(self._key(key) + ":lock", "1", ex=PREDICTION_CACHE["lock_ttl_seconds"], nx=True))
+        except Exception:
+            return True
+
+    def _release_shared_lock(self, key: str):
+        if self.store is not None:
+            try:
+                self.store.delete(self._key(key) + ":lock")
+            except Exception:
+                pass
+
+    # ---- public API ---------------------------------------------------------
+
+    def __contains__(self, key: str) -> bool:
+        return self._get_local(key) is not None or self._get_shared(key) is not None
+
+    def peek(self, key: str) -> Optional[tuple]:
+        """Cached entry without computing: (value,) on a hit, None on a miss."""
+        entry = self._get_local(key)
+        if entry is not None:
+            return (entry[1],)
+        return self._get_shared(key)
+
+    def put(self, key: str, value, warmed: bool = False):
+        """Store a value; `warmed` marks entries loaded ahead of demand (see cache_warmer.py)."""
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._put_local(key, value, ttl)
+        self._put_shared(key, value, ttl)
+        if warmed:
+            with self._lock:
+                self._warmed.add(key)
+            self.stats["warmed"] += 1
+
+    def get_or_compute(self, key: str, loader: Callable[[], Optional[dict]]) -> Tuple[Optional[dict], bool]:
+        """Return (value, cached). Concurrent callers for one key share a single loader run."""
+        entry = self._get_local(key)
+        if entry is not None:
+            self._count_hit("l1_hits", key, entry[1])
+            return entry[1], True
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another thread may have filled the cache while we waited
+            entry = self._get_local(key)
+            if entry is not None:
+                self._count_hit("l1_hits", key, entry[1])
+                return entry[1], True
+
+            shared = self._get_shared(key)
+            if shared is None and not self._acquire_shared_lock(key):
+                # Another instance is computing this key - wait briefly for its result
+                deadline = time.time() + PREDICTION_CACHE["lock_wait_seconds"]
+                while shared is None and time.time() < deadline:
+                    time.sleep(0.05)
+                    shared = self._get_shared(key)
+            if shared is not None:
+                value = shared[0]
+                self._put_local(key, value, self.ttl if value is not None else self.negative_ttl)
+                self._count_hit("l2_hits", key, value)
+                return value, True
+
+            self.stats["misses"] += 1
+            try:
+                value = loader()
+                self.put(key, value)
+                return value, False
+            finally:
+                self._release_shared_lock(key)
+                with self._lock:
+                    self._key_locks.pop(key, None)
+
+    def _count_hit(self, counter: str, key: str, value):
+        self.stats[counter] += 1
+        if value is None:
+            self.stats["negative_hits"] += 1
+        if self._warmed:
+            with self._lock:
+                if key in self._warmed:
+                    self._warmed.discard(key)
+                    self.stats["warmed_used"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self._warmed.clear()
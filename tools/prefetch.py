@@ -0,0 +1,128 @@
+"""Speculative prediction prefetch.
+
+VINs are usually visible in the user's prompt long before Gemini decides to
+call a tool. The chat page calls prefetch_for_prompt() as soon as a prompt
+arrives, which starts the ML.PREDICT queries in a small thread pool while the
+LLM is still planning. When the tool call arrives, take_prefetched() hands
+the work over: the prediction cache's per-key lock makes the tool wait for the
+in-flight query (or read its cached result) instead of starting a new one.
+
+Prefetches that were never picked up are cancelled (if still queued) or left
+to finish into the cache at finish_turn(), which returns the turn's own counts;
+`stats` holds the process-wide totals.
+"""
+import contextvars
+import logging
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import PREFETCH
+
+log = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH["max_workers"], thread_name_prefix="prefetch")
+_inflight: Dict[Tuple[str, str], Future] = {}
+_lock = threading.Lock()
+stats = {"started": 0, "used": 0, "cancelled": 0, "unused": 0}
+
+
+def extract_vins(text: str, limit: int = PREFETCH["max_vins"]) -> List[str]:
+    """Valid, de-duplicated VINs mentioned in free text (in order of appearance)."""
+    from tools.vin import find_vin_candidates, preprocess_vins
+    from tools.vin_index import get_vin_index
+
+    candidates = find_vin_candidates(text)
+    if not candidates:
+        return []
+    rows = preprocess_vins(candidates)
+    index = get_vin_index()
+    known = index.contains_many(rows["vin"]) if index is not None else None
+    vins = []
+    for i, row in rows.iterrows():
+        if known is not None:
+            # The index is authoritative: unknown VINs are answered locally anyway
+            if known[i]:
+                vins.append(row["vin"])
+        elif row["valid"] or row["error"] == "check_digit":
+            vins.append(row["vin"])  # same rule as the tools: check digit mismatches go to the warehouse
+    return list(dict.fromkeys(vins))[:limit]
+
+
+def _loaders():
+    from tools import tools
+    return {
+        "claim": (tools._prediction_cache, tools.CLAIM_MODEL, tools._score_claim),
+        "cost": (tools._cost_cache, tools.COST_MODEL, tools._score_cost),
+    }
+
+
+def prefetch_for_prompt(prompt: str) -> Dict[Tuple[str, str], Future]:
+    """Start prediction queries for the VINs in `prompt`. Returns this turn's prefetches, for finish_turn()."""
+    if not PREFETCH["enabled"]:
+        return {}
+    from tools.tools import cache_key
+
+    loaders = _loaders()
+    started = {}
+    for vin in extract_vins(prompt):
+        for kind in PREFETCH["tools"]:
+            cache, logical_model, score = loaders[kind]
+            version, versioned_key = cache_key(logical_model, vin)
+            key = (kind, vin)
+            if cache.peek(versioned_key) is not None:
+                continue  # already cached, nothing to speculate on
+            with _lock:
+                if key in _inflight:
+                    continue
+                # Runs in a copy of the caller's context so a recorded turn also records its prefetches
+                _inflight[key] = started[key] = _executor.submit(
+                    contextvars.copy_context().run, cache.get_or_compute, versioned_key,
+                    lambda score=score, vin=vin, version=version: score(vin, version),
+                )
+                stats["started"] += 1
+    if started:
+        log.info("Prefetching predictions", extra={"prefetch": list(started)})
+    return started
+
+
+def take_prefetched(kind: str, vin: str) -> bool:
+    """Called by a tool before scoring: claim a matching prefetch, if any.
+
+    A prefetch that is already running keeps going and the tool picks up its
+    result through the cache; one that is still queued is cancelled so the
+    tool runs the query itself straight away.
+    """
+    with _lock:
+        future = _inflight.pop((kind, vin), None)
+    if future is None:
+        return False
+    if future.cancel():
+        stats["cancelled"] += 1
+        return False
+    stats["used"] += 1
+    log.info("Using prefetched %s prediction", kind, extra={"vin": vin})
+    return True
+
+
+def finish_turn(prefetched: Dict[Tuple[str, str], Future]) -> Dict[str, int]:
+    """Drop this turn's prefetches the agent never asked for; returns the turn's prefetch counts."""
+    counts = {"started": len(prefetched), "used": 0, "cancelled": 0, "unused": 0}
+    for key, future in prefetched.items():
+        with _lock:
+            pending = _inflight.get(key) is future
+            if pending:
+                del _inflight[key]
+        if not pending:
+            # Taken by a tool: take_prefetched() used it or cancelled it
+            counts["cancelled" if future.cancelled() else "used"] += 1
+        elif future.cancel():
+            stats["cancelled"] += 1
+            counts["cancelled"] += 1
+        else:
+            stats["unused"] += 1  # already running - it still warms the cache
+            counts["unused"] += 1
+    return counts
@@ -0,0 +1,168 @@
+"""Presentation layer: turns compact tool records into user-facing text.
+
+Used by the Streamlit chat page (and any API wrapper) so that formatting
+never has to round-trip through Gemini.
+"""
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import BATCH
+
+RECOMMENDATIONS = {
+    "HIGH": "This vehicle has a high likelihood of warranty claims. Recommend thorough quality inspection and proactive maintenance planning.",
+    "MEDIUM": "This vehicle shows moderate warranty risk. Standard quality checks recommended.",
+    "LOW": "This vehicle has a low probability of warranty claims. Routine quality process should be sufficient.",
+}
+
+RISK_ICONS = {"HIGH": "🔴", "MEDIUM": "🟠", "LOW": "🟢"}
+
+
+def freshness(scored_at: str) -> str:
+    """Human readable age of a prediction, e.g. 'just now' or '12 min ago'."""
+    try:
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(scored_at)
+    except (TypeError, ValueError):
+        return "unknown"
+    seconds = int(age.total_seconds())
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{seconds // 60} min ago"
+    if seconds < 86400:
+        return f"{seconds // 3600} h ago"
+    return f"{seconds // 86400} d ago"
+
+
+def _footer(result: dict) -> str:
+    """Model version, freshness and VIN-decoded attributes in one muted line."""
+    parts = [f"Model `{result['model_version']}`"]
+    if "scored_at" in result:
+        parts.append(f"scored {freshness(result['scored_at'])}")
+    decoded = result.get("decoded") or {}
+    if decoded:
+        parts.append("decoded from VIN: " + ", ".join(str(decoded[k]) for k in ("make", "model_year", "country") if k in decoded))
+    return "_" + " · ".join(parts) + "_"
+
+
+def render_claim_prediction(result: dict) -> str:
+    """Markdown card for a predict_warranty_cost record."""
+    tier = result["risk_tier"]
+    outcome = "Will likely have warranty claim" if result["label"] else "Unlikely to have warranty claim"
+    return f"""**Warranty Prediction for VIN `{result['vin']}`**
+
+- **Prediction:** {outcome}
+- **Probability:** {result['probability'] * 100:.1f}% chance of warranty claim
+- **Risk Level:** {RISK_ICONS[tier]} {tier} RISK
+
+**Recommendation:** {RECOMMENDATIONS[tier]}
+
+{_footer(result)}"""
+
+
+def render_cost_prediction(result: dict) -> str:
+    """Markdown card for a predict_warranty_total_cost record."""
+    return f"""**Estimated warranty cost for VIN `{result['vin']}`:** {result['cost_usd']:,.2f} USD
+
+{_footer(result)}"""
+
+
+FEATURE_LABELS = {"model_year": "Model year", "make": "Make", "vehicle_type": "Vehicle type",
+                  "mileage": "Mileage", "state": "State"}
+
+
+def render_explanation(result: dict) -> str:
+    """Markdown card for an explain_warranty_risk record."""
+    tier = result["risk_tier"]
+    lines = [f"**Why VIN `{result['vin']}` is {RISK_ICONS[tier]} {tier} risk ({result['probability'] * 100:.1f}%)**", ""]
+    for item in result["contributions"]:
+        direction = "raises" if item["contribution"] > 0 else "lowers"
+        value = f"{item['value']:,}" if isinstance(item["value"], (int, float)) else item["value"]
+        lines.append(f"- **{FEATURE_LABELS.get(item['feature'], item['feature'])}** {value} "
+                     f"{direction} the risk ({item['contribution']:+.2f} log-odds)")
+    lines += ["", _footer(result)]
+    return "\n".join(lines)
+
+
+def batch_table(rows: list) -> list:
+    """Rows of a multi-VIN batch shaped for st.dataframe (sortable columns)."""
+    return [
+        {
+            "VIN": row["vin"],
+            "Risk": f"{RISK_ICONS[row['risk_tier']]} {row['risk_tier']}" if row.get("risk_tier") else "—",
+            "Claim probability (%)": round(row["probability"] * 100, 1) if row.get("probability") is not None else None,
+            "Est. cost (USD)": row.get("cost_usd"),
+            "Note": row.get("error") or "",
+        }
+        for row in rows
+    ]
+
+
+def batch_summary(rows: list) -> str:
+    """One-line summary of a multi-VIN batch, e.g. 'Scored 5 VINs: 🔴 2 HIGH · 🟢 3 LOW'."""
+    tiers = [row["risk_tier"] for row in rows if row.get("risk_tier")]
+    counts = " · ".join(f"{RISK_ICONS[t]} {tiers.count(t)} {t}" for t in ("HIGH", "MEDIUM", "LOW") if t in tiers)
+    failed = len(rows) - len(tiers)
+    return f"Scored {len(rows)} VINs: {counts or 'no predictions'}" + (f" · ⚠️ {failed} without prediction" if failed else "")
+
+
+def skipped_note(skipped: int) -> str:
+    return f"⚠️ Only the first {BATCH['max_vins']} distinct VINs were scored; {skipped} more were left out. Send them in another message."
+
+
+def render_batch(result: dict) -> str:
+    """Markdown table for a predict_warranty_batch record."""
+    lines = [
+        f"**Warranty predictions for {result['count']} VINs**" + (f" ({result['failed']} failed)" if result["failed"] else ""),
+        "",
+        *([skipped_note(result["skipped"]), ""] if result.get("skipped") else []),
+        "| VIN | Risk | Claim probability | Est. cost (USD) | Note |",
+        "|---|---|---|---|---|",
+    ]
+    for row in batch_table(result["results"]):
+        prob = f"{row['Claim probability (%)']:.1f}%" if row["Claim probability (%)"] is not None else "—"
+        cost = f"{row['Est. cost (USD)']:,.2f}" if row["Est. cost (USD)"] is not None else "—"
+        lines.append(f"| `{row['VIN']}` | {row['Risk']} | {prob} | {cost} | {row['Note']} |")
+    return "\n".join(lines)
+
+
+def render_error(result: dict) -> str:
+    return f"⚠️ {result['error_message']}"
+
+
+def render_tool_result(tool_name: str, result: dict) -> str:
+    """Render any tool record; unknown tools fall back to compact JSON."""
+    if not isinstance(result, dict):
+        return str(result)
+    if tool_name == "predict_warranty_batch" and "results" in result:
+        return render_batch(result)
+    if result.get("status") != "success":
+        return render_error(result) if "error_message" in result else str(result)
+    if tool_name == "predict_warranty_cost":
+        return render_claim_prediction(result)
+    if tool_name == "predict_warranty_total_cost":
+        return render_cost_prediction(result)
+    if tool_name == "explain_warranty_risk":
+        return render_explanation(result)
+    return f"```json\n{compact_json(result)}\n```"
+
+
+# ============================================
+# TOKEN ACCOUNTING
+# ============================================
+
+def compact_json(result: dict) -> str:
+    """The wire form the agent actually sees for a tool record."""
+    return json.dumps(result, separators=(",", ":"), default=str)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token estimate (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def token_savings(tool_name: str, result: dict) -> int:
+    """Tokens saved by sending the compact record instead of the rendered prose."""
+    return max(0, estimate_tokens(render_tool_result(tool_name, result)) - estimate_tokens(compact_json(result)))
@@ -0,0 +1,256 @@
+"""Opt-in sampling profiler for agent turns.
+
+Enable for every turn with PROFILE_TURNS=true, or for a single chat turn with
+the `?profile=1` query parameter / `X-Profile: 1` request header.
+
+A background thread samples the stack of the profiled thread every few
+milliseconds (pyinstrument-style, stdlib only), together with pool threads
+(bigquery, prefetch, batch, ...) running work submitted from the turn through
+`contextvars.copy_context().run`; their stacks are rooted at `[<pool>]`. Each turn writes to
+PROFILING["dir"]:
+
+    <timestamp>_<label>.folded   collapsed stacks (flamegraph.pl / speedscope input)
+    <timestamp>_<label>.svg      self-contained flamegraph
+
+`python tools/profiling.py` prints the top hot spots across the last N turns.
+"""
+import concurrent.futures.thread as futures_thread
+import contextvars
+import functools
+import html
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import PROFILING
+
+log = logging.getLogger(__name__)
+
+
+# Set for the duration of a profiled turn; copied into pool work submitted from it
+_profiled_turn: contextvars.ContextVar = contextvars.ContextVar("profiled_turn", default=None)
+
+
+def _work_context(frame) -> Optional[contextvars.Context]:
+    """The context a ThreadPoolExecutor work item runs in, if the thread is running one."""
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == "run" and code.co_filename == futures_thread.__file__:
+            fn = getattr(frame.f_locals.get("self"), "fn", None)
+            if isinstance(fn, functools.partial):  # loop.run_in_executor / asyncio.to_thread
+                fn = fn.func
+            context = getattr(fn, "__self__", None)
+            return context if isinstance(context, contextvars.Context) else None
+        frame = frame.f_back
+    return None
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples a thread's call stack, and pool work submitted from it, at a fixed interval into folded-stack counts."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILING["interval_seconds"]):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="turn-profiler", daemon=True)
+
+    def _run(self):
+        names: Dict[int, str] = {}
+        while not self._stop.is_set():
+            for ident, frame in sys._current_frames().items():
+                root = []
+                if ident != self.thread_id:
+                    if ident == self._thread.ident:
+                        continue
+                    context = _work_context(frame)
+                    if context is None or context.get(_profiled_turn) is not self:
+                        continue
+                    if ident not in names:
+                        names.update((t.ident, t.name.rsplit("_", 1)[0]) for t in threading.enumerate())
+                    root = [f"[{names.get(ident, 'thread')}]"]
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.counts[";".join(root + stack[::-1])] += 1
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class TurnProfile:
+    """Result of one profiled turn."""
+
+    def __init__(self, label: str, counts: Counter, wall_seconds: float, interval: float):
+        self.label = label
+        self.counts = counts
+        self.wall_seconds = wall_seconds
+        self.interval = interval
+        self.path: Optional[Path] = None
+
+    def hotspots(self, limit: int = 10) -> List[Tuple[str, float]]:
+        return hotspots([self.counts], limit)
+
+
+def should_profile(query_params=None, headers=None) -> bool:
+    """True if profiling is on globally or requested for this request."""
+    if PROFILING["enabled"]:
+        return True
+    if query_params is not None and str(query_params.get(PROFILING["query_param"], "")) in ("1", "true"):
+        return True
+    if headers is not None and str(headers.get(PROFILING["header"], "")) in ("1", "true"):
+        return True
+    return False
+
+
+@contextmanager
+def profile_turn(label: str = "turn", enabled: bool = True):
+    """Profile the current thread, and pool work it submits, for the duration of the block.
+
+    Yields a holder list that contains the TurnProfile once the block exits
+    (empty when profiling is disabled).
+    """
+    holder: List[TurnProfile] = []
+    if not enabled:
+        yield holder
+        return
+    sampler = StackSampler(threading.get_ident())
+    token = _profiled_turn.set(sampler)
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        yield holder
+    finally:
+        sampler.stop()
+        _profiled_turn.reset(token)
+        profile = TurnProfile(label, sampler.counts, time.perf_counter() - start, sampler.interval)
+        try:
+            profile.path = save_profile(profile)
+            log.info("Profile for %s written to %s (%.2fs)", label, profile.path, profile.wall_seconds)
+        except OSError as e:
+            log.warning("Could not write profile: %s", e)
+        holder.append(profile)
+
+
+# ============================================
+# OUTPUT
+# ============================================
+
+def save_profile(profile: TurnProfile) -> Path:
+    out_dir = Path(PROFILING["dir"])
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}_{profile.label}"
+    folded = out_dir / f"{stem}.folded"
+    folded.write_text("".join(f"{stack} {count}\n" for stack, count in profile.counts.most_common()))
+    (out_dir / f"{stem}.svg").write_text(flamegraph_svg(profile.counts, title=f"{profile.label} ({profile.wall_seconds:.2f}s)"))
+    _prune(out_dir)
+    return folded
+
+
+def _prune(out_dir: Path):
+    """Keep only the newest PROFILING['keep_last'] turns on disk."""
+    folded = sorted(out_dir.glob("*.folded"))
+    for old in folded[:-PROFILING["keep_last"]]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".svg").unlink(missing_ok=True)
+
+
+def flamegraph_svg(counts: Counter, title: str = "", width: int = 1200, row_height: int = 16) -> str:
+    """Render folded-stack counts as a standalone SVG flamegraph (root at the bottom)."""
+    tree: Dict = {"n": 0, "children": {}}
+    for stack, count in counts.items():
+        node = tree
+        node["n"] += count
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"n": 0, "children": {}})
+            node["n"] += count
+    total = max(tree["n"], 1)
+
+    def depth(node):
+        return 1 + max((depth(c) for c in node["children"].values()), default=0)
+
+    levels = depth(tree)
+    height = (levels + 1) * row_height
+    rects = []
+
+    def layout(node, x, level):
+        for name, child in sorted(node["children"].items()):
+            w = child["n"] / total * width
+            if w >= 0.5:
+                y = height - (level + 1) * row_height
+                hue = 20 + (hash(name) % 40)
+                label = html.escape(name)
+                pct = child["n"] / total * 100
+                rects.append(
+                    f'<g><title>{label} - {child["n"]} samples ({pct:.1f}%)</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+                    f'<text x="{x + 2:.1f}" y="{y + row_height - 4}" font-size="11" font-family="monospace">'
+                    f'{label[: int(w / 7)]}</text></g>'
+                )
+                layout(child, x, level + 1)
+            x += w
+
+    layout(tree, 0.0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height + row_height}">'
+        f'<text x="4" y="12" font-size="12" font-family="sans-serif">{html.escape(title)} - {total} samples</text>'
+        + "".join(rects) + "</svg>"
+    )
+
+
+# ============================================
+# SUMMARY ACROSS TURNS
+# ============================================
+
+def hotspots(profiles: List[Counter], limit: int = 10) -> List[Tuple[str, float]]:
+    """Functions with the most self time (leaf samples), as (frame, share of samples)."""
+    self_counts: Counter = Counter()
+    total = 0
+    for counts in profiles:
+        for stack, count in counts.items():
+            self_counts[stack.rsplit(";", 1)[-1]] += count
+            total += count
+    return [(frame, count / total) for frame, count in self_counts.most_common(limit)] if total else []
+
+
+def load_recent(n: int = PROFILING["keep_last"]) -> List[Counter]:
+    """Folded-stack counts of the last `n` profiled turns."""
+    out_dir = Path(PROFILING["dir"])
+    profiles = []
+    for path in sorted(out_dir.glob("*.folded"))[-n:]:
+        counts = Counter()
+        for line in path.read_text().splitlines():
+            stack, _, count = line.rpartition(" ")
+            counts[stack] += int(count)
+        profiles.append(counts)
+    return profiles
+
+
+def summary(n: int = PROFILING["keep_last"], limit: int = 15) -> str:
+    profiles = load_recent(n)
+    lines = [f"Top hot spots (self time) across the last {len(profiles)} profiled turns:"]
+    for frame, share in hotspots(profiles, limit):
+        lines.append(f"  {share * 100:5.1f}%  {frame}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(summary(int(sys.argv[1]) if len(sys.argv) > 1 else PROFILING["keep_last"]))
@@ -0,0 +1,83 @@
+"""Compact typed records returned by the agent tools.
+
+Tools return these small dicts instead of pre-formatted prose so the agent
+(and the prediction cache) only handle the facts. Turning a record into
+user-facing text is the job of tools/presentation.py.
+"""
+from datetime import datetime, timezone
+from typing import List, Literal, NotRequired, TypedDict, Union
+
+RiskTier = Literal["HIGH", "MEDIUM", "LOW"]
+
+
+class DecodedVin(TypedDict, total=False):
+    """Attributes decoded from the VIN itself (see tools/vin.py)."""
+    make: str
+    model_year: int
+    country: str
+
+
+class ClaimPrediction(TypedDict):
+    status: Literal["success"]
+    vin: str
+    probability: float      # probability of a warranty claim, 0..1
+    label: bool             # model's predicted has_warranty_claim
+    risk_tier: RiskTier
+    model_version: str
+    scored_at: str          # ISO-8601 UTC timestamp of the ML.PREDICT run
+    decoded: NotRequired[DecodedVin]
+    cached: bool
+
+
+class CostPrediction(TypedDict):
+    status: Literal["success"]
+    vin: str
+    cost_usd: float
+    model_version: str
+    scored_at: str
+    decoded: NotRequired[DecodedVin]
+    cached: bool
+
+
+class FeatureContribution(TypedDict):
+    feature: str            # model input, e.g. "mileage" or "make"
+    value: Union[str, int, float]
+    contribution: float     # log-odds contribution; > 0 raises the claim probability
+
+
+class FeatureAttribution(TypedDict):
+    status: Literal["success"]
+    vin: str
+    probability: float
+    risk_tier: RiskTier
+    model_version: str
+    intercept: float        # log-odds before any feature contribution
+    contributions: List[FeatureContribution]  # largest absolute contribution first
+    decoded: NotRequired[DecodedVin]
+
+
+class ToolError(TypedDict):
+    status: Literal["error", "not_found", "invalid"]
+    vin: str
+    error_message: str
+
+
+ToolResult = Union[ClaimPrediction, CostPrediction, FeatureAttribution, ToolError]
+
+
+def risk_tier(probability: float) -> RiskTier:
+    """Map a claim probability onto the HIGH / MEDIUM / LOW risk tiers."""
+    if probability >= 0.7:
+        return "HIGH"
+    if probability >= 0.4:
+        return "MEDIUM"
+    return "LOW"
+
+
+def utc_now() -> str:
+    """Timestamp used for the `scored_at` freshness field."""
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def error(status: str, vin: str, message: str) -> ToolError:
+    return {"status": status, "vin": vin, "error_message": message}
@@ -0,0 +1,143 @@
+"""Structured, non-blocking logging.
+
+`setup_logging()` installs one QueueHandler on the root logger. Request
+threads only enqueue the LogRecord; a QueueListener thread formats it (JSON
+lines for Cloud Run, readable text locally) and writes it to stdout, so
+DataFrame formatting and stdout I/O never run on the request path.
+
+    log = logging.getLogger(__name__)
+    log.info("Prediction scored", extra={"vin": vin, "probability": p})
+    log.debug("ML.PREDICT result:\\n%s", df)          # formatted only if DEBUG is on
+    log.debug("Row: %s", lazy(lambda: row.to_dict()))  # computed only if emitted
+
+Every record carries the current request id (a contextvar set per chat turn
+with `request_context()`), which also labels the BigQuery jobs of that turn.
+Work handed to thread pools keeps the id when submitted through
+`contextvars.copy_context().run`. DEBUG / INFO records can be sampled
+per request (LOGGING["sample_rates"]) so a sampled request is logged completely.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import LOGGING
+
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+_listener = None
+APP_LOGGERS = ["tools", "agent_host_frontend", "__main__"]  # LOGGING["level"] applies here; libraries log INFO+
+
+
+class lazy:
+    """Defer an expensive log argument until the record is actually formatted."""
+
+    def __init__(self, fn: Callable[[], object]):
+        self.fn = fn
+
+    def __str__(self) -> str:
+        return str(self.fn())
+
+
+def new_request_id() -> str:
+    # BigQuery label values: lowercase letters, digits, "-" and "_" only
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def request_context(rid: Optional[str] = None):
+    """Set the request id for the block (a new one unless given); yields the id."""
+    token = request_id.set(rid or new_request_id())
+    try:
+        yield request_id.get()
+    finally:
+        request_id.reset(token)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps the current request id and drops sampled-out DEBUG / INFO records."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        rate = LOGGING["sample_rates"].get(record.levelname, 1.0)
+        if rate >= 1.0:
+            return True
+        if record.request_id:
+            # Same decision for every record of a request, so sampled requests stay complete
+            return zlib.crc32(record.request_id.encode()) % 10000 < rate * 10000
+        return random.random() < rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records unformatted; the listener thread does all formatting."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, using the field names Cloud Logging understands."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "logger": record.name,
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = str(value) if isinstance(value, lazy) else value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable local format: time level [request] logger: message {extra fields}."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.request_id = getattr(record, "request_id", None) or "-"
+        text = super().format(record)
+        extra = {k: str(v) if isinstance(v, lazy) else v for k, v in vars(record).items() if k not in _STANDARD_ATTRS}
+        return f"{text} {extra}" if extra else text
+
+
+def setup_logging():
+    """Route all logging through the background queue (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if LOGGING["format"] == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    for name in APP_LOGGERS:
+        logging.getLogger(name).setLevel(LOGGING["level"])
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush what is still queued on shutdown
@@ -1,46 +1,227 @@
-import traceback
-import sys
-from tools.bigquery_service import query_bigquery
+import logging
+from tools.bigquery_service import BigQueryUnavailableError, query_bigquery
 from google.cloud import bigquery
 from config import BIGQUERY
-import re
+import json
+import pandas as pd
+from typing import Optional
+from tools.results import ClaimPrediction, CostPrediction, FeatureAttribution, ToolError, error, risk_tier, utc_now
+from tools.prediction_cache import PredictionCache, create_store
+from tools.vin import error_message as vin_error_message, preprocess_vin
+from tools.vin_index import get_vin_index
+from tools.prefetch import take_prefetched
+from tools import model_registry
+from tools.cache_warmer import start_warmer
+from tools.structured_logging import lazy
 
-# Cache for prediction results to prevent duplicate BigQuery calls
-_prediction_cache = {}
+log = logging.getLogger(__name__)
+
+CLAIM_MODEL = "claim_occurrence_model"
+COST_MODEL = "total_cost_model"
+FEATURE_COLUMNS = ["model_year", "make", "vehicle_type", "mileage", "state"]
+
+# Cache for prediction results to prevent duplicate BigQuery calls.
+# The optional shared store lets all instances reuse each other's predictions.
+_cache_store = create_store()
+_prediction_cache = PredictionCache("claim", _cache_store)
+_cost_cache = PredictionCache("cost", _cache_store)
+# Model inputs per VIN, kept from scoring queries so explanations need no extra query
+_feature_cache = PredictionCache("features", _cache_store)
+
+
+def cache_key(logical_model: str, vin: str):
+    """(model version, cache key) for a VIN: predictions are cached per model version."""
+    version = model_registry.resolve(logical_model)
+    return version, f"{version}:{vin}"
+
+
+# Load (or start building) the VIN index at startup so the first request can use it
+get_vin_index()
+# Optional background warming of the prediction caches (CACHE_WARMER_ENABLED)
+start_warmer()
 
 # ============================================
 # WARRANTY PREDICTION TOOL (ML Model)
 # ============================================
 
-def predict_warranty_cost(vin: str) -> str:
-    """Predict warranty claim probability for a specific vehicle VIN using ML model.
-    The response has this format
-Prediction: prediction
-Probability: d.d% chance of warranty claim
-Risk Level: level-of RISK
+def _validate_vin(vin: str):
+    """Normalize, validate and decode a VIN locally, before any warehouse I/O.
 
-Recommendation: recomendation text."""
-    
-    print("predict_warranty_cost called with VIN:", vin)
+    Returns (vin, decoded attributes, None) or (vin, decoded attributes, ToolError).
+    A check digit mismatch is only rejected when the VIN index is loaded: without it
+    a typo cannot be told from a legacy VIN in our data, so the VIN is passed on to
+    the warehouse (with a warning in the log) instead.
+    """
+    row = preprocess_vin(vin)
+    vin = row["vin"]
+    decoded = {
+        "make": row["make"],
+        "model_year": None if pd.isna(row["model_year"]) else int(row["model_year"]),
+        "country": row["country"],
+    }
+    decoded = {k: v for k, v in decoded.items() if v is not None}
+    if row["valid"]:
+        return vin, decoded, None
+    suggestions = []
+    if row["error"] == "check_digit":
+        index = get_vin_index()
+        if index is None:
+            # Without the index we cannot tell a typo from a legacy VIN in our data: let the warehouse decide
+            log.warning("Check digit mismatch, VIN index unavailable", extra={"vin": vin})
+            return vin, decoded, None
+        if index.contains(vin):
+            # VINs already in our data are accepted even if their check digit is off
+            return vin, decoded, None
+        suggestions = index.suggest(vin)
+    log.info("Invalid VIN detected", extra={"vin": vin, "reason": row["error"]})
+    return vin, decoded, error("invalid", vin, vin_error_message(row, suggestions))
 
-    # Validate VIN format (17 alphanumeric characters)
-    vin = vin.strip().upper()
-    if not re.match(r'^[A-HJ-NPR-Z0-9]{17}$', vin):
-        return f"Invalid VIN format. VINs must be exactly 17 alphanumeric characters. You provided: {vin}"
-    
-    # Check cache first
-    if vin in _prediction_cache:
-        print(f"Returning cached prediction for VIN {vin}")
-        return _prediction_cache[vin]
-    
+
+def _not_found(vin: str, suggestions=()) -> ToolError:
+    message = f"No data found for VIN: {vin}. Please verify the VIN is correct and exists in our quality data system."
+    if suggestions:
+        message += f" Did you mean: {', '.join(suggestions)}?"
+    return error("not_found", vin, message)
+
+
+def _lookup_vin_index(vin: str) -> Optional[ToolError]:
+    """Answer "not found" from the local VIN index, without a warehouse job."""
+    index = get_vin_index()
+    if index is None or index.contains(vin):
+        return None  # unknown index state or known VIN -> go to the warehouse
+    log.info("VIN not in local VIN index", extra={"vin": vin})
+    return _not_found(vin, index.suggest(vin))
+
+
+def _prediction_error(tool_name: str, vin: str, e: Exception) -> ToolError:
+    """Log an exception raised while scoring a VIN and map it onto a ToolError."""
+    if isinstance(e, BigQueryUnavailableError):
+        # Circuit breaker is open - fail fast without the full diagnostic dump
+        log.warning("%s rejected: %s", tool_name, e, extra={"vin": vin})
+        return error("error", vin, f"ERROR: {e}")
+
+    # Full diagnostics; the traceback is formatted by the logging thread, not here
+    log.error("%s failed: %s: %s", tool_name, type(e).__name__, e, exc_info=e,
+              extra={"vin": vin, "tool": tool_name, "exception_args": lazy(lambda: e.args)})
+    error_msg = str(e)
+    if isinstance(e, TimeoutError):
+        return error("error", vin, "ERROR: The prediction service is responding slowly and the request timed out. Please try again shortly.")
+    elif "403" in error_msg or "permission" in error_msg.lower():
+        return error("error", vin, "ERROR: Cannot access ML model. Check your BigQuery permissions and verify the model exists.")
+    elif "404" in error_msg or "not found" in error_msg.lower():
+        return error("error", vin, f"ERROR: ML model or training data table not found. Please verify the model exists. Error: {error_msg}")
+    else:
+        return error("error", vin, f"Prediction failed: {error_msg}")
+
+
+def _claim_record(vin: str, row: pd.Series, version: str) -> ClaimPrediction:
+    """Compact record from one row of claim model ML.PREDICT output."""
+    # Extract the probability of the TRUE label
+    prob_claim = None
+    for prob_entry in row['predicted_has_warranty_claim_probs']:
+        if prob_entry['label'] == True:
+            prob_claim = prob_entry['prob']
+
+    return {
+        "status": "success",
+        "vin": vin,
+        "probability": round(float(prob_claim), 4),
+        "label": bool(row['predicted_has_warranty_claim']),
+        "risk_tier": risk_tier(prob_claim),
+        "model_version": version,
+        "scored_at": utc_now(),
+        "cached": False,
+    }
+
+
+def _cost_record(vin: str, row: pd.Series, version: str) -> CostPrediction:
+    """Compact record from one row of cost model ML.PREDICT output."""
+    return {
+        "status": "success",
+        "vin": vin,
+        "cost_usd": round(float(row['predicted_cost_usd']), 2),
+        "model_version": version,
+        "scored_at": utc_now(),
+        "cached": False,
+    }
+
+
+def _remember_features(df: pd.DataFrame):
+    """Cache the model inputs returned alongside predictions (for explain_warranty_risk)."""
+    if df.empty or not set(FEATURE_COLUMNS) <= set(df.columns):
+        return
+    for record in json.loads(df[["vin"] + FEATURE_COLUMNS].to_json(orient="records")):
+        _feature_cache.put(record.pop("vin"), record)
+
+
+def _vehicle_features(vins: list[str]) -> pd.DataFrame:
+    """Model inputs for `vins` (unknown VINs are left out): from the cache, else one query for the rest."""
+    rows, missing = [], []
+    for vin in vins:
+        entry = _feature_cache.peek(vin)
+        if entry is None:
+            missing.append(vin)
+        elif entry[0] is not None:
+            rows.append({"vin": vin, **entry[0]})
+    if missing:
+        vin_list = ", ".join(f"'{vin}'" for vin in missing)
+        df = query_bigquery(f"""
+            SELECT vin, {', '.join(FEATURE_COLUMNS)}
+            FROM `{BIGQUERY['project']}.warranty_data.training_data` WHERE vin IN ({vin_list})
+        """)
+        _remember_features(df)
+        found = set(df["vin"])
+        for vin in missing:
+            if vin not in found:
+                _feature_cache.put(vin, None)
+        rows += json.loads(df[["vin"] + FEATURE_COLUMNS].to_json(orient="records"))
+    return pd.DataFrame(rows, columns=["vin"] + FEATURE_COLUMNS)
+
+
+def _same(decoded_value, feature_value) -> bool:
+    if isinstance(decoded_value, int):
+        try:
+            return int(feature_value) == decoded_value
+        except (TypeError, ValueError):
+            return False
+    return str(feature_value).strip().lower() == str(decoded_value).lower()
+
+
+def _agreeing_decoded(vin: str, decoded: dict, features: Optional[dict] = None) -> dict:
+    """Decoded VIN attributes without those contradicting the model inputs.
+
+    The warehouse features are what the models scored; a make / model year decoded
+    from the WMI and position 10 that disagrees with them would only confuse the
+    card, so it is dropped. `features` defaults to the cached model inputs (kept
+    from the scoring query); with none cached the decoded attributes are kept.
+    """
+    if features is None:
+        entry = _feature_cache.peek(vin)
+        features = entry[0] if entry else None
+    if not features:
+        return decoded
+    conflicts = [k for k in ("make", "model_year")
+                 if k in decoded and features.get(k) is not None and not _same(decoded[k], features[k])]
+    if conflicts:
+        log.info("Decoded VIN attributes disagree with model inputs",
+                 extra={"vin": vin, "fields": conflicts, "decoded": decoded})
+    return {k: v for k, v in decoded.items() if k not in conflicts}
+
+
+def _score_claim(vin: str, version: str, background: bool = False) -> Optional[ClaimPrediction]:
+    """Run ML.PREDICT on claim model `version` for one VIN. Returns None if the VIN is unknown.
+
+    background=True for shadow scoring (see query_bigquery).
+    """
     # Build the ML prediction query
     query = f"""
     SELECT
       vin,
       predicted_has_warranty_claim,
-      predicted_has_warranty_claim_probs
+      predicted_has_warranty_claim_probs,
+      model_year, make, vehicle_type, mileage, state
     FROM
-        ML.PREDICT(MODEL `{BIGQUERY['project']}.warranty_models.claim_occurrence_model`,
+        ML.PREDICT(MODEL `{BIGQUERY['project']}.warranty_models.{version}`,
         (
         SELECT
           *
@@ -52,114 +233,35 @@ Recommendation: recomendation text."""
       )
     """
     
-    try:
-        df = query_bigquery(query)
-        print("predict_warranty_cost executed query")
-        print(df)
-        if df.empty:
-            print("predict_warranty_cost query returned no data")
-            return f"No data found for VIN: {vin}. Please verify the VIN is correct and exists in our quality data system."
-        
-        print(f"predict_warranty_cost Query executed. Rows returned: {len(df)}")
-
-        # Extract prediction results
-        row = df.iloc[0]
-        print("predict_warranty_cost Retrieved row:", row.to_dict())
-
-        predicted_claim = row['predicted_has_warranty_claim']
-        probs = row['predicted_has_warranty_claim_probs']
-        
-        # Parse probability (it's typically a struct/list with [prob_no_claim, prob_claim])
-        # Assuming the second value is probability of having a claim
-        # if isinstance(probs, (list, tuple)) and len(probs) >= 2:
-        #     prob_claim = float(probs[1]['prob']) if isinstance(probs[1], dict) else float(probs[1])
-        # else:
-        #     prob_claim = 0.5  # Fallback
-        probs = row['predicted_has_warranty_claim_probs']
-
-        # Extract probabilities
-        prob_claim = None
-        prob_false = None
-
-        for prob_entry in probs:
-            if prob_entry['label'] == True:
-                prob_claim = prob_entry['prob']
-            elif prob_entry['label'] == False:
-                prob_false = prob_entry['prob']
-        
-        print(f"Prediction for VIN {vin}: {predicted_claim} with probability {prob_claim}")
-        # Determine risk level
-        if prob_claim >= 0.7:
-            risk_level = "HIGH RISK"
-            recommendation = "This vehicle has a high likelihood of warranty claims. Recommend thorough quality inspection and proactive maintenance planning."
-        elif prob_claim >= 0.4:
-            risk_level = "MEDIUM RISK"
-            recommendation = "This vehicle shows moderate warranty risk. Standard quality checks recommended."
-        else:
-            risk_level = "LOW RISK"
-            recommendation = "This vehicle has a low probability of warranty claims. Routine quality process should be sufficient."
-        
-        # Format response
-        response = f"""
-Warranty Prediction for VIN: {vin}
-
-Prediction: {"Will likely have warranty claim" if predicted_claim == 1 else "Unlikely to have warranty claim"}
-Probability: {prob_claim*100:.1f}% chance of warranty claim
-Risk Level: {risk_level}
-
-Recommendation: {recommendation}
-"""
-        print(f"Generated prediction response for VIN {vin}")
-        print (response)
-        
-        # Cache the result
-        _prediction_cache[vin] = response.strip()
-        
-        return response.strip()
-    
-    except Exception as e:
-        # Print comprehensive error information
-        print("=" * 80)
-        print("EXCEPTION CAUGHT IN predict_warranty_cost")
-        print("=" * 80)
-        print(f"Exception Type: {type(e).__name__}")
-        print(f"Exception Message: {str(e)}")
-        print(f"Exception Args: {e.args}")
-        print("\nFull Traceback:")
-        print("-" * 80)
-        traceback.print_exc(file=sys.stdout)
-        print("-" * 80)
-        print(f"VIN that caused error: {vin}")
-        print("=" * 80)
-        error_msg = str(e)
-        if "403" in error_msg or "permission" in error_msg.lower():
-            return "ERROR: Cannot access ML model. Check your BigQuery permissions and verify the model exists."
-        elif "404" in error_msg or "not found" in error_msg.lower():
-            return f"ERROR: ML model or training data table not found. Please verify the model exists. Error: {error_msg}"
-        else:
-            return f"Prediction failed: {error_msg}"
-
-
-def predict_warranty_total_cost(vin: str) -> str:
-    """Predict warranty claim total cost for a specific vehicle VIN using ML model.
-    The response has this format
-    Total cost: AMOUNT USD
-    """
-    
-    print("predict_warranty_total_cost called with VIN:", vin)
+    with model_registry.timed(version):
+        df = query_bigquery(query, background=background)
+    _remember_features(df)
+    log.debug("Claim ML.PREDICT result:\n%s", df)
+    if df.empty:
+        log.info("Claim model returned no data", extra={"vin": vin, "model_version": version})
+        return None
 
-    # Validate VIN format (17 alphanumeric characters)
-    vin = vin.strip().upper()
-    if not re.match(r'^[A-HJ-NPR-Z0-9]{17}$', vin):
-        print("Invalid VIN format detected")
-        return f"Invalid VIN format. VINs must be exactly 17 alphanumeric characters. You provided: {vin}"
+    # Extract prediction results
+    row = df.iloc[0]
+    log.debug("Claim prediction row: %s", lazy(row.to_dict))
 
+    result = _claim_record(vin, row, version)
+    log.info("Claim prediction scored", extra={"vin": vin, "model_version": version,
+                                               "probability": result["probability"], "risk_tier": result["risk_tier"]})
+    return result
+
+
+def _score_cost(vin: str, version: str, background: bool = False) -> Optional[CostPrediction]:
+    """Run ML.PREDICT on cost model `version` for one VIN. Returns None if the VIN is unknown.
+
+    background=True for shadow scoring (see query_bigquery).
+    """
     query = f"""
         SELECT
         vin,
         predicted_total_claim_cost AS predicted_cost_usd
         FROM
-        ML.PREDICT(MODEL `{BIGQUERY['project']}.warranty_models.total_cost_model`, (
+        ML.PREDICT(MODEL `{BIGQUERY['project']}.warranty_models.{version}`, (
             -- This subquery provides the features for prediction
             -- Get features from main training_data table (not just vehicles with claims)
             SELECT model_year, make, vehicle_type, mileage, state, total_claim_cost, vin
@@ -167,49 +269,176 @@ def predict_warranty_total_cost(vin: str) -> str:
         ))
     """
     
+    with model_registry.timed(version):
+        df = query_bigquery(query, background=background)
+    log.debug("Cost ML.PREDICT result:\n%s", df)
+    if df.empty:
+        log.info("Cost model returned no data", extra={"vin": vin, "model_version": version})
+        return None
+
+    # Extract prediction results
+    row = df.iloc[0]
+    log.debug("Cost prediction row: %s", lazy(row.to_dict))
+
+    result = _cost_record(vin, row, version)
+    log.info("Cost prediction scored", extra={"vin": vin, "model_version": version, "cost_usd": result["cost_usd"]})
+    return result
+
+
+def _score_claims_bulk(vins: list[str], version: str) -> dict:
+    """Set-based ML.PREDICT for many (validated) VINs in one query: {vin: ClaimPrediction}."""
+    vin_list = ", ".join(f"'{vin}'" for vin in vins)
+    query = f"""
+    SELECT vin, predicted_has_warranty_claim, predicted_has_warranty_claim_probs, {', '.join(FEATURE_COLUMNS)}
+    FROM ML.PREDICT(MODEL `{BIGQUERY['project']}.warranty_models.{version}`, (
+        SELECT * FROM `{BIGQUERY['project']}.warranty_data.training_data` WHERE vin IN ({vin_list})
+    ))
+    """
+    with model_registry.timed(version):
+        df = query_bigquery(query, fast=False, hedge=False, timeout=BIGQUERY["bulk_timeout_seconds"])
+    _remember_features(df)
+    return {row['vin']: _claim_record(row['vin'], row, version) for _, row in df.iterrows()}
+
+
+def _score_costs_bulk(vins: list[str], version: str) -> dict:
+    """Set-based ML.PREDICT for many (validated) VINs in one query: {vin: CostPrediction}."""
+    vin_list = ", ".join(f"'{vin}'" for vin in vins)
+    query = f"""
+    SELECT vin, predicted_total_claim_cost AS predicted_cost_usd
+    FROM ML.PREDICT(MODEL `{BIGQUERY['project']}.warranty_models.{version}`, (
+        SELECT model_year, make, vehicle_type, mileage, state, total_claim_cost, vin
+        FROM `{BIGQUERY['project']}.warranty_data.training_data` WHERE vin IN ({vin_list})
+    ))
+    """
+    with model_registry.timed(version):
+        df = query_bigquery(query, fast=False, hedge=False, timeout=BIGQUERY["bulk_timeout_seconds"])
+    return {row['vin']: _cost_record(row['vin'], row, version) for _, row in df.iterrows()}
+
+
+def predict_warranty_cost(vin: str) -> dict:
+    """Predict warranty claim probability for a specific vehicle VIN using ML model.
+
+    Returns a compact record:
+    {"status": "success", "vin": str, "probability": float (0-1), "label": bool,
+     "risk_tier": "HIGH" | "MEDIUM" | "LOW", "model_version": str, "scored_at": ISO timestamp, "cached": bool}
+    or {"status": "error" | "not_found" | "invalid", "vin": str, "error_message": str}.
+    """
+    
+    log.info("predict_warranty_cost called", extra={"vin": vin})
+
+    # Validate VIN format and check digit, decode make / model year
+    vin, decoded, invalid = _validate_vin(vin)
+    if invalid:
+        return invalid
+
+    missing = _lookup_vin_index(vin)
+    if missing:
+        return missing
+    
+    # A speculative prefetch may already be running for this VIN; the cache lock lets us join it
+    take_prefetched("claim", vin)
+    version, key = cache_key(CLAIM_MODEL, vin)
+    try:
+        # Cached (in-process or shared) result, or a single ML.PREDICT run shared by concurrent callers
+        result, cached = _prediction_cache.get_or_compute(key, lambda: _score_claim(vin, version))
+    except Exception as e:
+        return _prediction_error("predict_warranty_cost", vin, e)
+
+    if result is None:
+        return _not_found(vin)
+    # Off the critical path: compare a sample of requests against a candidate model version
+    model_registry.maybe_shadow(CLAIM_MODEL, vin, result, _score_claim, "probability")
+    if cached:
+        log.info("Returning cached prediction", extra={"vin": vin})
+    return {**result, "decoded": _agreeing_decoded(vin, decoded), "cached": cached}
+
+
+def predict_warranty_total_cost(vin: str) -> dict:
+    """Predict warranty claim total cost for a specific vehicle VIN using ML model.
+
+    Returns a compact record:
+    {"status": "success", "vin": str, "cost_usd": float, "model_version": str, "scored_at": ISO timestamp, "cached": bool}
+    or {"status": "error" | "not_found" | "invalid", "vin": str, "error_message": str}.
+    """
+    
+    log.info("predict_warranty_total_cost called", extra={"vin": vin})
+
+    # Validate VIN format and check digit, decode make / model year
+    vin, decoded, invalid = _validate_vin(vin)
+    if invalid:
+        return invalid
+
+    missing = _lookup_vin_index(vin)
+    if missing:
+        return missing
+
+    take_prefetched("cost", vin)
+    version, key = cache_key(COST_MODEL, vin)
     try:
-        df = query_bigquery(query)
-        print("predict_warranty_total_cost executed query")
-        print(df)
-        if df.empty:
-            print("predict_warranty_total_cost query returned no data")
-            return f"No data found for VIN: {vin}. Please verify the VIN is correct and exists in our quality data system."
-        
-        print(f"predict_warranty_total_cost Query executed. Rows returned: {len(df)}")
-
-        # Extract prediction results
-        row = df.iloc[0]
-        print("predict_warranty_total_cost Retrieved row:", row.to_dict())
-
-        predicted_cost = row['predicted_cost_usd']
-        
-        print(f"Total Cost Prediction for VIN {vin}: ${predicted_cost:.2f} USD")
-        
-        # Format response
-        response = f"""
-        Total cost: ${predicted_cost:.2f} USD
-        """
-        print (response)
-        return response.strip()
+        result, cached = _cost_cache.get_or_compute(key, lambda: _score_cost(vin, version))
+    except Exception as e:
+        return _prediction_error("predict_warranty_total_cost", vin, e)
+
+    if result is None:
+        return _not_found(vin)
+    model_registry.maybe_shadow(COST_MODEL, vin, result, _score_cost, "cost_usd")
+    return {**result, "decoded": _agreeing_decoded(vin, decoded), "cached": cached}
 
+
+def explain_warranty_risk(vin: str) -> dict:
+    """Explain why a vehicle VIN has its warranty claim risk: which features push the probability up or down.
+
+    Returns a compact record:
+    {"status": "success", "vin": str, "probability": float (0-1), "risk_tier": "HIGH" | "MEDIUM" | "LOW",
+     "model_version": str, "intercept": float,
+     "contributions": [{"feature": str, "value": str | number, "contribution": float}, ...]}
+    with contributions in log-odds, largest first (positive = raises the risk),
+    or {"status": "error" | "not_found" | "invalid", "vin": str, "error_message": str}.
+    """
+    from tools.explain import explain, get_weights
+
+    log.info("explain_warranty_risk called", extra={"vin": vin})
+
+    vin, decoded, invalid = _validate_vin(vin)
+    if invalid:
+        return invalid
+
+    missing = _lookup_vin_index(vin)
+    if missing:
+        return missing
+
+    version = model_registry.resolve(CLAIM_MODEL)
+    try:
+        # Cached ML.WEIGHTS / ML.FEATURE_INFO and cached model inputs: normally no warehouse I/O at all
+        weights = get_weights(version)
+        features = _vehicle_features([vin])
     except Exception as e:
-        # Print comprehensive error information
-        print("=" * 80)
-        print("EXCEPTION CAUGHT IN predict_warranty_total_cost")
-        print("=" * 80)
-        print(f"Exception Type: {type(e).__name__}")
-        print(f"Exception Message: {str(e)}")
-        print(f"Exception Args: {e.args}")
-        print("\nFull Traceback:")
-        print("-" * 80)
-        traceback.print_exc(file=sys.stdout)
-        print("-" * 80)
-        print(f"VIN that caused error: {vin}")
-        print("=" * 80)
-        error_msg = str(e)
-        if "403" in error_msg or "permission" in error_msg.lower():
-            return "ERROR: Cannot access ML model. Check your BigQuery permissions and verify the model exists."
-        elif "404" in error_msg or "not found" in error_msg.lower():
-            return f"ERROR: ML model or training data table not found. Please verify the model exists. Error: {error_msg}"
-        else:
-            return f"Prediction failed: {error_msg}"
\ No newline at end of file
+        return _prediction_error("explain_warranty_risk", vin, e)
+
+    if features.empty:
+        return _not_found(vin)
+    explanation = explain(weights, features)[0]
+    result: FeatureAttribution = {
+        "status": "success",
+        **explanation,
+        "risk_tier": risk_tier(explanation["probability"]),
+        "model_version": version,
+        "decoded": _agreeing_decoded(vin, decoded, features.iloc[0].to_dict()),
+    }
+    return result
+
+
+def predict_warranty_batch(vins: list[str]) -> dict:
+    """Predict warranty claim probability and total cost for several VINs at once.
+
+    Use this instead of calling the single-VIN tools repeatedly when the user gives more than one VIN.
+    Returns {"status": "success" | "error", "count": int, "failed": int, "skipped": int,
+             "results": [{"vin", "status", "risk_tier", "probability", "cost_usd", "error"}, ...]}
+    sorted by claim probability (highest first). One failing VIN does not fail the batch.
+    "skipped" VINs were over the per-request limit and not scored; tell the user.
+    """
+    from tools.batch import batch_record, iter_batch_predictions, limit_vins
+
+    log.info("predict_warranty_batch called", extra={"vin_count": len(vins)})
+    kept, skipped = limit_vins(vins)
+    return batch_record(list(iter_batch_predictions(kept)), skipped)
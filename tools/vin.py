@@ -0,0 +1,148 @@
+"""VIN preprocessing: normalization, check-digit verification and decoding.
+
+Runs entirely in-process and vectorized over batches, so malformed VINs are
+rejected before any warehouse I/O and the decoded attributes (make, country,
+model year) are available to the tools without an extra lookup.
+
+Check digit: position 9, computed as in ISO 3779 / 49 CFR 565 - transliterate
+each character, weight by position, sum mod 11 (10 is written as 'X').
+"""
+import datetime
+import re
+import sys
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import VIN_VALIDATION
+
+VIN_LENGTH = 17
+
+# 17-character tokens in free text that could be VINs (validated separately)
+VIN_CANDIDATE = re.compile(r"\b[A-Z0-9]{17}\b", re.IGNORECASE)
+
+_TRANSLITERATION = {
+    **{str(d): d for d in range(10)},
+    "A": 1, "B": 2, "C": 3, "D": 4, "E": 5, "F": 6, "G": 7, "H": 8,
+    "J": 1, "K": 2, "L": 3, "M": 4, "N": 5, "P": 7, "R": 9,
+    "S": 2, "T": 3, "U": 4, "V": 5, "W": 6, "X": 7, "Y": 8, "Z": 9,
+}
+_WEIGHTS = np.array([8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int64)
+
+# Byte lookup tables: transliterated value and "allowed character" flag
+_VALUES = np.zeros(256, dtype=np.int64)
+_ALLOWED = np.zeros(256, dtype=bool)
+for _ch, _val in _TRANSLITERATION.items():
+    _VALUES[ord(_ch)] = _val
+    _ALLOWED[ord(_ch)] = True
+
+# Characters people type by mistake: I/O/Q are never valid in a VIN
+_CONFUSABLES = str.maketrans({"I": "1", "O": "0", "Q": "0", "-": None, " ": None})
+
+# Model year code (position 10), repeating every 30 years from 1980
+_YEAR_CODES = "ABCDEFGHJKLMNPRSTVWXY123456789"
+_YEAR_OFFSET = np.full(256, -1, dtype=np.int64)
+for _i, _ch in enumerate(_YEAR_CODES):
+    _YEAR_OFFSET[ord(_ch)] = _i
+
+# World Manufacturer Identifiers (positions 1-3) for the makes in our data
+WMI_MAKES = {
+    "1HG": "Honda", "2HG": "Honda", "JHM": "Honda", "5FN": "Honda", "5J6": "Honda", "19X": "Honda",
+    "4T1": "Toyota", "4T3": "Toyota", "5TD": "Toyota", "5TF": "Toyota", "JT2": "Toyota", "JTD": "Toyota", "2T1": "Toyota",
+    "1FA": "Ford", "1FM": "Ford", "1FT": "Ford", "1FD": "Ford", "3FA": "Ford", "WF0": "Ford",
+    "1G1": "Chevrolet", "1GC": "Chevrolet", "1GN": "Chevrolet", "2G1": "Chevrolet", "3GN": "Chevrolet", "KL7": "Chevrolet",
+    "WBA": "BMW", "WBS": "BMW", "WBX": "BMW", "5UX": "BMW", "4US": "BMW",
+}
+
+_COUNTRIES = [
+    ("12345", "United States"), ("2", "Canada"), ("3", "Mexico"), ("J", "Japan"), ("K", "South Korea"),
+    ("L", "China"), ("S", "United Kingdom"), ("W", "Germany"), ("VZ", "Europe"), ("Y", "Sweden/Finland"),
+    ("9", "Brazil"),
+]
+COUNTRY_BY_PREFIX = {ch: country for prefixes, country in _COUNTRIES for ch in prefixes}
+
+
+def normalize_vin(vin: str) -> str:
+    """Upper-case, drop separators and map I/O/Q onto the digits they are usually mistaken for."""
+    vin = str(vin).strip().upper().translate(_CONFUSABLES)
+    return vin.encode("ascii", "replace").decode("ascii")  # non-ASCII input becomes '?', which fails validation
+
+
+def find_vin_candidates(text: str) -> List[str]:
+    """De-duplicated, normalized VIN-like tokens in free text, in order of appearance."""
+    return list(dict.fromkeys(normalize_vin(m.group(0)) for m in VIN_CANDIDATE.finditer(text or "")))
+
+
+def compute_check_digits(vins: Iterable[str]) -> np.ndarray:
+    """Expected position-9 check digit for each VIN (vectorized)."""
+    codes = np.frombuffer(np.asarray(list(vins), dtype=f"S{VIN_LENGTH}").tobytes(), dtype=np.uint8)
+    codes = codes.reshape(-1, VIN_LENGTH)
+    remainder = (_VALUES[codes] @ _WEIGHTS) % 11
+    return np.where(remainder == 10, "X", remainder.astype(str))
+
+
+def preprocess_vins(vins: Iterable[str]) -> pd.DataFrame:
+    """Normalize, validate and decode a batch of VINs.
+
+    Returns one row per input VIN with columns:
+    vin, valid, error, check_digit_ok, wmi, make, country, model_year.
+    `valid` only considers the check digit when VIN_VALIDATION["check_digit"] is "strict".
+    """
+    normalized = [normalize_vin(v) for v in vins]
+    n = len(normalized)
+    lengths = np.fromiter((len(v) for v in normalized), dtype=np.int64, count=n)
+    codes = np.frombuffer(np.asarray(normalized, dtype=f"S{VIN_LENGTH}").tobytes(), dtype=np.uint8)
+    codes = codes.reshape(-1, VIN_LENGTH)
+
+    well_formed = (lengths == VIN_LENGTH) & _ALLOWED[codes].all(axis=1)
+
+    remainder = (_VALUES[codes] @ _WEIGHTS) % 11
+    expected = np.where(remainder == 10, ord("X"), ord("0") + remainder)
+    check_ok = well_formed & (codes[:, 8] == expected)
+
+    # Model year: position 10 gives the year within a 30-year cycle; a letter
+    # in position 7 marks the 2010+ cycle for passenger vehicles (49 CFR 565).
+    offset = _YEAR_OFFSET[codes[:, 9]]
+    second_cycle = (codes[:, 6] >= ord("A")) & (codes[:, 6] <= ord("Z"))
+    model_year = np.where(offset >= 0, 1980 + offset + 30 * second_cycle, -1)
+    model_year = np.where(model_year > datetime.date.today().year + 1, model_year - 30, model_year)
+
+    errors = np.where(
+        ~well_formed, "format",
+        np.where(~check_ok, "check_digit", ""),
+    )
+    valid = well_formed & (check_ok | (VIN_VALIDATION["check_digit"] != "strict"))
+
+    wmi = [v[:3] for v in normalized]
+    return pd.DataFrame({
+        "vin": normalized,
+        "valid": valid,
+        "error": errors,
+        "check_digit_ok": check_ok,
+        "wmi": wmi,
+        "make": [WMI_MAKES.get(w) for w in wmi],
+        "country": [COUNTRY_BY_PREFIX.get(w[:1]) for w in wmi],
+        "model_year": pd.Series(model_year).where(well_formed & (model_year > 0)).astype("Int64"),
+    })
+
+
+def preprocess_vin(vin: str) -> dict:
+    """Single-VIN convenience wrapper around preprocess_vins()."""
+    return preprocess_vins([vin]).iloc[0].to_dict()
+
+
+def error_message(row: dict, suggestions: Iterable[str] = ()) -> str:
+    """User-facing explanation for a VIN rejected by preprocess_vins(), with optional known look-alikes."""
+    vin = row["vin"]
+    if row["error"] == "format":
+        return (f"Invalid VIN format. VINs must be exactly 17 characters (letters except I, O, Q and digits). "
+                f"You provided: {vin}")
+    expected = compute_check_digits([vin])[0]
+    message = (f"Invalid VIN: check digit (9th character) is '{vin[8]}' but should be '{expected}' for this VIN, "
+               f"so at least one character is mistyped. You provided: {vin}")
+    if suggestions:
+        message += f". Did you mean: {', '.join(suggestions)}?"
+    return message
@@ -0,0 +1,146 @@
+"""Local VIN membership index.
+
+A sorted array of fixed-width VIN bytes (17 bytes per VIN) rebuilt from
+`warranty_data.training_data`. Lookups are a binary search, so unknown VINs
+get a "not found" answer in microseconds without a warehouse job, together
+with near-miss suggestions (one substituted character or two swapped
+neighbours - the usual typos).
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import BIGQUERY, VIN_INDEX
+
+log = logging.getLogger(__name__)
+
+VIN_ALPHABET = "0123456789ABCDEFGHJKLMNPRSTUVWXYZ"  # I, O and Q are never used in VINs
+
+
+class VinIndex:
+    """Sorted, deduplicated array of VINs with vectorized membership tests."""
+
+    def __init__(self, vins: Iterable[str], built_at: Optional[float] = None):
+        arr = np.asarray([v.strip().upper() for v in vins], dtype="S17")
+        self.vins = np.unique(arr)  # sorted + deduplicated
+        self.built_at = built_at or time.time()
+
+    def __len__(self) -> int:
+        return len(self.vins)
+
+    def contains_many(self, vins: Iterable[str]) -> np.ndarray:
+        """Boolean mask: which of `vins` exist in the index."""
+        needles = np.asarray(list(vins), dtype="S17")
+        if len(self.vins) == 0 or len(needles) == 0:
+            return np.zeros(len(needles), dtype=bool)
+        pos = np.searchsorted(self.vins, needles)
+        pos[pos == len(self.vins)] = 0
+        return self.vins[pos] == needles
+
+    def contains(self, vin: str) -> bool:
+        return bool(self.contains_many([vin])[0])
+
+    def suggest(self, vin: str, limit: int = 3) -> List[str]:
+        """Known VINs one substitution or one adjacent transposition away from `vin`."""
+        vin = vin.strip().upper()
+        if len(vin) != 17:
+            return []
+        candidates = []
+        for i in range(17):
+            for ch in VIN_ALPHABET:
+                if ch != vin[i]:
+                    candidates.append(vin[:i] + ch + vin[i + 1:])
+        for i in range(16):
+            if vin[i] != vin[i + 1]:
+                candidates.append(vin[:i] + vin[i + 1] + vin[i] + vin[i + 2:])
+        mask = self.contains_many(candidates)
+        return [c for c, hit in zip(candidates, mask) if hit][:limit]
+
+    # ---- persistence ----------------------------------------------------
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp, self.vins)
+        os.replace(tmp, path)  # atomic, so other workers never read a half-written file
+
+    @classmethod
+    def load(cls, path: str) -> "VinIndex":
+        index = cls([])
+        index.vins = np.load(path)
+        index.built_at = os.path.getmtime(path)
+        return index
+
+
+def build_from_warehouse() -> VinIndex:
+    """Rebuild the index from the training table (one cheap full-column scan)."""
+    from tools.bigquery_service import query_bigquery
+
+    query = f"""
+    SELECT DISTINCT vin
+    FROM `{BIGQUERY['project']}.warranty_data.training_data`
+    """
+    # Full-column scan: a regular job with the bulk timeout, not the short-query fast path
+    df = query_bigquery(query, fast=False, hedge=False, timeout=BIGQUERY["bulk_timeout_seconds"])
+    index = VinIndex(df["vin"].astype(str))
+    log.info("Built VIN index", extra={"vin_count": len(index)})
+    return index
+
+
+_index = None
+_rebuilding = threading.Lock()
+_last_rebuild_attempt = 0.0
+
+
+def _rebuild():
+    if not _rebuilding.acquire(blocking=False):
+        return  # a rebuild is already running
+    global _index
+    try:
+        index = build_from_warehouse()
+        index.save(VIN_INDEX["path"])
+        _index = index
+    except Exception as e:
+        log.warning("VIN index rebuild failed: %s: %s", type(e).__name__, e)
+    finally:
+        _rebuilding.release()
+
+
+def get_vin_index() -> Optional[VinIndex]:
+    """The current index, or None while it is unavailable.
+
+    Loads the on-disk copy (picking up rebuilds written by other workers) and
+    refreshes it in a background thread once it is older than
+    VIN_INDEX["max_age_seconds"]. Callers treat None as "unknown" and fall
+    through to the warehouse.
+    """
+    global _index, _last_rebuild_attempt
+    if not VIN_INDEX["enabled"]:
+        return None
+    path = VIN_INDEX["path"]
+    try:
+        if os.path.exists(path) and (_index is None or os.path.getmtime(path) > _index.built_at):
+            _index = VinIndex.load(path)
+    except Exception as e:
+        log.warning("Could not load VIN index from %s: %s", path, e)
+    now = time.time()
+    stale = _index is None or now - _index.built_at > VIN_INDEX["max_age_seconds"]
+    if stale and not _rebuilding.locked() and now - _last_rebuild_attempt > VIN_INDEX["retry_seconds"]:
+        _last_rebuild_attempt = now
+        threading.Thread(target=_rebuild, name="vin-index-rebuild", daemon=True).start()
+    return _index
+
+
+if __name__ == "__main__":
+    # Rebuild the index on demand: python tools/vin_index.py
+    from tools.structured_logging import setup_logging
+
+    setup_logging()
+    _rebuild()